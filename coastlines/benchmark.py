@@ -0,0 +1,588 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# This code benchmarks the DEA Coastlines raster generation functions
+# without requiring a datacube database or network access:
+#
+#     * Generate a synthetic, Dask-backed stack of Landsat-like MNDWI,
+#       Fmask-style cloud mask and tide height data, with a moving
+#       shoreline, clouds, cloud shadows, nodata stripes and a tide cycle
+#     * Time and measure the peak memory use of each stage of the
+#       raster workflow on this synthetic stack
+#     * Optionally compare results against a previous benchmark run to
+#       catch performance regressions
+
+
+import gc
+import sys
+import time
+import tempfile
+import tracemalloc
+
+import click
+import dask
+import numpy as np
+import pandas as pd
+import xarray as xr
+import odc.geo.xr
+from odc.geo.geobox import GeoBox
+
+from coastlines.raster import (
+    apply_cloud_mask,
+    export_annual_gapfill,
+    export_annual_gapfill_blocked,
+    load_tidal_subset,
+    tidal_composite,
+    tide_cutoffs,
+    tide_mask,
+)
+from coastlines.utils import configure_logging
+
+# Fmask-style cloud mask classes used by the synthetic data
+CLOUD_MASK_FLAGS = {
+    "fmask": {
+        "bits": [0, 1, 2, 3, 4, 5, 6, 7],
+        "values": {
+            "0": "nodata",
+            "1": "valid",
+            "2": "cloud",
+            "3": "shadow",
+            "4": "snow",
+            "5": "water",
+        },
+    }
+}
+
+
+def _synthetic_tides(times, x, y, extent, tide_range=2.0):
+    """
+    Model synthetic tide heights (in metres) for a set of times and
+    coordinates, using a semi-diurnal tide modulated by a spring-neap
+    cycle, with tide phase varying smoothly across the study area.
+    """
+
+    hours = (times - np.datetime64("2000-01-01")) / np.timedelta64(1, "h")
+    hours = hours.reshape(-1, 1, 1)
+    x_frac = (x - extent.left) / (extent.right - extent.left)
+    y_frac = (y - extent.bottom) / (extent.top - extent.bottom)
+    phase = 0.8 * x_frac + 0.3 * y_frac
+    spring_neap = 1 + 0.3 * np.sin(2 * np.pi * hours / (14.77 * 24))
+    tides = 0.5 * tide_range * spring_neap * np.sin(2 * np.pi * hours / 12.42 + phase)
+
+    return tides.astype("float32")
+
+
+def _synthetic_block(
+    variable, times, x, y, extent, years, seed, tide_range, block_info=None
+):
+    """
+    Generate a single (time, y, x) block of a synthetic variable. All
+    variables are generated from the same deterministic fields, so
+    each block is consistent across variables.
+    """
+
+    (t0, t1), (y0, y1), (x0, x1) = block_info[None]["array-location"]
+    first_year = years.min()
+    times, years = times[t0:t1], years[t0:t1]
+    xx, yy = np.meshgrid(x[x0:x1], y[y0:y1])
+    rows, cols = np.mgrid[y0:y1, x0:x1]
+    tides = _synthetic_tides(times, xx[None], yy[None], extent, tide_range)
+
+    if variable == "tide_m":
+        return tides
+
+    width = extent.right - extent.left
+    height = extent.top - extent.bottom
+    y_frac = (yy - extent.bottom) / height
+    output = []
+    for i, (time_index, year) in enumerate(zip(range(t0, t1), years)):
+        rng = np.random.default_rng((seed, time_index))
+
+        # Shoreline meanders along the study area and retreats 10 m per
+        # year, and moves landward by 50 m per metre of tide height
+        shoreline = (
+            extent.left
+            + width * (0.5 + 0.1 * np.sin(3 * np.pi * y_frac))
+            - 10 * (year - first_year)
+            - 50 * tides[i]
+        )
+
+        # Clouds and their shadows are generated from a smooth random
+        # field, with cloud cover varying between scenes
+        wavelengths = rng.uniform(3000, 20000, size=(3, 2))
+        phases = rng.uniform(0, 2 * np.pi, size=3)
+        threshold = rng.uniform(0.8, 3.5)
+
+        def _cloud_field(dx=0.0, dy=0.0):
+            return sum(
+                np.sin((xx + dx) / wx + (yy + dy) / wy + p)
+                for (wx, wy), p in zip(wavelengths, phases)
+            )
+
+        cloud = _cloud_field() > threshold
+        shadow = ~cloud & (_cloud_field(900, -600) > threshold)
+
+        # Every third scene contains Landsat 7 SLC-off style nodata stripes
+        nodata = ((cols + rows // 8) % 40 < 5) & (time_index % 3 == 0)
+
+        if variable == "cloud_mask":
+            cloud_mask = np.ones(xx.shape, dtype="uint8")
+            cloud_mask[shadow] = 3
+            cloud_mask[cloud] = 2
+            cloud_mask[nodata] = 0
+            output.append(cloud_mask)
+
+        else:
+            # Per-pixel noise is seeded by block location so that it is
+            # independent of the order blocks are generated in
+            noise_rng = np.random.default_rng((seed, time_index, y0, x0))
+            index = 0.6 * np.tanh((xx - shoreline) / 60.0)
+            index += noise_rng.normal(0, 0.08, size=xx.shape)
+            index[cloud] = noise_rng.uniform(-0.3, 0.0, size=cloud.sum())
+            index[shadow] -= 0.2
+            index[nodata] = np.nan
+            output.append(index.clip(-1, 1).astype("float32"))
+
+    return np.stack(output)
+
+
+def synthetic_dataset(
+    shape=(1600, 1600),
+    n_years=5,
+    scenes_per_year=20,
+    chunk_size=800,
+    tide_range=2.0,
+    start_year=2000,
+    seed=0,
+):
+    """
+    Generate a synthetic, Dask-backed stack of Landsat-like data for
+    benchmarking the raster workflow without a datacube database. The
+    stack contains an MNDWI water index with a moving shoreline and
+    noise, an Fmask-style cloud mask containing clouds, cloud shadows
+    and nodata stripes, and per-pixel tide heights from a synthetic
+    tide cycle. Data is generated independently for each Dask chunk
+    when it is computed, so large stacks can be created without using
+    large amounts of memory.
+
+    Parameters:
+    -----------
+    shape : tuple, optional
+        The `(y, x)` shape of the study area in 30 m pixels. Defaults
+        to `(1600, 1600)`, approximately the size of a 48 km study area
+        grid cell.
+    n_years : int, optional
+        The number of years of data to generate. Defaults to 5.
+    scenes_per_year : int, optional
+        The number of satellite scenes acquired each year. Defaults
+        to 20.
+    chunk_size : int, optional
+        The size of the Dask chunks along the "y" and "x" dimensions.
+        Each chunk contains a single timestep. Defaults to 800.
+    tide_range : float, optional
+        The spring tide range in metres. Defaults to 2.0.
+    start_year : int, optional
+        The first year of data to generate. Defaults to 2000.
+    seed : int, optional
+        Seed used to generate random noise and clouds. Defaults to 0.
+
+    Returns:
+    --------
+    ds : xarray.Dataset
+        A Dask-backed dataset with "mndwi", "cloud_mask" and "tide_m"
+        variables and "time", "y" and "x" dimensions.
+    tides_lowres : xarray.DataArray
+        Synthetic tide heights for each timestep on a low-resolution
+        5 km grid, matching those produced by `model_box_tides`.
+    """
+
+    # Study area in Australian Albers, with a low resolution tide
+    # modelling grid buffered around its extent
+    geobox = GeoBox.from_bbox(
+        (1_500_000, -3_900_000, 1_500_000 + shape[1] * 30, -3_900_000 + shape[0] * 30),
+        crs="EPSG:3577",
+        resolution=30,
+    )
+    lowres_geobox = GeoBox.from_bbox(
+        geobox.boundingbox.buffered(10000), crs="EPSG:3577", resolution=5000
+    )
+    extent = geobox.boundingbox
+
+    # Acquire scenes at regular intervals through each year, at varying
+    # times of day
+    rng = np.random.default_rng(seed)
+    times = pd.DatetimeIndex(
+        [
+            pd.Timestamp(f"{year}-01-01")
+            + pd.Timedelta(days=365 * i / scenes_per_year)
+            + pd.Timedelta(minutes=rng.uniform(-60, 60))
+            for year in range(start_year, start_year + n_years)
+            for i in range(scenes_per_year)
+        ]
+    ).values
+    years = pd.DatetimeIndex(times).year.values
+
+    coords = odc.geo.xr.xr_coords(geobox)
+    x, y = coords["x"].values, coords["y"].values
+    chunks = ((1,) * len(times), *(dask.array.core.normalize_chunks(chunk_size, shape)))
+
+    def _variable(name, dtype):
+        data = dask.array.map_blocks(
+            _synthetic_block,
+            name,
+            times,
+            x,
+            y,
+            extent,
+            years,
+            seed,
+            tide_range,
+            chunks=chunks,
+            dtype=dtype,
+        )
+        return (("time", "y", "x"), data)
+
+    ds = xr.Dataset(
+        {
+            "mndwi": _variable("mndwi", "float32"),
+            "cloud_mask": _variable("cloud_mask", "uint8"),
+            "tide_m": _variable("tide_m", "float32"),
+        },
+        coords={"time": times, **coords},
+    )
+    ds.cloud_mask.attrs.update(flags_definition=CLOUD_MASK_FLAGS, nodata=0)
+
+    # Low resolution tides, evaluated at the centre of each tide
+    # modelling pixel
+    lowres_coords = odc.geo.xr.xr_coords(lowres_geobox)
+    lowres_xx, lowres_yy = np.meshgrid(
+        lowres_coords["x"].values, lowres_coords["y"].values
+    )
+    tides_lowres = xr.DataArray(
+        _synthetic_tides(times, lowres_xx[None], lowres_yy[None], extent, tide_range),
+        dims=("time", "y", "x"),
+        coords={"time": times, **lowres_coords},
+        name="tide_m",
+    )
+
+    return ds, tides_lowres
+
+
+def measure(func, repeats=1):
+    """
+    Measure the run time and peak memory use of a function. The
+    function is run `repeats` times to measure the fastest run time,
+    then once more while tracing memory allocations with `tracemalloc`
+    (which includes NumPy array allocations in all threads).
+
+    Parameters:
+    -----------
+    func : callable
+        The function to benchmark, called with no arguments.
+    repeats : int, optional
+        The number of timed runs. Defaults to 1.
+
+    Returns:
+    --------
+    seconds : float
+        The fastest run time in seconds.
+    peak_memory : int
+        The peak memory allocated while running `func`, in bytes.
+    """
+
+    run_times = []
+    for _ in range(max(repeats, 1)):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        run_times.append(time.perf_counter() - start)
+
+    # Trace memory in a separate run, as tracing slows down execution
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return min(run_times), peak_memory
+
+
+def run_benchmarks(
+    ds, tides_lowres, output_dir, benchmarks=None, repeats=1, block_size=None, log=None
+):
+    """
+    Benchmark each stage of the raster workflow on a synthetic dataset
+    (see `synthetic_dataset`), from cloud masking and tide modelling
+    through to exporting annual and three-year gapfill composites.
+
+    Parameters:
+    -----------
+    ds : xarray.Dataset
+        A Dask-backed dataset with "mndwi", "cloud_mask" and "tide_m"
+        variables, containing at least three years of data.
+    tides_lowres : xarray.DataArray
+        Low-resolution tide heights for each timestep in `ds`.
+    output_dir : str
+        The directory used to write benchmark outputs.
+    benchmarks : list, optional
+        The names of the benchmarks to run. Defaults to None, which
+        runs all benchmarks.
+    repeats : int, optional
+        The number of timed runs of each benchmark (see `measure`).
+        Defaults to 1.
+    block_size : int, optional
+        The block size used to benchmark
+        `export_annual_gapfill_blocked`. Defaults to None, which uses
+        half the width of the study area.
+    log : logging.Logger, optional
+        Logger used to report progress.
+
+    Returns:
+    --------
+    results : pandas.DataFrame
+        The fastest run time (in seconds) and peak memory use (in MB)
+        of each benchmark, indexed by benchmark name.
+    """
+
+    if log is None:
+        log = configure_logging()
+
+    years = np.unique(pd.DatetimeIndex(ds.time.values).year)
+    start_year, end_year = years[1], years[-2]
+    if block_size is None:
+        block_size = -(-len(ds.x) // 2)
+
+    # Lazily mask clouds, and calculate tide cutoffs for each pixel. As
+    # in `generate_rasters`, cutoffs are calculated for a list of tide
+    # centres, and composites are exported from data with a lazy tide
+    # mask rather than per-pixel tide heights
+    masked_ds = ds.assign(mndwi=apply_cloud_mask(ds.mndwi, ds.cloud_mask))
+    masked_ds = masked_ds.drop_vars("cloud_mask")
+    index_ds = masked_ds.drop_vars("tide_m")
+    tide_centres = [0.0]
+    tide_cutoff_min, tide_cutoff_max = tide_cutoffs(
+        index_ds, tides_lowres, tide_centre=tide_centres
+    )
+    gapfill_ds = index_ds.assign(
+        tide_mask=tide_mask(index_ds, tides_lowres, tide_cutoff_min, tide_cutoff_max)
+    )
+
+    # Per-pixel tide heights are only used to benchmark loading a tidal
+    # subset of a single year of data
+    year_ds = masked_ds.sel(time=str(start_year))
+    subset_ds = load_tidal_subset(year_ds, tide_cutoff_min, tide_cutoff_max)
+
+    stages = {
+        "apply_cloud_mask": lambda: masked_ds.mndwi.compute(),
+        "tide_cutoffs": lambda: tide_cutoffs(
+            index_ds, tides_lowres, tide_centre=tide_centres
+        ),
+        "tide_mask": lambda: tide_mask(
+            index_ds, tides_lowres, tide_cutoff_min, tide_cutoff_max
+        ).compute(),
+        "load_tidal_subset": lambda: load_tidal_subset(
+            year_ds, tide_cutoff_min, tide_cutoff_max
+        ),
+        "tidal_composite": lambda: tidal_composite(
+            subset_ds.drop_vars("tide_m"),
+            label=start_year,
+            label_dim="year",
+            output_dir=output_dir,
+        ),
+        "export_annual_gapfill": lambda: export_annual_gapfill(
+            gapfill_ds,
+            output_dir,
+            tide_cutoff_min,
+            tide_cutoff_max,
+            start_year,
+            end_year,
+        ),
+        "export_annual_gapfill_blocked": lambda: export_annual_gapfill_blocked(
+            index_ds,
+            tides_lowres,
+            output_dir,
+            tide_centres,
+            start_year,
+            end_year,
+            block_size=block_size,
+            log=log,
+        ),
+    }
+
+    if benchmarks is None:
+        benchmarks = list(stages)
+    unknown = set(benchmarks) - set(stages)
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {sorted(unknown)}")
+
+    results = {}
+    for name in benchmarks:
+        seconds, peak_memory = measure(stages[name], repeats=repeats)
+        results[name] = {"seconds": seconds, "peak_memory_mb": peak_memory / 1e6}
+        log.info(
+            f"Benchmark {name}: {seconds:.2f} seconds, "
+            f"{peak_memory / 1e6:.0f} MB peak memory"
+        )
+
+    return pd.DataFrame.from_dict(results, orient="index").rename_axis("benchmark")
+
+
+def compare_benchmarks(results, baseline, tolerance=0.2):
+    """
+    Compare benchmark results against a previous baseline run,
+    identifying benchmarks whose run time or peak memory use has
+    increased by more than `tolerance`.
+
+    Parameters:
+    -----------
+    results, baseline : pandas.DataFrame
+        Benchmark results, as returned by `run_benchmarks`.
+    tolerance : float, optional
+        The proportional increase allowed before a benchmark is
+        considered a regression. Defaults to 0.2 (i.e. 20%).
+
+    Returns:
+    --------
+    comparison : pandas.DataFrame
+        The ratio of each result to the baseline, with a "regression"
+        column flagging benchmarks exceeding the tolerance.
+    """
+
+    comparison = (results / baseline.reindex_like(results)).add_suffix("_ratio")
+    comparison["regression"] = (comparison > 1 + tolerance).any(axis=1)
+
+    return comparison
+
+
+@click.command()
+@click.option(
+    "--shape",
+    type=(int, int),
+    default=(1600, 1600),
+    help="The y and x size of the synthetic study area in 30 m pixels.",
+)
+@click.option(
+    "--n_years",
+    type=click.IntRange(min=3),
+    default=5,
+    help="The number of years of synthetic data to generate. "
+    "At least three years are required to generate gapfill "
+    "composites.",
+)
+@click.option(
+    "--scenes_per_year",
+    type=int,
+    default=20,
+    help="The number of synthetic satellite scenes acquired each year.",
+)
+@click.option(
+    "--chunk_size",
+    type=int,
+    default=800,
+    help="The size of the spatial Dask chunks of the synthetic data.",
+)
+@click.option(
+    "--block_size",
+    type=int,
+    help="The block size used to benchmark streaming block-based "
+    "composite generation. Defaults to half the width of the study "
+    "area.",
+)
+@click.option(
+    "--benchmark",
+    type=str,
+    multiple=True,
+    help="The name of a benchmark to run, e.g. 'tidal_composite'. "
+    "Can be provided multiple times. Defaults to running all "
+    "benchmarks.",
+)
+@click.option(
+    "--repeats",
+    type=int,
+    default=1,
+    help="The number of timed runs of each benchmark; the fastest "
+    "run time is reported.",
+)
+@click.option(
+    "--output_path",
+    type=str,
+    help="An optional path to a CSV file used to save benchmark results.",
+)
+@click.option(
+    "--baseline_path",
+    type=str,
+    help="An optional path to a CSV file of previous benchmark results. "
+    "If provided, the benchmark will fail if any run time or peak "
+    "memory use has increased by more than `--tolerance`.",
+)
+@click.option(
+    "--tolerance",
+    type=float,
+    default=0.2,
+    help="The proportional increase in run time or peak memory use "
+    "allowed before a benchmark is considered a regression.",
+)
+@click.option(
+    "--seed",
+    type=int,
+    default=0,
+    help="The seed used to generate synthetic data.",
+)
+def benchmark_cli(
+    shape,
+    n_years,
+    scenes_per_year,
+    chunk_size,
+    block_size,
+    benchmark,
+    repeats,
+    output_path,
+    baseline_path,
+    tolerance,
+    seed,
+):
+    log = configure_logging("Coastlines raster benchmark")
+
+    ds, tides_lowres = synthetic_dataset(
+        shape=shape,
+        n_years=n_years,
+        scenes_per_year=scenes_per_year,
+        chunk_size=chunk_size,
+        seed=seed,
+    )
+    log.info(
+        f"Generated synthetic data with {len(ds.time)} timesteps of "
+        f"{shape[0]} x {shape[1]} pixels"
+    )
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        results = run_benchmarks(
+            ds,
+            tides_lowres,
+            output_dir,
+            benchmarks=list(benchmark) or None,
+            repeats=repeats,
+            block_size=block_size,
+            log=log,
+        )
+
+    if output_path is not None:
+        results.to_csv(output_path)
+        log.info(f"Benchmark results written to {output_path}")
+
+    # Compare against baseline, and exit with an error if any
+    # benchmark has regressed
+    if baseline_path is not None:
+        baseline = pd.read_csv(baseline_path, index_col="benchmark")
+        comparison = compare_benchmarks(results, baseline, tolerance=tolerance)
+        log.info(f"Comparison with baseline:\n{comparison.round(2)}")
+        if comparison.regression.any():
+            regressed = comparison.index[comparison.regression].tolist()
+            log.error(f"Performance regression in benchmarks: {regressed}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    benchmark_cli()
@@ -19,24 +19,37 @@
 #       Above Mean Sea Level).
 
 import os
+import re
 import sys
+import json
+import sqlite3
+import hashlib
 import warnings
 from functools import partial
-from collections import Counter
+from contextlib import closing
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 
 import pytz
 import dask
 import click
+import rasterio
 import numpy as np
 import pandas as pd
 import xarray as xr
+import shapely
 import geopandas as gpd
 from affine import Affine
+from rasterio.shutil import copy as rio_copy
+from rasterio.windows import Window
 from shapely.geometry import shape
 
 import datacube
 import odc.algo
+import odc.geo.geobox
 import odc.geo.xr
+from datacube.api.query import Query
+from datacube.model import Dataset
 from datacube.utils.aws import configure_s3_access
 from datacube.utils.cog import write_cog
 from datacube.utils.geometry import CRS, GeoBox, Geometry
@@ -46,14 +59,20 @@ from datacube.virtual import catalog_from_file
 from dea_tools.dask import create_local_dask_cluster
 from dea_tools.spatial import hillshade, sun_angles
 from dea_tools.coastal import model_tides, pixel_tides
-from dea_tools.datahandling import parallel_apply
 
-from coastlines.utils import configure_logging, load_config
+from coastlines.utils import configure_logging, datum_suffix, load_config
 
 # Hide warnings
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
 
+class TideModellingError(FileNotFoundError):
+    """
+    Raised when tide modelling files required to generate composites
+    for a study area cannot be accessed.
+    """
+
+
 def terrain_shadow(ds, dem, threshold=0.5, radius=1):
     """
     Calculates a custom terrain shadow mask that can be used
@@ -96,13 +115,100 @@ def terrain_shadow(ds, dem, threshold=0.5, radius=1):
     return xr.DataArray(hs, dims=["y", "x"])
 
 
-def terrain_shadow_masking(dc, query, ds, dem_product="dem_cop_30"):
+def _terrain_shadow_bin(dem, sun_elevation, sun_azimuth, **terrain_shadow_kwargs):
+    """
+    Calculate a terrain shadow mask as a numpy array for a single pair
+    of sun elevation and azimuth angles.
+    """
+
+    sun_angles_ds = xr.Dataset(
+        {"sun_elevation": sun_elevation, "sun_azimuth": sun_azimuth}
+    )
+    return terrain_shadow(sun_angles_ds, dem, **terrain_shadow_kwargs).values
+
+
+def load_dem(dc, geobox, dem_product="dem_cop_30", cache_dir=None):
+    """
+    Load a Digital Elevation Model into a satellite data geobox,
+    optionally caching the DEM on disk so that it does not need to be
+    re-loaded when the same area is reprocessed. Cached DEMs are stored
+    as NetCDF files in `cache_dir`, keyed by the geobox and DEM product.
+
+    Parameters:
+    -----------
+    dc : datacube.Datacube object
+        Datacube instance used to load DEM data.
+    geobox : datacube.utils.geometry.GeoBox
+        The geobox to load DEM data into.
+    dem_product : string, optional
+        A string giving the name of the DEM product to load. The DEM
+        should contain a variable named 'elevation'. Defaults to
+        "dem_cop_30".
+    cache_dir : str, optional
+        Directory used to store cached DEMs. Defaults to None, which
+        will load the DEM without using a cache.
+
+    Returns:
+    --------
+    numpy.array
+        A 2D array of elevation values, with values below 0 m set to
+        `NaN`.
+    """
+
+    # Identify cache file using the geobox and DEM product
+    if cache_dir is not None:
+        cache_key = json.dumps(
+            [
+                str(geobox.crs),
+                list(geobox.affine)[:6],
+                list(geobox.shape),
+                dem_product,
+            ]
+        )
+        cache_hash = hashlib.sha1(cache_key.encode()).hexdigest()
+        cache_path = os.path.join(cache_dir, f"dem_{cache_hash}.nc")
+
+        if os.path.exists(cache_path):
+            with xr.open_dataset(cache_path) as cached:
+                return cached.elevation.values
+
+    # Load DEM into satellite data geobox
+    dem_ds = dc.load(product=dem_product, like=geobox, resampling="cubic").squeeze(
+        "time", drop=True
+    )
+    dem = dem_ds.elevation.where(dem_ds.elevation >= 0)
+
+    # Write to a temporary file first so the cache is never left in
+    # a partially written state
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        xr.Dataset({"elevation": (("y", "x"), dem.values)}).to_netcdf(tmp_path)
+        os.replace(tmp_path, cache_path)
+
+    return dem.values
+
+
+def terrain_shadow_masking(
+    dc,
+    query,
+    ds,
+    dem_product="dem_cop_30",
+    sun_angles_ds=None,
+    dem_cache_dir=None,
+    angle_bin_size=1.0,
+):
     """
     Use a Digital Elevation Model to calculate and apply a terrain
     shadow mask to set all satellite pixels to `NaN` if they are
     affected by terrain shadow. This helps to remove noisy shorelines
     along coastal cliffs and steep coastal terrain.
 
+    Sun elevation and azimuth angles are rounded into bins, and a
+    terrain shadow mask is calculated only once for each unique pair
+    of binned angles. These masks are then lazily broadcast to every
+    timestep that falls within each bin.
+
     Parameters:
     -----------
     dc : datacube.Datacube object
@@ -118,6 +224,17 @@ def terrain_shadow_masking(dc, query, ds, dem_product="dem_cop_30"):
         masking. This must match the name of a product in the datacube.
         The DEM should contain a variable named 'elevation'.
         Defaults to "dem_cop_30".
+    sun_angles_ds : xarray.Dataset, optional
+        An optional `xarray.Dataset` containing 'sun_elevation' and
+        'sun_azimuth' variables for each timestep in `ds`, as returned
+        by `box_sun_angles`. Defaults to None, which will query sun
+        angle metadata from the datacube using `query`.
+    dem_cache_dir : str, optional
+        Directory used to cache loaded DEM data (see `load_dem`).
+        Defaults to None, which will load the DEM without using a cache.
+    angle_bin_size : float, optional
+        The size (in degrees) of the bins used to group sun elevation
+        and azimuth angles. Defaults to 1.0.
 
     Returns:
     --------
@@ -127,33 +244,666 @@ def terrain_shadow_masking(dc, query, ds, dem_product="dem_cop_30"):
     """
 
     # Compute solar angles for all satellite image timesteps
-    query_subset = {k: v for k, v in query.items() if k not in ["dask_chunks"]}
-    query_subset.update(
-        product=["ls5_sr", "ls7_sr", "ls8_sr", "ls9_sr"],
-        collection_category="T1",
-        group_by="solar_day",
-    )
-    sun_angles_ds = sun_angles(dc, query_subset)
+    if sun_angles_ds is None:
+        query_subset = {k: v for k, v in query.items() if k not in ["dask_chunks"]}
+        query_subset.update(
+            product=["ls5_sr", "ls7_sr", "ls8_sr", "ls9_sr"],
+            collection_category="T1",
+            group_by="solar_day",
+        )
+        sun_angles_ds = sun_angles(dc, query_subset)
+    sun_angles_ds = sun_angles_ds.sel(time=ds.time)
 
     # Load DEM into satellite data geobox
-    dem_ds = dc.load(product=dem_product, like=ds.geobox, resampling="cubic").squeeze(
-        "time", drop=True
+    dem = load_dem(dc, ds.geobox, dem_product=dem_product, cache_dir=dem_cache_dir)
+
+    # Identify unique pairs of binned sun elevation and azimuth angles,
+    # and the bin each timestep belongs to
+    binned_angles = np.stack(
+        [sun_angles_ds.sun_elevation.values, sun_angles_ds.sun_azimuth.values],
+        axis=1,
+    )
+    binned_angles = np.round(binned_angles / angle_bin_size) * angle_bin_size
+    unique_angles, bin_index = np.unique(binned_angles, axis=0, return_inverse=True)
+
+    # Lazily identify terrain shadow once for each bin. The DEM is
+    # only added to the Dask graph once, and shared between all bins
+    dem = dask.delayed(dem, pure=True)
+    shadow_bins = dask.array.stack(
+        [
+            dask.array.from_delayed(
+                dask.delayed(_terrain_shadow_bin)(dem, elevation, azimuth),
+                shape=ds.geobox.shape,
+                dtype=bool,
+            )
+            for elevation, azimuth in unique_angles
+        ]
     )
-    dem_ds = dem_ds.where(dem_ds.elevation >= 0)
 
-    # Identify terrain shadow across all timesteps
-    terrain_shadow_ds = parallel_apply(
-        sun_angles_ds,
-        dim="time",
-        func=partial(terrain_shadow, dem=dem_ds.elevation.values),
+    # Broadcast terrain shadow to each timestep in its bin
+    shadow = shadow_bins[bin_index.ravel()]
+    if ds.chunks:
+        shadow = shadow.rechunk((ds.chunks["time"], ds.chunks["y"], ds.chunks["x"]))
+    terrain_shadow_da = xr.DataArray(
+        shadow,
+        dims=("time", "y", "x"),
+        coords={"time": ds.time, "y": ds.y, "x": ds.x},
     )
 
     # Remove terrain shadow pixels from satellite data
-    return ds.where(~terrain_shadow_ds)
+    return ds.where(~terrain_shadow_da)
+
+
+def _prune_recipe(recipe, measurements):
+    """
+    Recursively prune a virtual product recipe so that it only loads
+    and calculates the bands required to produce `measurements`.
+    Expressions are pruned to the outputs that are needed, and the
+    band names referenced by their formulas are propagated down to the
+    underlying products, whose `measurements` lists are subset to
+    match. Transforms other than `expressions` and `apply_mask` are
+    left unchanged, along with everything they take as input.
+    """
+
+    recipe = dict(recipe)
+    measurements = set(measurements)
+
+    # Subset the bands loaded from each datacube product
+    if "product" in recipe:
+        if "measurements" in recipe:
+            recipe["measurements"] = [
+                m for m in recipe["measurements"] if m in measurements
+            ]
+        return recipe
+
+    # Prune each product being combined
+    for combine in ["collate", "juxtapose"]:
+        if combine in recipe:
+            recipe[combine] = [
+                _prune_recipe(child, measurements) for child in recipe[combine]
+            ]
+            return recipe
+
+    # Keep only required outputs, then identify inputs needed to
+    # evaluate their formulas
+    if recipe.get("transform") == "expressions":
+        recipe["output"] = {
+            name: spec
+            for name, spec in recipe["output"].items()
+            if name in measurements
+        }
+        input_measurements = set()
+        for spec in recipe["output"].values():
+            formula = spec if isinstance(spec, str) else spec["formula"]
+            input_measurements.update(re.findall(r"[A-Za-z_]\w*", formula))
+
+    elif recipe.get("transform") == "apply_mask":
+        input_measurements = measurements | {recipe["mask_measurement_name"]}
+
+    else:
+        return recipe
+
+    recipe["input"] = _prune_recipe(recipe["input"], input_measurements)
+    return recipe
+
+
+def _cloud_mask_block(index, cloud_mask, classes, mask_filters):
+    """
+    Identify cloud mask classes, clean up the resulting mask using
+    morphological operations and set masked water index pixels to
+    `NaN`, all in a single pass over a block of data. `index` may
+    contain multiple stacked water indices along its first axis, which
+    share a single cleaned mask.
+    """
+
+    mask = np.isin(cloud_mask, classes)
+    mask = odc.algo.mask_cleanup_np(mask, mask_filters=mask_filters)
+
+    index = index.copy()
+    index[np.broadcast_to(mask, index.shape)] = np.nan
+    return index
+
+
+def apply_cloud_mask(
+    index,
+    cloud_mask,
+    categories=("nodata", "cloud", "shadow", "snow"),
+    mask_filters=(("closing", 2), ("opening", 10), ("dilation", 5)),
+):
+    """
+    Set water index pixels to `NaN` where they are affected by cloud
+    or other invalid cloud mask classes, after cleaning up the cloud
+    mask using morphological operations.
+
+    This produces identical results to chaining `odc.algo.enum_to_bool`,
+    `odc.algo.mask_cleanup` and `odc.algo.erase_bad`, but fuses all
+    three steps into a single overlapping Dask operation per chunk.
+    This avoids creating intermediate boolean arrays, and greatly
+    reduces the number of tasks in the Dask graph.
+
+    Parameters:
+    -----------
+    index : xarray.DataArray or xarray.Dataset
+        A water index array (e.g. MNDWI) to mask. If a dataset of
+        multiple water indices is provided, the cloud mask is cleaned
+        up once and applied to every index.
+    cloud_mask : xarray.DataArray
+        An enumerated cloud mask array (e.g. Fmask) with the same
+        dimensions and Dask chunks as `index`. This must have a
+        `flags_definition` attribute if `categories` are supplied
+        as strings.
+    categories : list, optional
+        Cloud mask classes (either names or integer values) to mask
+        out. Defaults to nodata, cloud, shadow and snow.
+    mask_filters : list, optional
+        A list of `(operation, radius)` tuples giving morphological
+        operations to apply to the cloud mask, as supported by
+        `odc.algo.mask_cleanup`. Defaults to a closing of radius 2
+        (to remove small holes in cloud), an opening of radius 10 (to
+        remove narrow false positive cloud), then a dilation of
+        radius 5.
+
+    Returns:
+    --------
+    xarray.DataArray or xarray.Dataset
+        The water index array (or dataset) with masked pixels set
+        to `NaN`.
+    """
+
+    # Stack multiple water indices into a single array so they can be
+    # masked together in one pass
+    if isinstance(index, xr.Dataset):
+        stacked = index.to_array("variable")
+        if dask.is_dask_collection(stacked.data):
+            stacked = stacked.chunk({"variable": -1})
+        masked = apply_cloud_mask(
+            stacked, cloud_mask.expand_dims("variable"), categories, mask_filters
+        ).to_dataset("variable")
+        for var_name, var in index.data_vars.items():
+            masked[var_name].attrs = var.attrs
+        return masked.assign_attrs(index.attrs)
+
+    # Look up integer values for any named cloud mask classes
+    classes = [c for c in categories if isinstance(c, int)]
+    names = [c for c in categories if isinstance(c, str)]
+    if names:
+        flags = cloud_mask.attrs["flags_definition"]
+        for flag in flags.values():
+            values = {name: int(value) for value, name in flag["values"].items()}
+            if set(names) <= set(values):
+                classes += [values[name] for name in names]
+                break
+        else:
+            raise ValueError(f"Cloud mask classes {names} not found in flags")
+
+    block_func = partial(
+        _cloud_mask_block, classes=classes, mask_filters=list(mask_filters)
+    )
+
+    # Apply to overlapping chunks, using the same overlap depth (the
+    # largest radius) as `odc.algo.mask_cleanup`
+    if dask.is_dask_collection(index.data):
+        radius = max(radius for _, radius in mask_filters)
+        depth = (0,) * (index.ndim - 2) + (radius, radius)
+        data = dask.array.map_overlap(
+            block_func,
+            index.data,
+            cloud_mask.data,
+            depth=depth,
+            boundary="none",
+            dtype=index.dtype,
+        )
+    else:
+        data = block_func(index.data, cloud_mask.data)
+
+    return xr.DataArray(
+        data, dims=index.dims, coords=index.coords, attrs=index.attrs, name=index.name
+    )
+
+
+def _load_settings(crs):
+    """
+    Settings used to group and fetch virtual product data into a
+    common 30 m pixel grid in the supplied CRS.
+    """
+
+    return dict(
+        output_crs=crs,
+        resolution=(-30, 30),
+        align=(15, 15),
+        skip_broken_datasets=True,
+        resampling={
+            "oa_nbart_contiguity": "nearest",
+            "oa_fmask": "nearest",
+            "*": "cubic",
+        },
+    )
+
+
+def _balanced_chunks(size, max_chunk):
+    """
+    Return the smallest chunk size that splits `size` pixels into
+    chunks no larger than `max_chunk`, without creating a small
+    leftover chunk at the edge of the array.
+    """
+
+    n_chunks = -(-size // max_chunk)
+    return -(-size // n_chunks)
+
+
+def plan_chunks(
+    shape,
+    n_times,
+    n_composite_times=None,
+    dtype="float32",
+    overlap_radii=(2, 10, 5),
+    memory_limit="4GB",
+    threads_per_worker=1,
+    n_workers=1,
+    memory_fraction=0.5,
+    working_arrays=8,
+    max_time_chunk=4,
+    chunk_multiple=256,
+    log=None,
+):
+    """
+    Plan Dask chunks for loading and processing a study area, choosing
+    the spatial and time chunk sizes that minimise the total number of
+    chunks (and therefore Dask tasks) while keeping the memory used by
+    each task within each worker thread's share of worker memory.
+
+    Two memory constraints are considered: loading and cloud masking
+    each chunk (including the overlap required by morphological
+    operations), and combining every timestep in a spatial chunk when
+    generating gapfilled tidal composites. Chunks are also kept small
+    enough that every worker thread has at least one chunk to process
+    where possible, and are evenly sized so that small edge chunks are
+    never created.
+
+    Parameters:
+    -----------
+    shape : tuple
+        The `(y, x)` shape of the study area in pixels.
+    n_times : int
+        The number of timesteps to be loaded.
+    n_composite_times : int, optional
+        The largest number of timesteps that will be combined into a
+        single composite (e.g. in a three-year gapfill composite).
+        Defaults to None, which uses `n_times`.
+    dtype : str, optional
+        The data type of the loaded water index. Defaults to "float32".
+    overlap_radii : tuple, optional
+        Radii (in pixels) of morphological operations applied to
+        overlapping chunks, e.g. during cloud mask cleanup.
+    memory_limit : int or str, optional
+        The memory limit of each Dask worker, either in bytes or as a
+        string like "4GB". Defaults to "4GB".
+    threads_per_worker : int, optional
+        The number of threads on each Dask worker. Defaults to 1.
+    n_workers : int, optional
+        The number of Dask workers. Defaults to 1.
+    memory_fraction : float, optional
+        The fraction of each worker thread's share of memory that a
+        single task is allowed to use, leaving room for Dask to hold
+        results and other tasks in memory. Defaults to 0.5.
+    working_arrays : int, optional
+        The approximate number of chunk-sized arrays held in memory
+        while loading and cloud masking a chunk (e.g. input bands, the
+        water index, cloud mask and intermediate masks). Defaults to 8.
+    max_time_chunk : int, optional
+        The maximum number of timesteps in each chunk. Because composites
+        are generated one year at a time, large time chunks that span
+        multiple years would be loaded multiple times. Defaults to 4.
+    chunk_multiple : int, optional
+        Spatial chunk sizes are planned in increments of this many
+        pixels. Defaults to 256.
+    log : logging.Logger, optional
+        Logger used to report the planned chunks.
+
+    Returns:
+    --------
+    dask_chunks : dict
+        A dictionary of chunk sizes for the "time", "y" and "x"
+        dimensions that can be passed to `dc.load`.
+    """
+
+    if log is None:
+        log = configure_logging()
+
+    if isinstance(memory_limit, str):
+        memory_limit = dask.utils.parse_bytes(memory_limit)
+    if n_composite_times is None:
+        n_composite_times = n_times
+
+    itemsize = np.dtype(dtype).itemsize
+    radius = max(overlap_radii, default=0)
+    budget = memory_limit * memory_fraction / threads_per_worker
+    n_threads = threads_per_worker * n_workers
+
+    # Evaluate the memory use and number of chunks for every combination
+    # of evenly sized spatial chunks and power-of-two time chunks
+    max_time_chunk = max(min(n_times, max_time_chunk), 1)
+    time_sizes = [2**i for i in range(int(np.log2(max_time_chunk)) + 1)]
+    candidates = []
+    for max_chunk in range(chunk_multiple, max(shape) + chunk_multiple, chunk_multiple):
+        y, x = (_balanced_chunks(size, max_chunk) for size in shape)
+        for t in time_sizes:
+            load_bytes = t * (y + 2 * radius) * (x + 2 * radius) * itemsize
+            load_bytes *= working_arrays
+            composite_bytes = n_composite_times * y * x * itemsize * 3
+            n_chunks = -(-shape[0] // y) * -(-shape[1] // x) * -(-n_times // t)
+            candidates.append(
+                (n_chunks, -y * x, max(load_bytes, composite_bytes), (t, y, x))
+            )
+
+    # Select the fewest chunks that fit in memory and keep all threads
+    # busy; if no chunks fit in memory, use the smallest chunks possible
+    fits = [c for c in set(candidates) if c[2] <= budget]
+    busy = [c for c in fits if c[0] >= n_threads]
+    if busy:
+        n_chunks, _, nbytes, (t, y, x) = min(busy)
+    elif fits:
+        n_chunks, _, nbytes, (t, y, x) = max(fits, key=lambda c: (c[0], c[1]))
+    else:
+        n_chunks, _, nbytes, (t, y, x) = min(candidates, key=lambda c: c[2])
+        log.warning(
+            "Unable to plan Dask chunks within memory budget; "
+            "using smallest possible chunks"
+        )
+
+    dask_chunks = {"time": t, "x": x, "y": y}
+    log.info(
+        f"Planned Dask chunks {dask_chunks} for {n_times} timesteps of "
+        f"{shape[0]} x {shape[1]} pixels: {n_chunks} chunks using "
+        f"~{nbytes / 1e6:.0f} MB each, with {budget / 1e6:.0f} MB available "
+        f"to each of {n_threads} threads"
+    )
+
+    return dask_chunks
+
+
+class _CatalogueCache:
+    """
+    A wrapper around a `datacube.Datacube` that caches the results of
+    `find_datasets` in a local SQLite database. Each cached search
+    stores the URIs and metadata documents of each dataset, allowing
+    datasets to be reconstructed without querying the datacube index.
+
+    Cached results are reused as long as the IDs of the datasets in the
+    index matching the search are unchanged; if datasets are added,
+    archived or replaced (e.g. when reprocessed), the search is re-run
+    and the cache updated. All other attributes are passed through to
+    the wrapped datacube.
+    """
+
+    def __init__(self, dc, cache_path):
+        self._dc = dc
+        self._cache_path = cache_path
+
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        with closing(sqlite3.connect(cache_path)) as con, con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS searches "
+                "(search_key TEXT PRIMARY KEY, product TEXT, ids_hash TEXT)"
+            )
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS datasets "
+                "(search_key TEXT, id TEXT, uris TEXT, metadata TEXT)"
+            )
+
+    def __getattr__(self, name):
+        return getattr(self._dc, name)
+
+    def find_datasets(self, **search_terms):
+        # Hash the IDs of matching datasets in the index; this is far
+        # cheaper than retrieving and constructing every dataset, and
+        # changes whenever datasets are added, archived or replaced
+        index_terms = {
+            k: v
+            for k, v in search_terms.items()
+            if k not in ["dataset_predicate", "ensure_location", "limit"]
+        }
+        query = Query(self._dc.index, **index_terms)
+        ids = self._dc.index.datasets.search_returning(("id",), **query.search_terms)
+        ids_hash = hashlib.sha1(
+            "\n".join(sorted(str(i.id) for i in ids)).encode()
+        ).hexdigest()
+
+        # Identify cached search using all search terms
+        search_key = json.dumps(sorted(search_terms.items()), default=str)
+        search_key = hashlib.sha1(search_key.encode()).hexdigest()
+
+        with closing(sqlite3.connect(self._cache_path)) as con, con:
+            cached = con.execute(
+                "SELECT product, ids_hash FROM searches WHERE search_key = ?",
+                (search_key,),
+            ).fetchone()
+
+            # Reconstruct datasets from cache if the index is unchanged
+            if cached is not None and cached[1] == ids_hash:
+                product = self._dc.index.products.get_by_name(cached[0])
+                rows = con.execute(
+                    "SELECT uris, metadata FROM datasets "
+                    "WHERE search_key = ? ORDER BY rowid",
+                    (search_key,),
+                )
+                return [
+                    Dataset(product, json.loads(metadata), uris=json.loads(uris))
+                    for uris, metadata in rows
+                ]
+
+            # Otherwise, search the index and update the cache
+            datasets = self._dc.find_datasets(**search_terms)
+            con.execute("DELETE FROM datasets WHERE search_key = ?", (search_key,))
+            con.execute(
+                "INSERT OR REPLACE INTO searches VALUES (?, ?, ?)",
+                (search_key, query.product, ids_hash),
+            )
+            con.executemany(
+                "INSERT INTO datasets VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        search_key,
+                        str(d.id),
+                        json.dumps(d.uris),
+                        json.dumps(d.metadata_doc, default=str),
+                    )
+                    for d in datasets
+                ],
+            )
+
+        return datasets
+
+
+def find_datasets(
+    dc,
+    query,
+    yaml_path,
+    product_name="ls_nbart_ndwi",
+    water_index="mndwi",
+    cache_path=None,
+):
+    """
+    Use virtual products to find and group all Landsat 5, 7, 8 and 9
+    datasets matching a query, without loading any pixel data. The
+    grouped datasets can be inspected or filtered before being passed
+    to `load_water_index` to be loaded.
+
+    Parameters:
+    -----------
+    dc : datacube.Datacube object
+        Datacube instance used to find data.
+    query : dict
+        A dictionary containing query parameters passed to the
+        datacube virtual product (e.g. same as provided to `dc.load`).
+    yaml_path : string
+        Path to YAML file containing virtual product recipe.
+    product_name : string, optional
+        Name of the virtual product to load from the YAML recipe.
+    water_index : string or list of strings, optional
+        The name of the water index (or indices) that will be loaded.
+        The virtual product recipe is pruned so that only the bands
+        required to calculate these indices (and the cloud mask) are
+        loaded. Defaults to "mndwi".
+    cache_path : str, optional
+        Path to a local SQLite database used to cache the datasets
+        found for this query. Cached datasets are reused until datasets
+        matching the query are added to, archived or replaced in the
+        datacube index. Defaults to None, which will always query the
+        datacube index.
+
+    Returns:
+    --------
+    product : datacube.virtual.VirtualProduct
+        The virtual product used to load data.
+    box : datacube.virtual.impl.VirtualDatasetBox
+        Datasets grouped by time, with a geobox defined using the most
+        common CRS of all datasets.
+    """
+
+    # Load in virtual product catalogue and select water index product,
+    # pruning its recipe so that only the bands required to calculate
+    # our water indices and cloud mask are read from disk
+    water_indices = [water_index] if isinstance(water_index, str) else water_index
+    catalog = catalog_from_file(yaml_path)
+    recipe = _prune_recipe(
+        catalog.contents["products"][product_name]["recipe"],
+        measurements=[*water_indices, "cloud_mask"],
+    )
+    product = catalog.name_resolver.construct(**recipe)
+
+    # Find datasets, optionally via a local catalogue cache
+    if cache_path is not None:
+        dc = _CatalogueCache(dc, cache_path)
+    bag = product.query(dc, **query)
+
+    # Identify most common CRS
+    crs_list = [str(i.crs) for i in bag.contained_datasets()]
+    crs_counts = Counter(crs_list)
+    crs = crs_counts.most_common(1)[0][0]
+
+    # Pass CRS to product grouping
+    box = product.group(bag, **_load_settings(crs), **query)
+
+    return product, box
+
+
+def coastal_zone_chunks(ds, coastal_zone_gdf, buffer_pixels=32):
+    """
+    Identify the spatial Dask chunks of a dataset that intersect a
+    static coastal zone (e.g. a coarse buffer around the coastline).
+    Chunks entirely outside the zone (e.g. deep ocean or far inland)
+    can then be dropped using `drop_chunks` so they are never loaded.
+
+    Parameters:
+    -----------
+    ds : xarray.Dataset or xarray.DataArray
+        A Dask-backed dataset with "y" and "x" dimensions.
+    coastal_zone_gdf : geopandas.GeoDataFrame
+        Polygons defining the coastal zone.
+    buffer_pixels : int, optional
+        The number of pixels used to buffer the coastal zone before
+        it is compared against each chunk. This ensures that pixels
+        within the zone are not affected by morphological operations
+        (e.g. cloud mask cleanup) applied across chunk boundaries.
+        Defaults to 32.
+
+    Returns:
+    --------
+    keep : numpy.ndarray
+        A 2D boolean array with one element per spatial chunk along
+        the "y" and "x" dimensions, set to True for chunks that
+        intersect the coastal zone.
+    """
+
+    # Buffer coastal zone in the CRS of the dataset
+    geobox = ds.odc.geobox
+    resolution = abs(geobox.resolution.x)
+    zone = (
+        coastal_zone_gdf.to_crs(str(geobox.crs))
+        .buffer(buffer_pixels * resolution)
+        .unary_union
+    )
+    shapely.prepare(zone)
+
+    # Compute the extent of each chunk from its pixel offsets
+    y_edges = np.cumsum((0,) + ds.chunks["y"])
+    x_edges = np.cumsum((0,) + ds.chunks["x"])
+    xx, yy = np.meshgrid(x_edges, y_edges)
+    xs, ys = geobox.affine * (xx, yy)
+    chunk_extents = shapely.box(xs[:-1, :-1], ys[1:, 1:], xs[1:, 1:], ys[:-1, :-1])
+
+    return shapely.intersects(zone, chunk_extents)
+
+
+def drop_chunks(ds, keep):
+    """
+    Replace spatial Dask chunks of a dataset with constant nodata
+    chunks, removing the tasks used to load and process them from the
+    Dask graph. Nodata is taken from each variable's `nodata`
+    attribute, or `NaN` for floating point and False for boolean data.
+
+    Parameters:
+    -----------
+    ds : xarray.Dataset or xarray.DataArray
+        A Dask-backed dataset with "y" and "x" dimensions.
+    keep : numpy.ndarray
+        A 2D boolean array with one element per spatial chunk along
+        the "y" and "x" dimensions (see `coastal_zone_chunks`). Chunks
+        set to False are replaced with nodata.
+
+    Returns:
+    --------
+    xarray.Dataset or xarray.DataArray
+        The dataset with dropped chunks replaced by nodata.
+    """
+
+    if isinstance(ds, xr.Dataset):
+        return ds.assign(
+            {name: drop_chunks(da, keep) for name, da in ds.data_vars.items()}
+        )
+
+    if keep.all() or not {"y", "x"} <= set(ds.dims):
+        return ds
+
+    if np.issubdtype(ds.dtype, np.floating):
+        fill_value = ds.attrs.get("nodata", np.nan)
+    else:
+        fill_value = ds.attrs.get("nodata", 0)
+
+    # Assemble an array from the kept chunks of the original array, and
+    # constant chunks that do not depend on any other tasks
+    da = ds.transpose(..., "y", "x")
+    data = da.data
+    leading_chunks = data.chunks[:-2]
+    blocks = [
+        [
+            data.blocks[..., y_i, x_i]
+            if keep[y_i, x_i]
+            else dask.array.full(
+                (*data.shape[:-2], y_size, x_size),
+                fill_value,
+                dtype=data.dtype,
+                chunks=(*leading_chunks, (y_size,), (x_size,)),
+            )
+            for x_i, x_size in enumerate(data.chunks[-1])
+        ]
+        for y_i, y_size in enumerate(data.chunks[-2])
+    ]
+
+    return da.copy(data=dask.array.block(blocks)).transpose(*ds.dims)
 
 
 def load_water_index(
-    dc, query, yaml_path, product_name="ls_nbart_ndwi", mask_terrain_shadow=True
+    dc,
+    query,
+    yaml_path,
+    product_name="ls_nbart_ndwi",
+    water_index="mndwi",
+    mask_terrain_shadow=True,
+    datasets=None,
+    dem_cache_dir=None,
+    coastal_zone_gdf=None,
 ):
     """
     This function uses virtual products to load Landsat 5, 7, 8 and 9 data,
@@ -177,68 +927,95 @@ def load_water_index(
         Path to YAML file containing virtual product recipe.
     product_name : string, optional
         Name of the virtual product to load from the YAML recipe.
+    water_index : string or list of strings, optional
+        The name of the water index (or indices) to return. The virtual
+        product recipe is pruned so that only the bands required to
+        calculate these indices (and the cloud mask) are loaded, and
+        all indices are calculated from the same loaded bands and
+        share the same cloud and terrain shadow masks. Defaults to
+        "mndwi".
     mask_terrain_shadow : bool, optional
         Whether to use hillshading to mask out pixels potentially
         affected by terrain shadow. This can significantly improve
         shoreline mapping in areas of coastal cliffs or steep coastal
         topography. Defaults to True.
+    datasets : tuple, optional
+        An optional `(product, box)` tuple of previously found (and
+        optionally filtered) datasets, as returned by `find_datasets`.
+        Defaults to None, which will find datasets using `query`.
+    dem_cache_dir : str, optional
+        Directory used to cache DEM data used for terrain shadow
+        masking (see `load_dem`). Defaults to None, which will load the
+        DEM without using a cache.
+    coastal_zone_gdf : geopandas.GeoDataFrame, optional
+        Polygons defining a static coastal zone. If provided, spatial
+        Dask chunks that do not intersect the zone are never loaded
+        or masked, and are returned as `NaN` (see `coastal_zone_chunks`).
+        Defaults to None, which loads every chunk.
 
     Returns:
     --------
     ds : xarray.Dataset
         An `xarray.Dataset` containing a time series of water index
-        data (e.g. MNDWI) for the provided datacube query
+        data (e.g. MNDWI) for the provided datacube query, with a
+        variable for each water index.
     """
 
-    # Load in virtual product catalogue and select MNDWI product
-    catalog = catalog_from_file(yaml_path)
-    product = catalog[product_name]
-
-    # Identify most common CRS
-    bag = product.query(dc, **query)
-    crs_list = [str(i.crs) for i in bag.contained_datasets()]
-    crs_counts = Counter(crs_list)
-    crs = crs_counts.most_common(1)[0][0]
+    water_indices = [water_index] if isinstance(water_index, str) else water_index
 
-    # Pass CRS to product load
-    settings = dict(
-        output_crs=crs,
-        resolution=(-30, 30),
-        align=(15, 15),
-        skip_broken_datasets=True,
-        resampling={
-            "oa_nbart_contiguity": "nearest",
-            "oa_fmask": "nearest",
-            "*": "cubic",
-        },
-    )
-    box = product.group(bag, **settings, **query)
-    ds = product.fetch(box, **settings, **query)
+    # Find and group datasets to load if not supplied
+    if datasets is None:
+        datasets = find_datasets(dc, query, yaml_path, product_name, water_indices)
+    product, box = datasets
 
-    # Rechunk if smallest chunk is less than 10
-    if ((len(ds.x) % 2048) <= 10) or ((len(ds.y) % 2048) <= 10):
-        ds = ds.chunk({"x": 3000, "y": 3000})
+    # Load data into the grouped geobox
+    ds = product.fetch(box, **_load_settings(str(box.geobox.crs)), **query)
 
-    # Extract boolean mask
-    mask = odc.algo.enum_to_bool(
-        ds.cloud_mask, categories=["nodata", "cloud", "shadow", "snow"]
-    )
+    # Rechunk into evenly sized chunks if smallest chunk is less than 10
+    if min(ds.chunks["x"]) <= 10 or min(ds.chunks["y"]) <= 10:
+        ds = ds.chunk(
+            {dim: _balanced_chunks(len(ds[dim]), ds.chunks[dim][0]) for dim in "xy"}
+        )
 
-    # Close mask to remove small holes in cloud, open mask to
-    # remove narrow false positive cloud, then dilate
-    mask_cleaned = odc.algo.mask_cleanup(
-        mask=mask, mask_filters=[("closing", 2), ("opening", 10), ("dilation", 5)]
+    # Replace chunks outside the coastal zone with nodata, so that they
+    # are never read from disk
+    keep = None
+    if coastal_zone_gdf is not None:
+        keep = coastal_zone_chunks(ds, coastal_zone_gdf)
+        ds = drop_chunks(ds, keep)
+
+    # Mask out nodata, cloud, shadow and snow pixels. Mask is closed to
+    # remove small holes in cloud, opened to remove narrow false positive
+    # cloud, then dilated; these steps are fused into a single pass over
+    # each chunk of data, and shared between all water indices
+    ds = ds.assign(
+        apply_cloud_mask(
+            ds[water_indices],
+            ds.cloud_mask,
+            categories=["nodata", "cloud", "shadow", "snow"],
+            mask_filters=[("closing", 2), ("opening", 10), ("dilation", 5)],
+        )
     )
 
-    # Add new mask to nodata pixels
-    ds = odc.algo.erase_bad(ds, mask_cleaned, nodata=np.nan)
-
     # Apply terrain mask to remove deep shadows that can be
-    # be mistaken for water
+    # be mistaken for water, using sun angles from dataset metadata
     if mask_terrain_shadow:
-        ds = terrain_shadow_masking(dc, query, ds, dem_product="dem_cop_30")
+        ds = terrain_shadow_masking(
+            dc,
+            query,
+            ds,
+            dem_product="dem_cop_30",
+            sun_angles_ds=box_sun_angles(box),
+            dem_cache_dir=dem_cache_dir,
+        )
 
-    return ds[["mndwi"]]
+    # Drop chunks again so masking is skipped for chunks outside the
+    # coastal zone (these are only needed to provide overlap for
+    # masking neighbouring chunks)
+    if keep is not None:
+        return drop_chunks(ds[water_indices], keep)
+
+    return ds[water_indices]
 
 
 def tide_cutoffs(ds, tides_lowres, tide_centre=0.0, resampling="bilinear"):
@@ -254,20 +1031,22 @@ def tide_cutoffs(ds, tides_lowres, tide_centre=0.0, resampling="bilinear"):
 
     Parameters:
     -----------
-    ds : xarray.Dataset
+    ds : xarray.Dataset or None
         An `xarray.Dataset` containing a time series of water index
         data (e.g. MNDWI) for the provided datacube query. This is
         used to define the spatial extents into which tide height
-        cutoffs will be interpolated.
+        cutoffs will be interpolated. If None, low resolution tide
+        cutoffs will be returned without being interpolated.
     tides_lowres : xarray.Dataset
         A low-res `xarray.Dataset` containing tide heights for each
         timestep in `ds`, as produced by the `pixel_tides` function.
-    tide_centre : float, optional
+    tide_centre : float or list of floats, optional
         The central tide height used to compute the min and max
         tide height cutoffs. Tide heights will be masked so all
         satellite observations are approximately centred over this
         value. The default is 0.0 which represents 0 m Above Mean
-        Sea Level.
+        Sea Level. If a list of tide heights is provided, cutoffs are
+        computed for each, along a new "tide_centre" dimension.
     resampling : string, optional
         The resampling method used when reprojecting low resolution
         tides to higher resolution. Defaults to "bilinear".
@@ -276,9 +1055,18 @@ def tide_cutoffs(ds, tides_lowres, tide_centre=0.0, resampling="bilinear"):
     --------
     tide_cutoff_min, tide_cutoff_max : xarray.DataArray
         2D arrays containing tide height cutoff values interpolated
-        into the extent of `ds`.
+        into the extent of `ds` (or 3D arrays with an additional
+        "tide_centre" dimension if multiple tide centres are provided).
     """
 
+    # Add a dimension for multiple tide centres
+    if np.ndim(tide_centre) > 0:
+        tide_centre = xr.DataArray(
+            np.asarray(tide_centre, dtype="float64"),
+            dims="tide_centre",
+            coords={"tide_centre": np.asarray(tide_centre, dtype="float64")},
+        )
+
     # Calculate min and max tides
     tide_min = tides_lowres.min(dim="time")
     tide_max = tides_lowres.max(dim="time")
@@ -288,6 +1076,10 @@ def tide_cutoffs(ds, tides_lowres, tide_centre=0.0, resampling="bilinear"):
     tide_cutoff_min = tide_centre - tide_cutoff_buffer
     tide_cutoff_max = tide_centre + tide_cutoff_buffer
 
+    # Return low resolution cutoffs if no dataset is provided
+    if ds is None:
+        return tide_cutoff_min, tide_cutoff_max
+
     # Reproject into original geobox
     tide_cutoff_min = tide_cutoff_min.odc.reproject(
         ds.odc.geobox, resampling=resampling
@@ -299,240 +1091,1707 @@ def tide_cutoffs(ds, tides_lowres, tide_centre=0.0, resampling="bilinear"):
     return tide_cutoff_min, tide_cutoff_max
 
 
-def load_tidal_subset(year_ds, tide_cutoff_min, tide_cutoff_max):
+def pixel_tides_cached(ds, cache_dir=None, model="FES2014", **pixel_tides_kwargs):
     """
-    For a given year of data, thresholds data to keep observations
-    within a minimum and maximum tide height cutoff range, and load
-    the data into memory.
+    Model low-resolution tide heights for every timestep in `ds` using
+    `dea_tools.coastal.pixel_tides` (with `resample=False`), optionally
+    caching outputs on disk so that tides do not need to be re-modelled
+    when the same area is reprocessed.
+
+    Cached tides are stored as a NetCDF file in `cache_dir`, keyed by
+    the geobox of `ds`, the tide model and any other tide modelling
+    parameters. Each file contains every timestep modelled to date, so
+    only timesteps missing from the cache are modelled (and appended to
+    the cache) on subsequent runs.
 
     Parameters:
     -----------
-    year_ds : xarray.Dataset
-        An `xarray.Dataset` for a single epoch (typically annually)
-        containing a time series of water index data (e.g. MNDWI) and
-        tide heights (`tide_m`) for each pixel.
-    tide_cutoff_min, tide_cutoff_max : numeric or xarray.DataArray
-        Numeric values or 2D data arrays containing minimum and
-        maximum tide height values used to select a subset of
-        satellite observations for each individual pixel that fall
-        within this range. All pixels with tide heights outside of
-        this range will be set to `NaN`.
+    ds : xarray.Dataset
+        A dataset whose geobox will be used to define the extent of the
+        low resolution tide modelling grid, and whose "time" coordinate
+        gives the times to model.
+    cache_dir : str, optional
+        Directory used to store cached tides. Defaults to None, which
+        will model tides without using a cache.
+    model : string, optional
+        The tide model used to model tides. Defaults to "FES2014".
+    **pixel_tides_kwargs :
+        Optional parameters passed to `dea_tools.coastal.pixel_tides`.
 
     Returns:
     --------
-    year_ds : xarray.Dataset
-        An in-memory `xarray.Dataset` with pixels set to `NaN` if
-        they were acquired outside of the supplied tide height range.
+    tides_lowres : xarray.DataArray
+        A low-res `xarray.DataArray` containing tide heights for each
+        timestep in `ds`.
     """
 
-    # Determine what pixels were acquired in selected tide range, and
-    # drop time-steps without any relevant pixels to reduce data to load
-    tide_bool = (year_ds.tide_m >= tide_cutoff_min) & (
-        year_ds.tide_m <= tide_cutoff_max
+    if cache_dir is None:
+        return pixel_tides(ds, resample=False, model=model, **pixel_tides_kwargs)
+
+    # Identify cache file using the geobox and tide modelling parameters
+    geobox = ds.odc.geobox
+    cache_key = json.dumps(
+        [
+            str(geobox.crs),
+            list(geobox.affine)[:6],
+            list(geobox.shape),
+            model,
+            sorted((k, str(v)) for k, v in pixel_tides_kwargs.items()),
+        ]
     )
-    year_ds = year_ds.sel(time=tide_bool.sum(dim=["x", "y"]) > 0)
+    cache_hash = hashlib.sha1(cache_key.encode()).hexdigest()
+    cache_path = os.path.join(cache_dir, f"tides_lowres_{cache_hash}.nc")
+
+    # Load previously cached tides, and identify any uncached times
+    times = pd.DatetimeIndex(ds.time.values)
+    if os.path.exists(cache_path):
+        with xr.open_dataset(cache_path, decode_coords="all") as cached:
+            tides_lowres = cached.tide_m.load()
+        missing_times = times[~times.isin(tides_lowres.time.values)]
+    else:
+        tides_lowres = None
+        missing_times = times
+
+    # Model tides for uncached times, then append these to the cache
+    # (writing to a temporary file first so the cache is never left in
+    # a partially written state)
+    if len(missing_times) > 0:
+        new_tides = pixel_tides(
+            ds,
+            times=missing_times,
+            resample=False,
+            model=model,
+            **pixel_tides_kwargs,
+        )
+        if tides_lowres is not None:
+            new_tides = xr.concat([tides_lowres, new_tides], dim="time")
+        tides_lowres = new_tides.sortby("time")
 
-    # Apply mask, and load in corresponding tide masked data
-    year_ds = year_ds.where(tide_bool)
-    return year_ds.compute()
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        tides_lowres.to_netcdf(tmp_path)
+        os.replace(tmp_path, cache_path)
 
+    return tides_lowres.sel(time=times).odc.assign_crs(geobox.crs)
 
-def tidal_composite(
-    year_ds, label, label_dim, output_dir, output_suffix="", export_geotiff=False
-):
+
+def model_box_tides(box, cache_dir=None, **pixel_tides_kwargs):
     """
-    For a given year of data, takes median, counts and standard
-    deviation of valid water index results, and optionally writes
-    each water index, tide height, standard deviation and valid pixel
-    counts for the time period to file as GeoTIFFs.
+    Model tide heights into a low-resolution grid for every timestep
+    in a box of grouped datasets (see `find_datasets`), using dataset
+    acquisition times alone without reading any pixel data. The
+    low-resolution grid is identical to the one `pixel_tides` would
+    use for the loaded data.
 
     Parameters:
     -----------
-    year_ds : xarray.Dataset
-        A tide-masked `xarray.Dataset` containing a time series of
-        water index data (e.g. MNDWI) for a single epoch
-        (typically annually).
-    label : int, float or str
-        An int, float or string used to name the output variables and
-        files, For example, a year label for the data in `year_ds`.
-    label_dim : str
-        A string giving the name for the dimension that will be created
-        to contain labels supplied to `label`.
-    output_dir : str
-        The directory to output files for the specific analysis.
-    output_suffix : str
-        An optional suffix that will be used to identify certain
-        outputs. For example, outputs used for gapfilling data
-        can be differentiated from other outputs by supplying
-        `output_suffix='_gapfill'`. Defaults to '', which will not
+    box : datacube.virtual.impl.VirtualDatasetBox
+        Grouped datasets, as returned by `find_datasets`.
+    cache_dir : str, optional
+        Directory used to cache modelled tides (see
+        `pixel_tides_cached`). Defaults to None, which will model tides
+        without using a cache.
+    **pixel_tides_kwargs :
+        Optional parameters passed to `dea_tools.coastal.pixel_tides`.
+
+    Returns:
+    --------
+    tides_lowres : xarray.DataArray
+        A low-res `xarray.DataArray` containing tide heights for each
+        timestep in `box`.
+    """
+
+    # Create an empty dataset with the spatial coordinates and
+    # timesteps of the data that would be loaded from `box`
+    geobox = odc.geo.geobox.GeoBox(
+        box.geobox.shape, box.geobox.affine, str(box.geobox.crs)
+    )
+    coords_ds = xr.Dataset(
+        coords={"time": box.box.time.values, **odc.geo.xr.xr_coords(geobox)}
+    )
+
+    return pixel_tides_cached(coords_ds, cache_dir=cache_dir, **pixel_tides_kwargs)
+
+
+def _filter_entry(entry, keep):
+    """
+    Remove datasets from a single entry of a `VirtualDatasetBox`,
+    preserving any `collate` structure. Entries of other combined
+    products (e.g. `juxtapose`) are returned unchanged.
+    """
+
+    if isinstance(entry, dict):
+        if "collate" in entry:
+            source_index, child = entry["collate"]
+            return {"collate": (source_index, _filter_entry(child, keep))}
+        return entry
+
+    return tuple(dataset for dataset in entry if keep(dataset))
+
+
+def _entry_size(entry):
+    """
+    Count the datasets in a single entry of a `VirtualDatasetBox`.
+    """
+
+    if isinstance(entry, dict):
+        if "collate" in entry:
+            return _entry_size(entry["collate"][1])
+        return 1
+
+    return len(entry)
+
+
+def _entry_datasets(entry):
+    """
+    List the datasets in a single entry of a `VirtualDatasetBox`.
+    """
+
+    if isinstance(entry, dict):
+        if "collate" in entry:
+            return _entry_datasets(entry["collate"][1])
+        if "juxtapose" in entry:
+            return [d for child in entry["juxtapose"] for d in _entry_datasets(child)]
+        return []
+
+    return list(entry)
+
+
+def box_sun_angles(box):
+    """
+    Calculate mean sun elevation and azimuth angles for each timestep
+    in a box of grouped datasets (see `find_datasets`), using the
+    "eo:sun_elevation" and "eo:sun_azimuth" properties recorded in
+    each dataset's metadata. This avoids the need to query the
+    datacube again to obtain sun angles.
+
+    Parameters:
+    -----------
+    box : datacube.virtual.impl.VirtualDatasetBox
+        Grouped datasets, as returned by `find_datasets`.
+
+    Returns:
+    --------
+    sun_angles_ds : xarray.Dataset
+        An `xarray.Dataset` containing 'sun_elevation' and
+        'sun_azimuth' variables for each timestep in `box`.
+    """
+
+    angles = {"sun_elevation": [], "sun_azimuth": []}
+    for entry in box.box.values:
+        properties = [d.metadata_doc["properties"] for d in _entry_datasets(entry)]
+        for name in angles:
+            angles[name].append(np.mean([p[f"eo:{name}"] for p in properties]))
+
+    return xr.Dataset(
+        {name: ("time", values) for name, values in angles.items()},
+        coords={"time": box.box.time},
+    )
+
+
+def tide_prefilter(box, tides_lowres, tide_centre=0.0, buffer_pixels=2):
+    """
+    Remove datasets from a box of grouped datasets if their entire
+    footprint was acquired outside of the tide height cutoffs used to
+    generate composites (see `tide_cutoffs`), so that these datasets
+    are never read from disk. Timesteps left without any datasets are
+    removed entirely.
+
+    Filtering is conservative: a dataset is retained if any
+    low-resolution tide modelling pixel within its (buffered) footprint
+    is above the low tide cutoff, and any is below the high tide
+    cutoff. Because high resolution tides and tide cutoffs are bilinearly
+    interpolated from these low-resolution pixels, every high resolution
+    pixel that would fall inside the tide cutoffs is retained. Buffering
+    footprints by two low-resolution pixels also ensures that no
+    retained pixel is affected by cloud mask cleanup operations applied
+    to removed datasets.
+
+    Parameters:
+    -----------
+    box : datacube.virtual.impl.VirtualDatasetBox
+        Grouped datasets, as returned by `find_datasets`.
+    tides_lowres : xarray.DataArray
+        A low-res `xarray.DataArray` containing tide heights for each
+        timestep in `box`, as produced by `model_box_tides`.
+    tide_centre : float or list of floats, optional
+        The central tide height used to compute the min and max
+        tide height cutoffs. If a list is provided, datasets are
+        retained if they fall within the cutoffs of any tide centre.
+        Defaults to 0.0.
+    buffer_pixels : int, optional
+        The number of low-resolution pixels used to buffer each
+        dataset's footprint. Defaults to 2.
+
+    Returns:
+    --------
+    box : datacube.virtual.impl.VirtualDatasetBox
+        Grouped datasets, with datasets acquired entirely outside of
+        the tide cutoffs removed.
+    """
+
+    # Compute low resolution tide cutoffs from all timesteps, and
+    # identify pixels above low tide and below high tide cutoffs
+    tide_cutoff_min, tide_cutoff_max = tide_cutoffs(
+        None, tides_lowres, tide_centre=tide_centre
+    )
+    above_min = (tides_lowres >= tide_cutoff_min).transpose("time", "y", "x", ...)
+    below_max = (tides_lowres <= tide_cutoff_max).transpose("time", "y", "x", ...)
+    above_min, below_max = above_min.values, below_max.values
+
+    # Coordinates of low resolution pixel centres
+    crs = str(tides_lowres.odc.geobox.crs)
+    resolution = abs(tides_lowres.odc.geobox.resolution.x)
+    xx, yy = np.meshgrid(tides_lowres.x.values, tides_lowres.y.values)
+    time_index = {t: i for i, t in enumerate(tides_lowres.time.values)}
+
+    def _filter(index, entry):
+        # Select pixels inside or outside cutoffs for this timestep
+        i = time_index[index["time"]]
+        above, below = above_min[i], below_max[i]
+
+        def _keep(dataset):
+            footprint = dataset.extent.to_crs(crs).buffer(resolution * buffer_pixels)
+            inside = shapely.contains_xy(footprint.geom, xx, yy)
+            return (above[inside].any(axis=0) & below[inside].any(axis=0)).any()
+
+        return _filter_entry(entry, _keep)
+
+    # Remove datasets from each timestep, then drop empty timesteps.
+    # Always retain at least one timestep so that data can be loaded
+    filtered_box = box.map(_filter)
+    has_data = filtered_box.map(
+        lambda index, entry: _entry_size(entry) > 0, dtype="bool"
+    )
+    if has_data.box.values.any():
+        return filtered_box.filter(lambda index, entry: _entry_size(entry) > 0)
+
+    return next(box.split(dim="time"))
+
+
+def tide_mask(
+    ds, tides_lowres, tide_cutoff_min, tide_cutoff_max, resampling="bilinear"
+):
+    """
+    Lazily identify satellite pixels acquired within a minimum and
+    maximum tide height cutoff range, without creating a full
+    resolution array of tide heights.
+
+    Low-resolution tides are interpolated into each individual Dask
+    chunk of `ds` only when that chunk is computed, then immediately
+    compared against tide cutoffs. The resulting boolean mask is
+    identical to comparing full resolution tides produced by
+    `pixel_tides` against the same cutoffs, but only one chunk of tide
+    heights ever exists in memory at a time.
+
+    Parameters:
+    -----------
+    ds : xarray.Dataset
+        An `xarray.Dataset` containing a time series of water index
+        data (e.g. MNDWI). The mask will match the geobox, timesteps
+        and Dask chunks of this dataset.
+    tides_lowres : xarray.DataArray
+        A low-res `xarray.DataArray` containing tide heights for each
+        timestep in `ds`, as produced by `model_box_tides`.
+    tide_cutoff_min, tide_cutoff_max : xarray.DataArray
+        2D data arrays containing minimum and maximum tide height
+        cutoffs interpolated into the extent of `ds` (see
+        `tide_cutoffs`). If these contain an additional "tide_centre"
+        dimension, a mask is computed for each tide centre from the
+        same interpolated tides.
+    resampling : string, optional
+        The resampling method used when reprojecting low resolution
+        tides to higher resolution. Defaults to "bilinear".
+
+    Returns:
+    --------
+    tide_bool : xarray.DataArray
+        A lazy boolean `xarray.DataArray` with "time", "y" and "x"
+        dimensions (and a leading "tide_centre" dimension if present
+        in the cutoffs) that is True for pixels acquired within the
+        tide cutoff range.
+    """
+
+    geobox = ds.odc.geobox
+    tides_lowres = tides_lowres.sel(time=ds.time)
+    chunks = (
+        next(iter(ds.data_vars.values())).transpose("time", "y", "x").chunk().chunks
+    )
+    time_chunks, y_chunks, x_chunks = chunks
+
+    # Treat a single set of cutoffs as a single tide centre
+    has_centres = "tide_centre" in tide_cutoff_min.dims
+    if has_centres:
+        n_centres = len(tide_cutoff_min.tide_centre)
+    else:
+        n_centres = 1
+        tide_cutoff_min = tide_cutoff_min.expand_dims("tide_centre")
+        tide_cutoff_max = tide_cutoff_max.expand_dims("tide_centre")
+    mask_chunks = ((n_centres,), *chunks)
+
+    def _tide_mask_block(cutoff_min, cutoff_max, block_info=None):
+        # Interpolate tides into the extent of this chunk only
+        _, (t0, t1), (y0, y1), (x0, x1) = block_info[None]["array-location"]
+        tides = tides_lowres.isel(time=slice(t0, t1)).odc.reproject(
+            geobox[y0:y1, x0:x1], resampling=resampling
+        )
+        return (tides.values >= cutoff_min) & (tides.values <= cutoff_max)
+
+    # Broadcast cutoffs to match the shape and Dask chunks of `ds`
+    # (without copying data), then compute mask lazily for each chunk
+    cutoff_min, cutoff_max = (
+        dask.array.broadcast_to(
+            dask.array.from_array(
+                cutoff.transpose("tide_centre", "y", "x").values[:, None],
+                chunks=((n_centres,), (1,), y_chunks, x_chunks),
+            ),
+            shape=(n_centres, *map(sum, chunks)),
+            chunks=mask_chunks,
+        )
+        for cutoff in (tide_cutoff_min, tide_cutoff_max)
+    )
+    tide_bool = dask.array.map_blocks(
+        _tide_mask_block,
+        cutoff_min,
+        cutoff_max,
+        chunks=mask_chunks,
+        dtype=bool,
+    )
+
+    tide_bool = xr.DataArray(
+        tide_bool,
+        dims=["tide_centre", "time", "y", "x"],
+        coords={"time": ds.time, "y": ds.y, "x": ds.x},
+        name="tide_mask",
+    )
+
+    # Return with tide centre coordinates, or without for single cutoffs
+    if has_centres:
+        return tide_bool.assign_coords(tide_centre=tide_cutoff_min.tide_centre)
+    return tide_bool.squeeze("tide_centre", drop=True)
+
+
+def load_tidal_subset(year_ds, tide_cutoff_min, tide_cutoff_max):
+    """
+    For a given year of data, thresholds data to keep observations
+    within a minimum and maximum tide height cutoff range, and load
+    the data into memory.
+
+    Parameters:
+    -----------
+    year_ds : xarray.Dataset
+        An `xarray.Dataset` for a single epoch (typically annually)
+        containing a time series of water index data (e.g. MNDWI) and
+        tide heights (`tide_m`) for each pixel. Alternatively, tide
+        heights can be replaced by a boolean `tide_mask` variable that
+        has already been compared against tide cutoffs (see
+        `tide_mask`).
+    tide_cutoff_min, tide_cutoff_max : numeric or xarray.DataArray
+        Numeric values or 2D data arrays containing minimum and
+        maximum tide height values used to select a subset of
+        satellite observations for each individual pixel that fall
+        within this range. All pixels with tide heights outside of
+        this range will be set to `NaN`. Ignored if `year_ds`
+        contains a `tide_mask` variable.
+
+    Returns:
+    --------
+    year_ds : xarray.Dataset
+        An in-memory `xarray.Dataset` with pixels set to `NaN` if
+        they were acquired outside of the supplied tide height range.
+        If cutoffs (or `tide_mask`) contain multiple tide centres along
+        a "tide_centre" dimension, pixels are set to `NaN` if they were
+        acquired outside of every tide height range, and a boolean
+        `tide_mask` variable with "time", "tide_centre", "y" and "x"
+        dimensions identifies pixels within each individual range.
+    """
+
+    # Determine what pixels were acquired in selected tide range, and
+    # drop time-steps without any relevant pixels to reduce data to load
+    if "tide_mask" in year_ds:
+        tide_bool = year_ds.tide_mask
+        year_ds = year_ds.drop_vars("tide_mask")
+    else:
+        tide_bool = (year_ds.tide_m >= tide_cutoff_min) & (
+            year_ds.tide_m <= tide_cutoff_max
+        )
+
+    # For multiple tide centres, load pixels within any tide range
+    any_bool = tide_bool
+    if "tide_centre" in tide_bool.dims:
+        any_bool = tide_bool.any(dim="tide_centre")
+    year_ds = year_ds.sel(time=any_bool.sum(dim=["x", "y"]) > 0)
+
+    # Apply mask, and load in corresponding tide masked data
+    year_ds = year_ds.where(any_bool)
+    if "tide_centre" in tide_bool.dims and len(tide_bool.tide_centre) > 1:
+        year_ds["tide_mask"] = tide_bool.sel(time=year_ds.time).transpose(
+            "time", "tide_centre", "y", "x"
+        )
+    return year_ds.compute()
+
+
+def _composite_block(block):
+    """
+    Compute NaN-aware median, standard deviation and count along the
+    first (time) axis of a 3D block in a single pass over the data.
+
+    Sums are accumulated sequentially through time in the input dtype,
+    and medians taken from a single sort, which reproduces the results
+    of `xarray`'s NaN-skipping `median`, `std` and `count` reductions
+    (whether computed via NumPy or bottleneck) bit-for-bit.
+    """
+
+    n_times = block.shape[0]
+    valid = ~np.isnan(block)
+    count = valid.sum(axis=0)
+
+    # Return all-NaN outputs if there are no valid observations to
+    # reduce (e.g. in chunks outside the coastal zone)
+    if n_times == 0 or not valid.any():
+        empty = np.full(block.shape[1:], np.nan, dtype=block.dtype)
+        return empty, empty.copy(), count
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # Median: sorting pushes NaNs to the end of each pixel's time
+        # series, so the middle one or two values can be selected using
+        # each pixel's valid count (all-NaN pixels select a NaN)
+        ordered = np.sort(block, axis=0)
+        lower_idx = ((count - 1) // 2).clip(0, n_times - 1)
+        upper_idx = (count // 2).clip(0, n_times - 1)
+        lower = np.take_along_axis(ordered, lower_idx[None], axis=0)[0]
+        upper = np.take_along_axis(ordered, upper_idx[None], axis=0)[0]
+        median = (lower + upper) * 0.5
+        del ordered
+
+        # Standard deviation: two sequential passes through time
+        total = np.zeros(block.shape[1:], dtype=block.dtype)
+        for i in range(n_times):
+            total += np.where(valid[i], block[i], 0)
+        mean = (total / count).astype(block.dtype)
+
+        sum_sq = np.zeros(block.shape[1:], dtype=block.dtype)
+        for i in range(n_times):
+            diff = np.where(valid[i], block[i] - mean, 0)
+            sum_sq += diff * diff
+        stdev = np.sqrt((sum_sq / count).astype(block.dtype))
+
+    return median, stdev, count
+
+
+def fused_composite(array, block_size=2**23, workers=None):
+    """
+    Compute NaN-aware median, standard deviation and valid count along
+    the time axis of a 3D (time, y, x) array in a single fused pass.
+    The array is processed in blocks of rows in parallel threads, so
+    each block is read once and reduced while it is in cache.
+
+    Parameters:
+    -----------
+    array : numpy.ndarray
+        A 3D array with time as the first dimension.
+    block_size : int, optional
+        The approximate number of bytes of `array` to process in each
+        block. Defaults to 8 MB.
+    workers : int, optional
+        The number of threads used to process blocks in parallel.
+        Defaults to None, which uses the `ThreadPoolExecutor` default.
+
+    Returns:
+    --------
+    median, stdev, count : numpy.ndarray
+        2D arrays containing the median, standard deviation and count
+        of non-NaN values for each pixel.
+    """
+
+    n_times, n_rows, n_cols = array.shape
+    median = np.empty((n_rows, n_cols), dtype=array.dtype)
+    stdev = np.empty((n_rows, n_cols), dtype=array.dtype)
+    count = np.empty((n_rows, n_cols), dtype=np.int64)
+
+    # Identify row slices covering approximately `block_size` bytes
+    row_bytes = max(n_times * n_cols * array.itemsize, 1)
+    rows = max(1, block_size // row_bytes)
+    slices = [slice(i, i + rows) for i in range(0, n_rows, rows)]
+
+    def _process(rows):
+        median[rows], stdev[rows], count[rows] = _composite_block(array[:, rows])
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(_process, slices))
+
+    return median, stdev, count
+
+
+def composite_variables(water_indices):
+    """
+    List the output variables produced by `tidal_composite` for a
+    list of water indices: a median composite of each index, plus its
+    standard deviation and count of valid observations. Standard
+    deviations and counts of the first index are named "stdev" and
+    "count"; those of any additional index are suffixed with the
+    index name (e.g. "stdev_ndwi").
+    """
+
+    output_vars = list(water_indices)
+    for i, index in enumerate(water_indices):
+        suffix = "" if i == 0 else f"_{index}"
+        output_vars += [f"stdev{suffix}", f"count{suffix}"]
+    return output_vars
+
+
+def tidal_composite(
+    year_ds,
+    label,
+    label_dim,
+    output_dir,
+    output_suffix="",
+    export_geotiff=False,
+    backend="fused",
+    output_geobox=None,
+    output_store=None,
+    quantise=False,
+):
+    """
+    For a given year of data, takes median, counts and standard
+    deviation of valid water index results, and optionally writes
+    each water index, tide height, standard deviation and valid pixel
+    counts for the time period to file as GeoTIFFs or into a Zarr
+    store. If `year_ds` contains multiple water indices, statistics are
+    computed for each (see `composite_variables`).
+
+    Parameters:
+    -----------
+    year_ds : xarray.Dataset
+        A tide-masked `xarray.Dataset` containing a time series of
+        water index data (e.g. MNDWI) for a single epoch
+        (typically annually).
+    label : int, float or str
+        An int, float or string used to name the output variables and
+        files, For example, a year label for the data in `year_ds`.
+    label_dim : str
+        A string giving the name for the dimension that will be created
+        to contain labels supplied to `label`.
+    output_dir : str
+        The directory to output files for the specific analysis.
+    output_suffix : str
+        An optional suffix that will be used to identify certain
+        outputs. For example, outputs used for gapfilling data
+        can be differentiated from other outputs by supplying
+        `output_suffix='_gapfill'`. Defaults to '', which will not
         add a suffix to the output file names.
     output_geotiff : bool, optional
         Whether to export output files as GeoTIFFs. Defaults to False.
+    backend : str, optional
+        The compositing backend used to compute medians, standard
+        deviations and counts. Defaults to "fused", which computes all
+        three in a single parallel pass using `fused_composite`; "xarray"
+        uses three separate `xarray` reductions. Both produce identical
+        outputs.
+    output_geobox : GeoBox, optional
+        If provided, `year_ds` is treated as a spatial block of a larger
+        output grid defined by this geobox, and each output is written
+        into the corresponding window of an intermediate GeoTIFF
+        covering the entire grid (see `write_window`). These files must
+        then be converted to COGs using `finalise_cogs`. Defaults to
+        None, which writes the full extent of `year_ds` directly to COG.
+    output_store : str, optional
+        If provided, outputs are written into this Zarr store (created
+        using `init_composite_store`) instead of to GeoTIFFs, using
+        `label` as the year and `output_suffix` to identify annual or
+        gapfill composites. Defaults to None.
+    quantise : bool, optional
+        Whether to write water index and standard deviation outputs as
+        scaled int16 values rather than float32 (see
+        `quantise_composite`). Quantised GeoTIFFs are always written
+        via `write_window` so that scale and offset metadata can be
+        recorded. Defaults to False.
+
+    Returns:
+    --------
+    median_ds : xarray.Dataset
+        An in-memory `xarray.Dataset` containing output composite
+        arrays with a dimension labelled by `label` and `label_dim`.
+    """
+
+    # Compute median water indices and counts of valid pixels
+    if backend == "fused":
+        coords = {k: v for k, v in year_ds.coords.items() if "time" not in v.dims}
+        median_ds = xr.Dataset(coords=coords, attrs=year_ds.attrs)
+        stats_ds = xr.Dataset(coords=coords)
+        for i, (var_name, var) in enumerate(year_ds.data_vars.items()):
+            var = var.transpose("time", "y", "x")
+            median, stdev, count = fused_composite(var.values)
+            suffix = "" if i == 0 else f"_{var_name}"
+            median_ds[var_name] = (("y", "x"), median, var.attrs)
+            stats_ds[f"stdev{suffix}"] = (("y", "x"), stdev, var.attrs)
+            stats_ds[f"count{suffix}"] = (
+                ("y", "x"),
+                count.astype("int16"),
+                var.attrs,
+            )
+        median_ds = median_ds.assign(stats_ds)
+
+    elif backend == "xarray":
+        median_ds = year_ds.median(dim="time", keep_attrs=True)
+        for i, (var_name, var) in enumerate(year_ds.data_vars.items()):
+            suffix = "" if i == 0 else f"_{var_name}"
+            median_ds[f"stdev{suffix}"] = var.std(dim="time", keep_attrs=True)
+            median_ds[f"count{suffix}"] = var.count(dim="time", keep_attrs=True).astype(
+                "int16"
+            )
+
+    else:
+        raise ValueError(f"Unsupported compositing backend: {backend}")
+
+    # Set nodata values, using np.nan for floats and -999 for ints
+    for var_name, var in median_ds.data_vars.items():
+        median_ds[var_name].attrs["nodata"] = -999 if var.dtype == "int16" else np.nan
+
+    # Load data into memory
+    median_ds.load()
+
+    # Write outputs to file
+    export_composite(
+        median_ds,
+        label,
+        output_dir,
+        output_suffix=output_suffix,
+        export_geotiff=export_geotiff,
+        output_geobox=output_geobox,
+        output_store=output_store,
+        quantise=quantise,
+    )
+
+    # Set coordinate and dim
+    median_ds = median_ds.assign_coords(**{label_dim: label}).expand_dims(label_dim)
+
+    return median_ds
+
+
+def export_composite(
+    median_ds,
+    label,
+    output_dir,
+    output_suffix="",
+    export_geotiff=False,
+    output_geobox=None,
+    output_store=None,
+    quantise=False,
+):
+    """
+    Write an in-memory composite produced by `tidal_composite` to file
+    as GeoTIFFs and/or into a Zarr store. This is separated from
+    compositing so that outputs can be written in a background thread
+    while the next composite is computed (see `export_annual_gapfill`).
+
+    Parameters:
+    -----------
+    median_ds : xarray.Dataset
+        An in-memory dataset of 2D composite arrays.
+    label, output_dir, output_suffix, export_geotiff, output_geobox,
+    output_store, quantise :
+        As described in `tidal_composite`.
+    """
+
+    # Optionally quantise outputs to reduce file sizes
+    output_ds = quantise_composite(median_ds) if quantise else median_ds
+
+    # Write each variable to file
+    if export_geotiff:
+        for i in output_ds:
+            fname = f"{output_dir}/{str(label)}_{i}{output_suffix}.tif"
+            if output_geobox is not None:
+                write_window(output_ds[i], fname=fname, geobox=output_geobox)
+            elif quantise:
+                write_window(output_ds[i], fname=fname, geobox=output_ds.odc.geobox)
+                finalise_cog(f"{fname}.partial")
+            else:
+                write_cog(geo_im=output_ds[i], fname=fname, overwrite=True)
+
+    # Write all variables into Zarr store
+    if output_store is not None:
+        write_composite(
+            median_ds,
+            output_store,
+            year=label,
+            composite="gapfill" if output_suffix.startswith("_gapfill") else "annual",
+            output_geobox=output_geobox,
+        )
+
+
+def quantise_composite(median_ds, scale=1e-4, nodata=-32768):
+    """
+    Quantise floating point composite outputs (e.g. water index and
+    standard deviation) into int16 values to halve storage size. Values
+    are divided by `scale` and rounded, and `NaN` values are set to
+    `nodata`. Integer outputs (e.g. valid pixel counts) are unchanged.
+
+    Scale, offset and nodata values are recorded in each variable's
+    attributes as `scale_factor`, `add_offset` and `nodata`, and are
+    used by `coastlines.vector.load_rasters` to decode outputs back to
+    floating point values. With the default scale of 0.0001, water
+    index values between -1 and 1 are stored to within 0.00005.
+
+    Parameters:
+    -----------
+    median_ds : xarray.Dataset
+        A dataset of composite outputs, as produced by `tidal_composite`.
+    scale : float, optional
+        The scale factor used to quantise values. Defaults to 0.0001.
+    nodata : int, optional
+        The int16 value used to represent `NaN`. Defaults to -32768.
+
+    Returns:
+    --------
+    xarray.Dataset
+        A dataset with floating point variables quantised to int16.
+    """
+
+    quantised_ds = median_ds.copy()
+    info = np.iinfo("int16")
+
+    for var_name, var in median_ds.data_vars.items():
+        if var.dtype.kind != "f":
+            continue
+
+        values = np.round(var.values / scale)
+        values = np.clip(values, info.min + 1, info.max)
+        values = np.where(np.isnan(values), nodata, values).astype("int16")
+        attrs = dict(var.attrs, nodata=nodata, scale_factor=scale, add_offset=0.0)
+        quantised_ds[var_name] = (var.dims, values, attrs)
+
+    return quantised_ds
+
+
+def _insert_year(buffers, slot, year_ds):
+    """
+    Write a tide-masked year of data into a slot of the per-variable
+    gapfill ring buffers, padding any unused timesteps in the slot with
+    `NaN` (or False for boolean tide masks). Buffers are grown (and
+    existing slots preserved) if the year contains more timesteps than
+    the current slot capacity. If `year_ds` is None, the slot is
+    cleared to represent a year with no available data.
+    """
+
+    n_times = 0 if year_ds is None else len(year_ds.time)
+
+    for var_name, buffer in buffers.items():
+        fill = False if buffer.dtype == bool else np.nan
+
+        # Grow all three slots if this year will not fit
+        if n_times > buffer.shape[1]:
+            grown = np.full((3, n_times, *buffer.shape[2:]), fill, dtype=buffer.dtype)
+            grown[:, : buffer.shape[1]] = buffer
+            buffers[var_name] = buffer = grown
+
+        # Copy data directly into the slot, then clear any leftover
+        # observations from the year previously held in this slot
+        if n_times > 0:
+            buffer[slot, :n_times] = year_ds[var_name].values
+        buffer[slot, n_times:] = fill
+
+
+def _buffer_ds(buffers, index, template, tide_centre_index=None):
+    """
+    Wrap a view into the gapfill ring buffers as an `xarray.Dataset`
+    with a "time" dimension, without copying any data. Unused
+    (NaN-padded) timesteps do not affect NaN-aware composites.
+
+    If `tide_centre_index` is provided, data is instead copied and
+    masked to pixels within the tide range of that tide centre, using
+    the boolean `tide_mask` buffer.
+    """
+
+    def _view(buffer):
+        # Select a single slot, or flatten all three slots together
+        if index is not None:
+            return buffer[index]
+        return buffer.reshape(-1, *buffer.shape[2:])
+
+    if tide_centre_index is not None:
+        tide_bool = _view(buffers["tide_mask"])[:, tide_centre_index]
+
+    data_vars = {}
+    for var_name in template.data_vars:
+        view = _view(buffers[var_name])
+        if tide_centre_index is not None:
+            view = np.where(tide_bool, view, np.nan)
+
+        data_vars[var_name] = xr.DataArray(
+            view,
+            dims=["time", "y", "x"],
+            coords=template.coords,
+            attrs=template[var_name].attrs,
+        )
+
+    return xr.Dataset(data_vars)
+
+
+def _datum_path(path, suffix):
+    """
+    Insert a tide datum suffix before the extension of a path, e.g.
+    "composites.zarr" to "composites_datum_1.50.zarr".
+    """
+
+    if path is None:
+        return None
+    root, ext = os.path.splitext(path)
+    return f"{root}{suffix}{ext}"
+
+
+def _composite_outputs(ds, year, output_suffix="", output_store=None):
+    """
+    List the output files (relative to the output directory) written
+    for a single annual or three-year gapfill composite, matching the
+    variables and file names written by `tidal_composite`.
+    """
+
+    if output_store is not None:
+        return [os.path.basename(output_store)]
+
+    index_vars = ds.drop_vars(["tide_m", "tide_mask"], errors="ignore").data_vars
+    return [f"{year}_{i}{output_suffix}.tif" for i in composite_variables(index_vars)]
+
+
+def load_manifest(manifest_path, settings):
+    """
+    Load a manifest recording which annual and three-year gapfill
+    composites have already been completed for a study area, so that
+    an interrupted run can be resumed without recomputing them.
+
+    Composites are only treated as complete if the manifest was created
+    using identical `settings`, and if all of their recorded output
+    files still exist on disk. If the manifest is missing, truncated or
+    corrupt, an empty manifest is returned.
+
+    Parameters:
+    -----------
+    manifest_path : str
+        The path of the JSON manifest file. Output files recorded in
+        the manifest are relative to this file's directory.
+    settings : dict
+        A JSON-serialisable dictionary of the processing settings that
+        affect composite outputs (e.g. years, quantisation).
+
+    Returns:
+    --------
+    manifest : dict
+        A dictionary with "settings" and "completed" keys. "completed"
+        maps each composite type (e.g. "annual", or "gapfill_datum_1.50"
+        for a non-default tide datum) to a dictionary of completed
+        years (as strings) and their lists of output files.
+    """
+
+    manifest = {"settings": settings, "completed": {}}
+
+    # Read existing manifest, ignoring missing, truncated or otherwise
+    # unreadable files (e.g. invalid JSON or text encoding)
+    try:
+        with open(manifest_path) as f:
+            existing = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return manifest
+
+    # Discard manifests created with different settings, or that do not
+    # have the expected structure
+    if (
+        not isinstance(existing, dict)
+        or existing.get("settings") != json.loads(json.dumps(settings))
+        or not isinstance(existing.get("completed"), dict)
+    ):
+        return manifest
+
+    # Keep composites whose outputs are all present on disk
+    output_dir = os.path.dirname(manifest_path)
+    for composite, completed in existing["completed"].items():
+        if not isinstance(completed, dict):
+            continue
+        manifest["completed"][composite] = {
+            year: outputs
+            for year, outputs in completed.items()
+            if isinstance(outputs, list)
+            and all(os.path.exists(os.path.join(output_dir, i)) for i in outputs)
+        }
+
+    return manifest
+
+
+def update_manifest(manifest_path, manifest, year, composite, outputs):
+    """
+    Record a completed composite in a manifest (see `load_manifest`),
+    and write the manifest to file. The manifest is written to a
+    temporary file first so it is never left in a partially written
+    state if a run is interrupted.
+
+    Parameters:
+    -----------
+    manifest_path : str
+        The path of the JSON manifest file.
+    manifest : dict
+        The manifest to update, as returned by `load_manifest`.
+    year : int
+        The year of the completed composite.
+    composite : str
+        The type of composite; either "annual" or "gapfill", followed
+        by any tide datum suffix (see `datum_suffix`).
+    outputs : list
+        Output files written for the composite, relative to the
+        manifest file's directory.
+    """
+
+    manifest["completed"].setdefault(composite, {})[str(year)] = list(outputs)
+
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def export_annual_gapfill(
+    ds,
+    output_dir,
+    tide_cutoff_min,
+    tide_cutoff_max,
+    start_year,
+    end_year,
+    output_geobox=None,
+    output_store=None,
+    quantise=False,
+    manifest=None,
+    manifest_path=None,
+    write_threads=2,
+):
+    """
+    To calculate both annual median composites and three-year gapfill
+    composites without having to load more than three years in memory
+    at the one time, this function loops through the years in the
+    dataset, progressively updating a three-slot ring buffer (holding
+    the previous year, current year and subsequent year of data).
+
+    Each year is written once into its slot of a reusable buffer, so
+    annual composites are computed from a view of a single slot and
+    gapfill composites from a view across all three slots, without
+    concatenating or copying the underlying data.
+
+    If tide cutoffs are provided for multiple tide centres (i.e. along
+    a "tide_centre" dimension; see `tide_cutoffs`), each year is loaded
+    once, and composites are generated for every tide centre from the
+    same buffers. Outputs for each tide centre are labelled using
+    `datum_suffix`.
+
+    Outputs are compressed and written by a pool of background threads
+    while subsequent years are loaded and composited. The number of
+    queued writes is bounded so that finished composites cannot
+    accumulate in memory, and all writes are completed (and any write
+    errors raised) before this function returns. Composites are only
+    recorded in `manifest` once their outputs have been written.
+
+    Parameters:
+    -----------
+    ds : xarray.Dataset
+        A tide-masked `xarray.Dataset` containing a time series of
+        water index data (e.g. MNDWI).
+    output_dir : str
+        The directory to output files for the specific analysis.
+    tide_cutoff_min, tide_cutoff_max : numeric or xarray.DataArray
+        Numeric values or 2D data arrays containing minimum and
+        maximum tide height values used to select a subset of
+        satellite observations for each individual pixel that fall
+        within this range. All pixels with tide heights outside of
+        this range will be set to `NaN`. Data arrays may contain an
+        additional "tide_centre" dimension; otherwise, outputs are
+        labelled as the default 0.0 m tide datum.
+    start_year, end year : int
+        The first and last years you wish to export annual median
+        composites and three-year gapfill composites for.
+    output_geobox : GeoBox, optional
+        If `ds` is a spatial block of a larger output grid, the geobox
+        of the full grid. Composites will then be written into windows
+        of intermediate GeoTIFFs rather than directly to COG (see
+        `tidal_composite`). Defaults to None.
+    output_store : str, optional
+        If provided, composites are written into this Zarr store
+        (created using `init_composite_store`) instead of to GeoTIFFs.
+        Composites for non-default tide centres are written into
+        separate stores labelled using `datum_suffix`. Defaults to None.
+    quantise : bool, optional
+        Whether to write water index and standard deviation outputs as
+        scaled int16 values (see `quantise_composite`). Defaults to
+        False.
+    manifest : dict, optional
+        A manifest of previously completed composites, as returned by
+        `load_manifest`. Completed composites are skipped, and years of
+        data are only loaded if required by a remaining composite.
+        Defaults to None, which generates all composites.
+    manifest_path : str, optional
+        If provided, each composite is recorded in `manifest` and
+        written to this path as soon as it is completed (see
+        `update_manifest`). Defaults to None.
+    write_threads : int, optional
+        The number of background threads used to write outputs. Up to
+        twice this number of composites can be queued for writing
+        before compositing waits for writes to finish. Defaults to 2;
+        set to 0 to write outputs synchronously.
+
+    Returns:
+    --------
+    generated : list
+        A list of `(year, composite, outputs)` tuples for each
+        composite generated, as recorded by `update_manifest`.
+    """
+
+    if manifest is None:
+        manifest = {"completed": {}}
+
+    def completed(year, composite):
+        return str(year) in manifest["completed"].get(composite, {})
+
+    # Identify tide centres, treating a single set of cutoffs as the
+    # default tide datum
+    tide_centres = [0.0]
+    if isinstance(tide_cutoff_min, xr.DataArray) and (
+        "tide_centre" in tide_cutoff_min.dims
+    ):
+        tide_centres = tide_cutoff_min.tide_centre.values.tolist()
+    multiple_centres = len(tide_centres) > 1
+
+    # Identify composites to generate for each tide centre: annual
+    # composites from the year before `start_year`, and gapfill
+    # composites from `start_year` onward
+    composites = []
+    for i, tide_centre in enumerate(tide_centres):
+        suffix = datum_suffix(tide_centre)
+        centre_index = i if multiple_centres else None
+        composites += [
+            ("annual", suffix, centre_index, start_year - 1),
+            ("gapfill", suffix, centre_index, start_year),
+        ]
+
+    # Identify the years of data required by each remaining composite;
+    # annual composites require only the current year, while gapfill
+    # composites also require the previous and subsequent year
+    required_years = set()
+    for composite, suffix, _, first_year in composites:
+        for year in range(first_year, end_year + 1):
+            if completed(year, f"{composite}{suffix}"):
+                continue
+            elif composite == "annual":
+                required_years.add(year)
+            else:
+                required_years.update([year - 1, year, year + 1])
+
+    # Template used to wrap buffer views with spatial coordinates and
+    # attributes; tide heights are not needed for compositing
+    template = ds.drop_vars(
+        ["tide_m", "tide_mask", "tide_centre"], errors="ignore"
+    ).isel(time=0, drop=True)
+
+    # Create ring buffers with one slot for each of the previous,
+    # current and future year of un-composited data. Slots are
+    # allocated with zero capacity, and grown to fit the largest
+    # tide-masked year encountered so that no more than 3 years of data
+    # are held in memory at any one time
+    buffers = {
+        var_name: np.empty((3, 0, len(ds.y), len(ds.x)), dtype=var.dtype)
+        for var_name, var in template.data_vars.items()
+    }
+
+    # For multiple tide centres, data is buffered once for all centres,
+    # alongside a boolean mask of pixels within each centre's cutoffs
+    if multiple_centres:
+        buffers["tide_mask"] = np.empty(
+            (3, 0, len(tide_centres), len(ds.y), len(ds.x)), dtype=bool
+        )
+
+    generated = []
+
+    # Queue of background writes that have not yet been recorded
+    pending = deque()
+
+    def _finish_writes(max_pending=0):
+        # Wait for the oldest writes to finish (raising any write errors)
+        # until no more than `max_pending` remain, then record their
+        # composites as complete
+        while len(pending) > max_pending:
+            future, record = pending.popleft()
+            future.result()
+            generated.append(record)
+            if manifest_path is not None:
+                update_manifest(manifest_path, manifest, *record)
+
+    # Iterate through each year in the dataset, starting at one year before
+    with ThreadPoolExecutor(max_workers=max(write_threads, 1)) as executor:
+        for year in np.arange(start_year - 2, end_year + 1):
+            # Skip loading years that are not required by any remaining
+            # composite (e.g. when resuming an interrupted run)
+            if year + 1 not in required_years:
+                future_ds = None
+
+            else:
+                try:
+                    # Load data for the subsequent year; drop tide variable
+                    # as we do not need to create annual composites from
+                    # this data
+                    future_ds = load_tidal_subset(
+                        ds.sel(time=str(year + 1)),
+                        tide_cutoff_min=tide_cutoff_min,
+                        tide_cutoff_max=tide_cutoff_max,
+                    ).drop_vars("tide_m", errors="ignore")
+
+                except KeyError:
+                    # Use an empty year if error is raised due to no data
+                    # being available for time period
+                    future_ds = None
+
+            # Insert subsequent year into its ring buffer slot, replacing
+            # data from three years prior that is no longer required
+            _insert_year(buffers, (year + 1) % 3, future_ds)
+
+            # Once the current year has been loaded, combine its
+            # observations into annual median composites. Once ALL of the
+            # previous, current and future years have been loaded, combine
+            # these three years of observations into a single median
+            # 3-year gapfill composite
+            for composite, suffix, centre_index, first_year in composites:
+                if year < first_year or completed(year, f"{composite}{suffix}"):
+                    continue
+
+                # Generate composite from a view of the current year's
+                # slot, or across all three slots for gapfill composites
+                if composite == "annual":
+                    index, output_suffix = year % 3, suffix
+                else:
+                    index, output_suffix = None, f"_gapfill{suffix}"
+                median_ds = tidal_composite(
+                    _buffer_ds(buffers, index, template, centre_index),
+                    label=year,
+                    label_dim="year",
+                    output_dir=output_dir,
+                ).squeeze("year", drop=True)
+
+                # Write outputs in the background, waiting for older
+                # writes to finish if too many are queued
+                store = _datum_path(output_store, suffix)
+                future = executor.submit(
+                    export_composite,
+                    median_ds,
+                    year,
+                    output_dir,
+                    output_suffix=output_suffix,
+                    export_geotiff=output_store is None,
+                    output_geobox=output_geobox,
+                    output_store=store,
+                    quantise=quantise,
+                )
+                outputs = _composite_outputs(ds, year, output_suffix, store)
+                pending.append((future, (year, f"{composite}{suffix}", outputs)))
+                _finish_writes(max_pending=2 * write_threads)
+
+        # Finish all remaining writes before returning
+        _finish_writes()
+
+    return generated
+
+
+def write_window(da, fname, geobox, blocksize=512):
+    """
+    Write a 2D spatial block of data into the corresponding window of
+    an intermediate GeoTIFF covering the full extent of `geobox`. The
+    intermediate file (`fname` with a ".partial" suffix) is created on
+    the first write, and is tiled but uncompressed so that windows can
+    be cheaply rewritten. Once all blocks have been written, use
+    `finalise_cogs` to convert intermediate files into compressed COGs.
+
+    Parameters:
+    -----------
+    da : xarray.DataArray
+        A 2D array containing a spatial block of data to write. The
+        block must be aligned with the pixel grid of `geobox`.
+    fname : str
+        The path of the final output COG.
+    geobox : GeoBox
+        The geobox defining the full extent of the output file.
+    blocksize : int, optional
+        The size of internal GeoTIFF tiles. Defaults to 512.
+    """
+
+    partial_fname = f"{fname}.partial"
+
+    # Create intermediate file covering the full output extent
+    if not os.path.exists(partial_fname):
+        height, width = geobox.shape
+        with rasterio.open(
+            partial_fname,
+            mode="w",
+            driver="GTiff",
+            width=width,
+            height=height,
+            count=1,
+            dtype=da.dtype.name,
+            crs=str(geobox.crs),
+            transform=geobox.transform,
+            nodata=da.attrs.get("nodata"),
+            tiled=True,
+            blockxsize=blocksize,
+            blockysize=blocksize,
+            BIGTIFF="IF_SAFER",
+        ) as dst:
+            # Record scale and offset metadata for quantised data
+            if "scale_factor" in da.attrs:
+                dst.scales = (da.attrs["scale_factor"],)
+                dst.offsets = (da.attrs.get("add_offset", 0.0),)
+
+    # Identify window in full extent using the block's top-left corner
+    col_off, row_off = ~geobox.transform * (
+        da.odc.geobox.transform.c,
+        da.odc.geobox.transform.f,
+    )
+    window = Window(round(col_off), round(row_off), len(da.x), len(da.y))
+
+    with rasterio.open(partial_fname, mode="r+") as dst:
+        dst.write(da.transpose("y", "x").values, 1, window=window)
+
+
+def finalise_cog(partial_path, blocksize=512, overview_resampling="nearest"):
+    """
+    Convert a single intermediate GeoTIFF written by `write_window`
+    into a compressed Cloud Optimised GeoTIFF, using the same creation
+    options, overview levels and overview resampling as
+    `datacube.utils.cog.write_cog`. The intermediate file is removed
+    once converted.
+
+    Parameters:
+    -----------
+    partial_path : str
+        The path of the intermediate ".partial" GeoTIFF.
+    blocksize : int, optional
+        The size of internal GeoTIFF tiles and overview tiles.
+        Defaults to 512.
+    overview_resampling : str, optional
+        The resampling method used to compute overviews. Defaults
+        to "nearest".
+    """
 
-    Returns:
-    --------
-    median_ds : xarray.Dataset
-        An in-memory `xarray.Dataset` containing output composite
-        arrays with a dimension labelled by `label` and `label_dim`.
+    fname = partial_path[: -len(".partial")]
+
+    with rasterio.Env(GDAL_TIFF_OVR_BLOCKSIZE=blocksize):
+        with rasterio.open(partial_path, mode="r+") as src:
+            # Add overviews (skipped for small arrays, as per `write_cog`)
+            if min(src.width, src.height) >= 512:
+                src.build_overviews(
+                    [2**i for i in range(1, 6)],
+                    rasterio.enums.Resampling[overview_resampling],
+                )
+
+            # Copy into final compressed COG
+            rio_copy(
+                src,
+                fname,
+                driver="GTiff",
+                copy_src_overviews=True,
+                tiled=True,
+                blockxsize=min(blocksize, -(-src.width // 16) * 16),
+                blockysize=min(blocksize, -(-src.height // 16) * 16),
+                compress="DEFLATE",
+                zlevel=6,
+                predictor=3 if np.dtype(src.dtypes[0]).kind == "f" else 2,
+            )
+
+    os.remove(partial_path)
+
+
+def finalise_cogs(output_dir, blocksize=512, overview_resampling="nearest"):
     """
+    Convert all intermediate GeoTIFFs written by `write_window` in a
+    directory into compressed Cloud Optimised GeoTIFFs (see
+    `finalise_cog`).
 
-    # Compute median water indices and counts of valid pixels
-    median_ds = year_ds.median(dim="time", keep_attrs=True)
-    median_ds["stdev"] = year_ds.mndwi.std(dim="time", keep_attrs=True)
-    median_ds["count"] = year_ds.mndwi.count(dim="time", keep_attrs=True).astype(
-        "int16"
+    Parameters:
+    -----------
+    output_dir : str
+        The directory containing intermediate ".partial" GeoTIFFs.
+    blocksize : int, optional
+        The size of internal GeoTIFF tiles and overview tiles.
+        Defaults to 512.
+    overview_resampling : str, optional
+        The resampling method used to compute overviews. Defaults
+        to "nearest".
+    """
+
+    partial_fnames = sorted(
+        f for f in os.listdir(output_dir) if f.endswith(".tif.partial")
     )
 
-    # Set nodata values, using np.nan for floats and -999 for ints
-    for var_name, var in median_ds.data_vars.items():
-        median_ds[var_name].attrs["nodata"] = -999 if var.dtype == "int16" else np.nan
+    for partial_fname in partial_fnames:
+        finalise_cog(
+            os.path.join(output_dir, partial_fname),
+            blocksize=blocksize,
+            overview_resampling=overview_resampling,
+        )
 
-    # Load data into memory
-    median_ds.load()
 
-    # Write each variable to file
-    if export_geotiff:
-        for i in median_ds:
-            write_cog(
-                geo_im=median_ds[i],
-                fname=f"{output_dir}/{str(label)}_{i}{output_suffix}.tif",
-                overwrite=True,
+def init_composite_store(store, ds, years, chunk_size=1024, quantise=False):
+    """
+    Create an empty Zarr store that will hold annual and three-year
+    gapfill composites for every year of a study area, as an alternative
+    to writing individual COGs. The store contains a variable for each
+    output of `tidal_composite` (see `composite_variables`), each with
+    "composite" ("annual" and "gapfill"), "year", "y" and "x" dimensions.
+
+    Only store metadata is written; composites are then written into
+    the store one year at a time using `write_composite`. Unwritten
+    composites are read back as nodata.
+
+    Parameters:
+    -----------
+    store : str
+        The path of the Zarr store to create. Any existing store at
+        this path is overwritten.
+    ds : xarray.Dataset
+        A dataset containing a time series of water index data (e.g.
+        MNDWI), used to define the variables, data types and spatial
+        coordinates of the store.
+    years : list
+        The years that composites will be written for.
+    chunk_size : int, optional
+        The size in pixels of square spatial chunks in the store.
+        Each chunk contains a single year and composite type.
+        Defaults to 1024.
+    quantise : bool, optional
+        Whether the store will hold quantised water index and standard
+        deviation outputs (see `quantise_composite`). Defaults to False.
+    """
+
+    # Identify output variables and their nodata values, matching those
+    # written by `tidal_composite`
+    index_vars = ds.drop_vars(["tide_m", "tide_mask"], errors="ignore").data_vars
+    var_dtypes = {
+        name: np.int16 if name.startswith("count") else np.float32
+        for name in composite_variables(index_vars)
+    }
+    var_dtypes.update({name: var.dtype for name, var in index_vars.items()})
+
+    shape = (2, len(years), len(ds.y), len(ds.x))
+    chunks = (1, 1, min(chunk_size, len(ds.y)), min(chunk_size, len(ds.x)))
+    data_vars, encoding = {}, {}
+    for name, dtype in var_dtypes.items():
+        nodata = -999 if np.dtype(dtype) == np.int16 else np.nan
+        data_vars[name] = (
+            ("composite", "year", "y", "x"),
+            dask.array.full(shape, nodata, dtype=dtype, chunks=chunks),
+            {"nodata": nodata},
+        )
+        encoding[name] = {"chunks": chunks, "_FillValue": nodata}
+
+    # Quantise floating point variables using the same scale and nodata
+    # values as `quantise_composite`; values are scaled and rounded by
+    # xarray's CF encoding as each composite is written
+    if quantise:
+        template = quantise_composite(
+            xr.Dataset(
+                {k: (("y", "x"), np.empty((0, 0), v)) for k, v in var_dtypes.items()}
             )
+        )
+        for name, var in template.data_vars.items():
+            if "scale_factor" in var.attrs:
+                data_vars[name][2]["nodata"] = var.attrs["nodata"]
+                encoding[name].update(
+                    dtype=var.dtype,
+                    scale_factor=var.attrs["scale_factor"],
+                    add_offset=var.attrs["add_offset"],
+                    _FillValue=var.attrs["nodata"],
+                )
+
+    # Write metadata and coordinates only, without writing any data
+    coords = {"composite": ["annual", "gapfill"], "year": list(years)}
+    coords.update(
+        {
+            k: v
+            for k, v in ds.coords.items()
+            if "time" not in v.dims and "tide_centre" not in v.dims
+        }
+    )
+    xr.Dataset(data_vars, coords=coords).to_zarr(
+        store, mode="w", encoding=encoding, compute=False
+    )
 
-    # Set coordinate and dim
-    median_ds = median_ds.assign_coords(**{label_dim: label}).expand_dims(label_dim)
 
-    return median_ds
+def write_composite(median_ds, store, year, composite, output_geobox=None):
+    """
+    Write a single annual or three-year gapfill composite into the
+    corresponding region of a Zarr store created by
+    `init_composite_store`.
 
+    Parameters:
+    -----------
+    median_ds : xarray.Dataset
+        A dataset of 2D composite arrays, as produced by
+        `tidal_composite`. This may be a spatial block of the store's
+        extent, in which case `output_geobox` must be provided.
+    store : str
+        The path of the Zarr store to write into.
+    year : int
+        The year of the composite.
+    composite : str
+        The type of composite; either "annual" or "gapfill".
+    output_geobox : GeoBox, optional
+        If `median_ds` is a spatial block of a larger output grid, the
+        geobox of the full grid. Defaults to None, which writes
+        `median_ds` into the entire spatial extent of the store.
+    """
 
-def export_annual_gapfill(
-    ds, output_dir, tide_cutoff_min, tide_cutoff_max, start_year, end_year
+    # Identify position of composite and year in store
+    with xr.open_zarr(store) as existing:
+        composite_index = list(existing.composite.values).index(composite)
+        year_index = list(existing.year.values).index(year)
+
+    # Identify window in full extent using the block's top-left corner
+    col_off, row_off = 0, 0
+    if output_geobox is not None:
+        col_off, row_off = ~output_geobox.transform * (
+            median_ds.odc.geobox.transform.c,
+            median_ds.odc.geobox.transform.f,
+        )
+        col_off, row_off = round(col_off), round(row_off)
+
+    # Write data variables only, as coordinates and attributes were
+    # written when the store was created
+    region_ds = median_ds.transpose("y", "x").drop_vars(list(median_ds.coords))
+    region_ds = region_ds.expand_dims(["composite", "year"])
+    for var in region_ds.data_vars.values():
+        var.attrs = {}
+    region_ds.to_zarr(
+        store,
+        mode="r+",
+        region={
+            "composite": slice(composite_index, composite_index + 1),
+            "year": slice(year_index, year_index + 1),
+            "y": slice(row_off, row_off + len(median_ds.y)),
+            "x": slice(col_off, col_off + len(median_ds.x)),
+        },
+    )
+
+
+def export_annual_gapfill_blocked(
+    ds,
+    tides_lowres,
+    output_dir,
+    tide_centre,
+    start_year,
+    end_year,
+    block_size,
+    output_store=None,
+    quantise=False,
+    manifest=None,
+    manifest_path=None,
+    write_threads=2,
+    log=None,
 ):
     """
-    To calculate both annual median composites and three-year gapfill
-    composites without having to load more than three years in memory
-    at the one time, this function loops through the years in the
-    dataset, progressively updating three datasets (the previous year,
-    current year and subsequent year of data).
+    Streaming version of `export_annual_gapfill` that processes the
+    dataset in spatial blocks to bound peak memory use. For each block,
+    tide heights and tide cutoffs are interpolated into the extent of
+    the block, then annual and three-year gapfill composites are
+    generated for every year and written into windows of the final
+    output rasters. Peak memory therefore scales with `block_size`
+    rather than with the extent of the entire dataset.
 
     Parameters:
     -----------
     ds : xarray.Dataset
-        A tide-masked `xarray.Dataset` containing a time series of
-        water index data (e.g. MNDWI).
+        A lazily-loaded (i.e. Dask-backed) `xarray.Dataset` containing
+        a time series of water index data (e.g. MNDWI).
+    tides_lowres : xarray.DataArray
+        A low-res `xarray.DataArray` containing tide heights for each
+        timestep in `ds`, as produced by the `model_box_tides` function.
+        This may contain additional timesteps not present in `ds` (for
+        example, timesteps removed by `tide_prefilter`), which are used
+        when computing tide cutoffs.
     output_dir : str
         The directory to output files for the specific analysis.
-    tide_cutoff_min, tide_cutoff_max : numeric or xarray.DataArray
-        Numeric values or 2D data arrays containing minimum and
-        maximum tide height values used to select a subset of
-        satellite observations for each individual pixel that fall
-        within this range. All pixels with tide heights outside of
-        this range will be set to `NaN`.
+    tide_centre : float or list of floats
+        The central tide height used to compute the min and max
+        tide height cutoffs (see `tide_cutoffs`). If a list is
+        provided, composites are generated for each tide centre.
     start_year, end year : int
         The first and last years you wish to export annual median
         composites and three-year gapfill composites for.
+    block_size : int
+        The size in pixels of the square spatial blocks to process.
+        Ideally, this should be a multiple of the Dask chunk size of
+        `ds` to avoid reading the same chunks more than once.
+    output_store : str, optional
+        If provided, composites are written into regions of this Zarr
+        store (created using `init_composite_store`) instead of to COGs.
+        Defaults to None.
+    quantise : bool, optional
+        Whether to write water index and standard deviation outputs as
+        scaled int16 values (see `quantise_composite`). Defaults to
+        False.
+    manifest : dict, optional
+        A manifest of previously completed composites, as returned by
+        `load_manifest`. Completed composites are skipped. Defaults to
+        None, which generates all composites.
+    manifest_path : str, optional
+        If provided, remaining composites are recorded in `manifest`
+        and written to this path once all blocks have been processed
+        and outputs finalised (see `update_manifest`). Defaults to None.
+    write_threads : int, optional
+        The number of background threads used to write outputs (see
+        `export_annual_gapfill`). Defaults to 2.
+    log : logging.Logger, optional
+        Logger used to report progress.
     """
 
-    # Create empty vars containing un-composited data from the previous,
-    # current and future year. This is progressively updated to ensure that
-    # no more than 3 years of data are loaded into memory at any one time
-    previous_ds = None
-    current_ds = None
-    future_ds = None
+    if log is None:
+        log = configure_logging()
 
-    # Iterate through each year in the dataset, starting at one year before
-    for year in np.arange(start_year - 2, end_year + 1):
-        try:
-            # Load data for the subsequent year; drop tide variable as
-            # we do not need to create annual composites from this data
-            future_ds = load_tidal_subset(
-                ds.sel(time=str(year + 1)),
-                tide_cutoff_min=tide_cutoff_min,
-                tide_cutoff_max=tide_cutoff_max,
-            ).drop_vars("tide_m")
-
-        except KeyError:
-            # Create empty array if error is raised due to no data being
-            # available for time period
-            future_ds = xr.DataArray(
-                data=np.empty(shape=(0, len(ds.y), len(ds.x))),
-                dims=["time", "y", "x"],
-                coords={"x": ds.x, "y": ds.y, "time": []},
-                name="mndwi",
-            ).to_dataset()
-
-            # Ensure that time uses the correct datetime dtype so we
-            # can combine this empty array with our data data
-            future_ds["time"] = future_ds.time.astype(np.dtype("datetime64[ms]"))
-
-        # If the current year var contains data, combine these observations
-        # into annual median composites and export GeoTIFFs
-        if current_ds:
-            # Generate composite
-            tidal_composite(
-                current_ds,
-                label=year,
-                label_dim="year",
-                output_dir=output_dir,
-                export_geotiff=True,
-            )
+    # Remove any intermediate files left over from previous runs
+    for fname in os.listdir(output_dir):
+        if fname.endswith(".tif.partial"):
+            os.remove(os.path.join(output_dir, fname))
 
-        # If ALL of the previous, current and future year vars contain data,
-        # combine these three years of observations into a single median
-        # 3-year gapfill composite
-        if previous_ds and current_ds and future_ds:
-            # Concatenate the three years into one xarray.Dataset
-            gapfill_ds = xr.concat([previous_ds, current_ds, future_ds], dim="time")
-
-            # Generate composite
-            tidal_composite(
-                gapfill_ds,
-                label=year,
-                label_dim="year",
-                output_dir=output_dir,
-                output_suffix="_gapfill",
-                export_geotiff=True,
-            )
+    output_geobox = ds.odc.geobox
+    y_starts = range(0, len(ds.y), block_size)
+    x_starts = range(0, len(ds.x), block_size)
+    n_blocks = len(y_starts) * len(x_starts)
+
+    for i, (y_start, x_start) in enumerate((y, x) for y in y_starts for x in x_starts):
+        block_ds = ds.isel(
+            y=slice(y_start, y_start + block_size),
+            x=slice(x_start, x_start + block_size),
+        )
 
-        # Shift all loaded data back so that we can re-use it in the next
-        # iteration and not have to load the same data multiple times
-        previous_ds = current_ds
-        current_ds = future_ds
-        future_ds = []
+        # Interpolate tide cutoffs into block extent, and lazily
+        # identify pixels acquired within these cutoffs
+        tide_cutoff_min, tide_cutoff_max = tide_cutoffs(
+            block_ds, tides_lowres, tide_centre=tide_centre
+        )
+        block_ds["tide_mask"] = tide_mask(
+            block_ds, tides_lowres, tide_cutoff_min, tide_cutoff_max
+        )
+
+        # Generate composites and write into windows of output rasters
+        generated = export_annual_gapfill(
+            block_ds,
+            output_dir,
+            tide_cutoff_min,
+            tide_cutoff_max,
+            start_year,
+            end_year,
+            output_geobox=output_geobox,
+            output_store=output_store,
+            quantise=quantise,
+            manifest=manifest,
+            write_threads=write_threads,
+        )
+        log.info(f"Finished exporting block {i + 1} of {n_blocks}")
 
+    # Convert intermediate rasters into final COGs
+    if output_store is None:
+        finalise_cogs(output_dir)
 
-def generate_rasters(
+    # Record completed composites; as each composite is written one
+    # block at a time, these are only complete once all blocks are done
+    if manifest_path is not None:
+        if manifest is None:
+            manifest = {"completed": {}}
+
+        for year, composite, outputs in generated:
+            update_manifest(manifest_path, manifest, year, composite, outputs)
+
+
+def load_gridcells(config):
+    """
+    Load the grid cells used to process the analysis from the grid
+    file specified in a config, indexed by study area ID.
+
+    Parameters:
+    -----------
+    config : dict
+        An analysis config, as loaded by `coastlines.utils.load_config`.
+
+    Returns:
+    --------
+    gridcell_gdf : geopandas.GeoDataFrame
+        Grid cells in EPSG:4326, indexed by study area ID strings.
+    """
+
+    gridcell_gdf = (
+        gpd.read_file(config["Input files"]["grid_path"])
+        .to_crs(epsg=4326)
+        .set_index("id")
+    )
+    gridcell_gdf.index = gridcell_gdf.index.astype(int).astype(str)
+
+    return gridcell_gdf
+
+
+def find_study_area_datasets(
     dc,
     config,
     study_area,
-    raster_version,
     start_year,
     end_year,
-    tide_centre,
     buffer,
+    water_index="mndwi",
+    gridcell_gdf=None,
+    catalogue_cache_dir=None,
     log=None,
 ):
-    #####################################
-    # Connect to datacube, Dask cluster #
-    #####################################
+    """
+    Create a datacube query for a study area, then find and group all
+    satellite datasets matching the query without loading any pixel
+    data. This allows datasets to be found for one study area while
+    another study area is being processed.
+
+    Parameters:
+    -----------
+    dc : datacube.Datacube object
+        Datacube instance used to find data.
+    config : dict
+        An analysis config, as loaded by `coastlines.utils.load_config`.
+    study_area : str
+        The ID of the study area grid cell to find data for.
+    start_year, end_year : int
+        The first and last years of annual shorelines to be produced.
+        Data will be found for one additional year on either side of
+        this range to facilitate gapfilling.
+    buffer : float
+        The distance (in degrees) to buffer the study area grid cell.
+    water_index : string or list of strings, optional
+        The water index (or indices) that will be loaded (see
+        `find_datasets`). Defaults to "mndwi".
+    gridcell_gdf : geopandas.GeoDataFrame, optional
+        Previously loaded grid cells (see `load_gridcells`). Defaults
+        to None, which will load grid cells from the config.
+    catalogue_cache_dir : str, optional
+        Directory used to store a local catalogue of the datasets found
+        for each study area (see `find_datasets`). Defaults to None,
+        which will always query the datacube index.
+    log : logging.Logger, optional
+        Logger used to report progress.
+
+    Returns:
+    --------
+    query : dict
+        The datacube query for the study area.
+    datasets : tuple
+        A `(product, box)` tuple of grouped datasets, as returned by
+        `find_datasets`.
+    """
 
     if log is None:
         log = configure_logging()
 
-    # Create local dask client for parallelisation
-    client = create_local_dask_cluster(return_client=True)
-
     ###########################
     # Load supplementary data #
     ###########################
 
     # Grid cells used to process the analysis
-    gridcell_gdf = (
-        gpd.read_file(config["Input files"]["grid_path"])
-        .to_crs(epsg=4326)
-        .set_index("id")
-    )
-    gridcell_gdf.index = gridcell_gdf.index.astype(int).astype(str)
+    if gridcell_gdf is None:
+        gridcell_gdf = load_gridcells(config)
     gridcell_gdf = gridcell_gdf.loc[[str(study_area)]]
     log.info(f"Study area {study_area}: Loaded study area grid")
 
@@ -550,48 +2809,166 @@ def generate_rasters(
         "dataset_maturity": "final",
     }
 
-    # Load virtual product
+    # Find and group datasets, without loading any pixel data
+    cache_path = None
+    if catalogue_cache_dir is not None:
+        cache_path = os.path.join(catalogue_cache_dir, f"catalogue_{study_area}.sqlite")
     try:
-        ds = load_water_index(
+        datasets = find_datasets(
             dc,
             query,
             yaml_path=config["Virtual product"]["virtual_product_path"],
             product_name=config["Virtual product"]["virtual_product_name"],
-            mask_terrain_shadow=False,
+            water_index=water_index,
+            cache_path=cache_path,
         )
     except (ValueError, IndexError):
         raise ValueError(f"Study area {study_area}: No valid data found")
-    log.info(f"Study area {study_area}: Loaded virtual product")
+    log.info(f"Study area {study_area}: Found {len(datasets[1].box.time)} timesteps")
+
+    return query, datasets
+
+
+def generate_rasters(
+    dc,
+    config,
+    study_area,
+    raster_version,
+    start_year,
+    end_year,
+    tide_centre,
+    buffer,
+    water_index="mndwi",
+    block_size=None,
+    tide_cache_dir=None,
+    mask_terrain_shadow=False,
+    dem_cache_dir=None,
+    catalogue_cache_dir=None,
+    output_format="cog",
+    quantise=False,
+    resume=True,
+    write_threads=2,
+    client=None,
+    gridcell_gdf=None,
+    datasets=None,
+    log=None,
+):
+    #####################################
+    # Connect to datacube, Dask cluster #
+    #####################################
+
+    if log is None:
+        log = configure_logging()
+
+    # Composites are generated for one or more tide centres (datums)
+    # from the same loaded and tide-modelled data. Outputs for each tide
+    # centre are labelled using `datum_suffix`, so tide centres with
+    # identical labels would overwrite each other's outputs
+    tide_centres = [float(i) for i in np.atleast_1d(tide_centre)]
+    suffixes = [datum_suffix(i) for i in tide_centres]
+    if len(set(suffixes)) < len(suffixes):
+        raise ValueError(
+            f"Study area {study_area}: Tide centres {tide_centres} must be "
+            "unique when rounded to two decimal places"
+        )
+
+    # Create local dask client for parallelisation, unless an existing
+    # client is supplied (e.g. when processing multiple study areas)
+    close_client = client is None
+    if client is None:
+        client = create_local_dask_cluster(return_client=True)
+
+    # Find and group datasets for the study area, unless a previously
+    # found `(query, (product, box))` tuple is supplied
+    if datasets is None:
+        query, (product, box) = find_study_area_datasets(
+            dc,
+            config,
+            study_area,
+            start_year,
+            end_year,
+            buffer,
+            water_index=water_index,
+            gridcell_gdf=gridcell_gdf,
+            catalogue_cache_dir=catalogue_cache_dir,
+            log=log,
+        )
+    else:
+        query, (product, box) = datasets
 
     ###################
     # Tidal modelling #
     ###################
 
     # For each satellite timestep, model tide heights into a low-resolution
-    # 5 x 5 km grid (matching resolution of the FES2014 tidal model), then
-    # reproject modelled tides into the spatial extent of our satellite image.
-    # Add  this new data as a new variable in our satellite dataset to allow
-    # each satellite pixel to be analysed and filtered/masked based on the
-    # tide height at the exact moment of satellite image acquisition.
+    # 5 x 5 km grid (matching resolution of the FES2014 tidal model) using
+    # the exact time of image acquisition. This is done before loading
+    # any satellite data, so that timesteps acquired entirely outside
+    # of our tide cutoffs never need to be read from disk.
     try:
-        ds["tide_m"], tides_lowres = pixel_tides(ds, resample=True)
+        tides_lowres = model_box_tides(box, cache_dir=tide_cache_dir)
         log.info(f"Study area {study_area}: Finished modelling tide heights")
 
-    except FileNotFoundError:
-        log.exception(f"Study area {study_area}: Unable to access tide modelling files")
-        sys.exit(2)
+    except FileNotFoundError as e:
+        raise TideModellingError(
+            f"Study area {study_area}: Unable to access tide modelling files"
+        ) from e
 
-    # Based on the entire time-series of tide heights, compute the max
-    # and min satellite-observed tide height for each pixel, then
-    # calculate tide cutoffs used to restrict our data to satellite
-    # observations centred over mid-tide (0 m Above Mean Sea Level).
-    tide_cutoff_min, tide_cutoff_max = tide_cutoffs(
-        ds, tides_lowres, tide_centre=tide_centre
-    )
+    # Remove datasets whose entire footprint was acquired outside of
+    # the tide cutoffs used to generate composites
+    n_timesteps = len(box.box.time)
+    box = tide_prefilter(box, tides_lowres, tide_centre=tide_centres)
     log.info(
-        f"Study area {study_area}: Calculating low and high tide cutoffs for each pixel"
+        f"Study area {study_area}: Removed {n_timesteps - len(box.box.time)} "
+        f"of {n_timesteps} timesteps acquired outside of tide cutoffs"
+    )
+
+    # Plan Dask chunks for the study area using the memory available to
+    # each worker thread, and the largest number of timesteps that will
+    # be combined into a three-year gapfill composite
+    years = pd.DatetimeIndex(box.box.time.values).year.value_counts()
+    years = years.reindex(range(years.index.min(), years.index.max() + 1))
+    workers = client.scheduler_info()["workers"].values()
+    query = dict(query)
+    query["dask_chunks"] = plan_chunks(
+        shape=box.geobox.shape,
+        n_times=len(box.box.time),
+        n_composite_times=int(
+            years.fillna(0).rolling(3, center=True, min_periods=1).sum().max()
+        ),
+        memory_limit=min(w["memory_limit"] for w in workers) or "4GB",
+        threads_per_worker=max(w["nthreads"] for w in workers),
+        n_workers=len(workers),
+        log=log,
     )
 
+    # Optionally load a static coastal zone, so that chunks of the study
+    # area far from the coastline (e.g. deep ocean or far inland) are
+    # never loaded, and are output as nodata
+    coastal_zone_gdf = None
+    coastal_zone_path = config["Input files"].get("coastal_zone_path")
+    if coastal_zone_path is not None:
+        bbox = gpd.GeoSeries(box.geobox.extent.geom, crs=str(box.geobox.crs))
+        coastal_zone_gdf = gpd.read_file(coastal_zone_path, bbox=bbox)
+        log.info(f"Study area {study_area}: Loaded coastal zone")
+
+    # Load virtual product
+    try:
+        ds = load_water_index(
+            dc,
+            query,
+            yaml_path=config["Virtual product"]["virtual_product_path"],
+            product_name=config["Virtual product"]["virtual_product_name"],
+            water_index=water_index,
+            mask_terrain_shadow=mask_terrain_shadow,
+            datasets=(product, box),
+            dem_cache_dir=dem_cache_dir,
+            coastal_zone_gdf=coastal_zone_gdf,
+        )
+    except (ValueError, IndexError):
+        raise ValueError(f"Study area {study_area}: No valid data found")
+    log.info(f"Study area {study_area}: Loaded virtual product")
+
     ##############################
     # Generate yearly composites #
     ##############################
@@ -602,27 +2979,317 @@ def generate_rasters(
     )
     os.makedirs(output_dir, exist_ok=True)
 
+    # Load manifest of composites completed by a previous interrupted
+    # run with the same settings, so that these can be skipped. If not
+    # resuming, any existing manifest is removed so all are regenerated
+    manifest_path = f"{output_dir}/manifest.json"
+    if not resume and os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    manifest = load_manifest(
+        manifest_path,
+        settings=dict(
+            start_year=start_year,
+            end_year=end_year,
+            buffer=buffer,
+            water_index=water_index,
+            mask_terrain_shadow=mask_terrain_shadow,
+            output_format=output_format,
+            quantise=quantise,
+            coastal_zone_path=coastal_zone_path,
+        ),
+    )
+    n_completed = sum(len(i) for i in manifest["completed"].values())
+    if n_completed:
+        log.info(
+            f"Study area {study_area}: Resuming with {n_completed} "
+            "previously completed composites"
+        )
+
+    # Optionally write all composites into a single Zarr store rather
+    # than individual COGs. Annual composites are also produced for the
+    # year before `start_year`
+    output_store = None
+    if output_format == "zarr":
+        output_store = f"{output_dir}/composites.zarr"
+
+    # Create a store for each tide centre, unless resuming into an
+    # existing store
+    for centre in tide_centres if output_store is not None else []:
+        suffix = datum_suffix(centre)
+        if not any(
+            manifest["completed"].get(f"{i}{suffix}") for i in ["annual", "gapfill"]
+        ):
+            init_composite_store(
+                _datum_path(output_store, suffix),
+                ds,
+                years=range(start_year - 1, end_year + 1),
+                quantise=quantise,
+            )
+
     # Iterate through each year and export annual and 3-year
     # gapfill composites
     log.info(f"Study area {study_area}: Started exporting raster data")
-    export_annual_gapfill(
-        ds, output_dir, tide_cutoff_min, tide_cutoff_max, start_year, end_year
-    )
+    if block_size is None:
+        # Based on the entire time-series of tide heights, compute the max
+        # and min satellite-observed tide height for each pixel, then
+        # calculate tide cutoffs used to restrict our data to satellite
+        # observations centred over mid-tide (0 m Above Mean Sea Level).
+        tide_cutoff_min, tide_cutoff_max = tide_cutoffs(
+            ds, tides_lowres, tide_centre=tide_centres
+        )
+        log.info(
+            f"Study area {study_area}: Calculating low and high tide cutoffs "
+            "for each pixel"
+        )
+
+        # Add a lazy mask identifying satellite pixels acquired within
+        # these cutoffs to our satellite dataset, based on the tide
+        # height at the exact moment of satellite image acquisition.
+        # Tides are interpolated into each Dask chunk as it is loaded,
+        # so a full resolution array of tide heights is never created.
+        ds["tide_mask"] = tide_mask(ds, tides_lowres, tide_cutoff_min, tide_cutoff_max)
+        export_annual_gapfill(
+            ds,
+            output_dir,
+            tide_cutoff_min,
+            tide_cutoff_max,
+            start_year,
+            end_year,
+            output_store=output_store,
+            quantise=quantise,
+            manifest=manifest,
+            manifest_path=manifest_path,
+            write_threads=write_threads,
+        )
+
+    else:
+        # Stream spatial blocks through the entire year loop, writing
+        # each block into windows of the output rasters
+        export_annual_gapfill_blocked(
+            ds,
+            tides_lowres,
+            output_dir,
+            tide_centres,
+            start_year,
+            end_year,
+            block_size=block_size,
+            output_store=output_store,
+            quantise=quantise,
+            manifest=manifest,
+            manifest_path=manifest_path,
+            write_threads=write_threads,
+            log=log,
+        )
     log.info(f"Study area {study_area}: Completed exporting raster data")
 
-    # Close dask client
-    client.close()
+    # Close dask client if it was created here
+    if close_client:
+        client.close()
+
+
+# Command line options shared by `generate_rasters_cli` and
+# `generate_rasters_batch_cli`
+GENERATE_RASTERS_OPTIONS = [
+    click.option(
+        "--config_path",
+        type=str,
+        required=True,
+        help="Path to the YAML config file defining inputs to "
+        "use for this analysis. These are typically located in "
+        "the `dea-coastlines/configs/` directory.",
+    ),
+    click.option(
+        "--raster_version",
+        type=str,
+        required=True,
+        help="A unique string proving a name that will be used "
+        "for output raster directories and files. This can be "
+        "used to version different analysis outputs.",
+    ),
+    click.option(
+        "--start_year",
+        type=int,
+        default=2000,
+        help="The first annual shoreline you wish to be included "
+        "in the final outputs. To allow low data pixels to be "
+        "gapfilled with additional satellite data from neighbouring "
+        "years, the full timeseries of satellite data loaded in this "
+        "step will include one additional year of preceding satellite data "
+        "(i.e. if `--start_year 2000`, satellite data from 1999 onward "
+        "will be loaded for gapfilling purposes). Because of this, we "
+        "recommend that at least one year of satellite data exists in "
+        "your datacube prior to `--start_year`.",
+    ),
+    click.option(
+        "--end_year",
+        type=int,
+        default=2020,
+        help="The final annual shoreline you wish to be included "
+        "in the final outputs. To allow low data pixels to be "
+        "gapfilled with additional satellite data from neighbouring "
+        "years, the full timeseries of satellite data loaded in this "
+        "step will include one additional year of ensuing satellite data "
+        "(i.e. if `--end_year 2020`, satellite data up to and including "
+        "2021 will be loaded for gapfilling purposes). Because of this, we "
+        "recommend that at least one year of satellite data exists in your "
+        "datacube after `--end_year`.",
+    ),
+    click.option(
+        "--tide_centre",
+        type=float,
+        multiple=True,
+        default=[0.0],
+        help="The central tide height used to compute the min and max tide "
+        "height cutoffs. Tide heights will be masked so all satellite "
+        "observations are approximately centred over this value. The "
+        "default is 0.0 which represents 0 m Above Mean Sea Level. "
+        "Can be repeated (e.g. `--tide_centre 0.0 --tide_centre 1.5`) to "
+        "generate composites for multiple tide datums from a single load "
+        "of satellite data; outputs for datums other than 0.0 are labelled "
+        "with a suffix (e.g. '_datum_1.50').",
+    ),
+    click.option(
+        "--buffer",
+        type=float,
+        default=0.05,
+        help="The distance (in degrees) to buffer the study area grid cell "
+        "extent. This buffer is important for ensuring that generated "
+        "rasters overlap along the boundaries of neighbouring study areas "
+        "so that we can extract seamless vector shorelines. Defaults to "
+        "0.05 degrees, or roughly 5 km at the equator.",
+    ),
+    click.option(
+        "--water_index",
+        type=str,
+        multiple=True,
+        default=["mndwi"],
+        help="The water index to calculate and composite, matching an "
+        "output of the virtual product recipe (e.g. 'mndwi', 'ndwi', "
+        "'awei_ns' or 'awei_sh'). Can be repeated (e.g. `--water_index "
+        "mndwi --water_index ndwi`) to composite multiple indices from a "
+        "single load of satellite data. Standard deviation and count "
+        "outputs for indices other than the first are suffixed with the "
+        "index name. Defaults to 'mndwi'.",
+    ),
+    click.option(
+        "--block_size",
+        type=int,
+        default=None,
+        help="If provided, process the study area in square spatial blocks "
+        "of this size (in pixels) rather than all at once, writing each "
+        "block into windows of the output rasters. This bounds peak memory "
+        "use by block size rather than study area size. Ideally a multiple "
+        "of the planned Dask chunk size reported in the logs. Defaults to "
+        "None, which processes the entire study area at once.",
+    ),
+    click.option(
+        "--tide_cache_dir",
+        type=str,
+        default=None,
+        help="An optional directory used to cache low-resolution modelled "
+        "tides on disk. If provided, tides modelled for a study area are "
+        "reused when the study area is reprocessed, and only tides for "
+        "new satellite acquisitions are modelled. Defaults to None, "
+        "which models all tides without caching.",
+    ),
+    click.option(
+        "--mask_terrain_shadow/--no-mask_terrain_shadow",
+        type=bool,
+        default=False,
+        help="Whether to use hillshading to mask out pixels potentially "
+        "affected by terrain shadow. This can improve shoreline mapping "
+        "in areas of coastal cliffs or steep coastal topography. "
+        "Defaults to False.",
+    ),
+    click.option(
+        "--dem_cache_dir",
+        type=str,
+        default=None,
+        help="An optional directory used to cache DEM data used for "
+        "terrain shadow masking on disk, so that it is reused when a "
+        "study area is reprocessed. Defaults to None, which loads DEM "
+        "data without caching.",
+    ),
+    click.option(
+        "--catalogue_cache_dir",
+        type=str,
+        default=None,
+        help="An optional directory used to cache a local catalogue of the "
+        "satellite datasets found for each study area. If provided, "
+        "datasets are read from this catalogue when a study area is "
+        "reprocessed, unless matching datasets have been added to, "
+        "archived or replaced in the datacube index. Defaults to None, "
+        "which always queries the datacube index.",
+    ),
+    click.option(
+        "--output_format",
+        type=click.Choice(["cog", "zarr"]),
+        default="cog",
+        help="The format used to write annual and three-year gapfill "
+        "composites. 'cog' writes an individual Cloud Optimised GeoTIFF for "
+        "each variable, year and composite type, while 'zarr' writes all "
+        "composites for a study area into a single chunked and compressed "
+        "Zarr store. Defaults to 'cog'.",
+    ),
+    click.option(
+        "--quantise/--no-quantise",
+        type=bool,
+        default=False,
+        help="Whether to store water index and standard deviation composites "
+        "as int16 values scaled by 0.0001 rather than as float32, halving "
+        "raster storage size. Quantised rasters are decoded automatically "
+        "when loaded by the vector stage. Defaults to False.",
+    ),
+    click.option(
+        "--resume/--no-resume",
+        type=bool,
+        default=True,
+        help="Whether to resume an interrupted run by skipping annual and "
+        "gapfill composites recorded as complete in the study area's "
+        "'manifest.json' file. Composites are only skipped if they were "
+        "generated with identical settings and their outputs still exist. "
+        "Study areas that previously ran to completion are always "
+        "regenerated in full. Defaults to True.",
+    ),
+    click.option(
+        "--write_threads",
+        type=int,
+        default=2,
+        help="The number of background threads used to compress and write "
+        "output rasters while the next composite is computed. Set to 0 to "
+        "write outputs synchronously. Defaults to 2.",
+    ),
+    click.option(
+        "--aws_unsigned/--no-aws_unsigned",
+        type=bool,
+        default=True,
+        help="Whether to use sign AWS requests for S3 access",
+    ),
+    click.option(
+        "--overwrite/--no-overwrite",
+        type=bool,
+        default=True,
+        help="Whether to overwrite tiles with existing outputs, "
+        "or skip these tiles entirely.",
+    ),
+]
+
+
+def generate_rasters_options(func):
+    """
+    Decorator that applies the command line options shared by
+    `generate_rasters_cli` and `generate_rasters_batch_cli` to a
+    click command, in the order they are listed in
+    `GENERATE_RASTERS_OPTIONS`.
+    """
+
+    for option in reversed(GENERATE_RASTERS_OPTIONS):
+        func = option(func)
+
+    return func
 
 
 @click.command()
-@click.option(
-    "--config_path",
-    type=str,
-    required=True,
-    help="Path to the YAML config file defining inputs to "
-    "use for this analysis. These are typically located in "
-    "the `dea-coastlines/configs/` directory.",
-)
 @click.option(
     "--study_area",
     type=str,
@@ -632,74 +3299,7 @@ def generate_rasters(
     'should match a row in the "id" column of the provided '
     "analysis gridcell vector file.",
 )
-@click.option(
-    "--raster_version",
-    type=str,
-    required=True,
-    help="A unique string proving a name that will be used "
-    "for output raster directories and files. This can be "
-    "used to version different analysis outputs.",
-)
-@click.option(
-    "--start_year",
-    type=int,
-    default=2000,
-    help="The first annual shoreline you wish to be included "
-    "in the final outputs. To allow low data pixels to be "
-    "gapfilled with additional satellite data from neighbouring "
-    "years, the full timeseries of satellite data loaded in this "
-    "step will include one additional year of preceding satellite data "
-    "(i.e. if `--start_year 2000`, satellite data from 1999 onward "
-    "will be loaded for gapfilling purposes). Because of this, we "
-    "recommend that at least one year of satellite data exists in "
-    "your datacube prior to `--start_year`.",
-)
-@click.option(
-    "--end_year",
-    type=int,
-    default=2020,
-    help="The final annual shoreline you wish to be included "
-    "in the final outputs. To allow low data pixels to be "
-    "gapfilled with additional satellite data from neighbouring "
-    "years, the full timeseries of satellite data loaded in this "
-    "step will include one additional year of ensuing satellite data "
-    "(i.e. if `--end_year 2020`, satellite data up to and including "
-    "2021 will be loaded for gapfilling purposes). Because of this, we "
-    "recommend that at least one year of satellite data exists in your "
-    "datacube after `--end_year`.",
-)
-@click.option(
-    "--tide_centre",
-    type=float,
-    default=0.0,
-    help="The central tide height used to compute the min and max tide "
-    "height cutoffs. Tide heights will be masked so all satellite "
-    "observations are approximately centred over this value. The "
-    "default is 0.0 which represents 0 m Above Mean Sea Level.",
-)
-@click.option(
-    "--buffer",
-    type=float,
-    default=0.05,
-    help="The distance (in degrees) to buffer the study area grid cell "
-    "extent. This buffer is important for ensuring that generated "
-    "rasters overlap along the boundaries of neighbouring study areas "
-    "so that we can extract seamless vector shorelines. Defaults to "
-    "0.05 degrees, or roughly 5 km at the equator.",
-)
-@click.option(
-    "--aws_unsigned/--no-aws_unsigned",
-    type=bool,
-    default=True,
-    help="Whether to use sign AWS requests for S3 access",
-)
-@click.option(
-    "--overwrite/--no-overwrite",
-    type=bool,
-    default=True,
-    help="Whether to overwrite tiles with existing outputs, "
-    "or skip these tiles entirely.",
-)
+@generate_rasters_options
 def generate_rasters_cli(
     config_path,
     study_area,
@@ -708,6 +3308,16 @@ def generate_rasters_cli(
     end_year,
     tide_centre,
     buffer,
+    water_index,
+    block_size,
+    tide_cache_dir,
+    mask_terrain_shadow,
+    dem_cache_dir,
+    catalogue_cache_dir,
+    output_format,
+    quantise,
+    resume,
+    write_threads,
     aws_unsigned,
     overwrite,
 ):
@@ -743,6 +3353,16 @@ def generate_rasters_cli(
             end_year,
             tide_centre,
             buffer,
+            water_index=list(water_index),
+            block_size=block_size,
+            tide_cache_dir=tide_cache_dir,
+            mask_terrain_shadow=mask_terrain_shadow,
+            dem_cache_dir=dem_cache_dir,
+            catalogue_cache_dir=catalogue_cache_dir,
+            output_format=output_format,
+            quantise=quantise,
+            resume=resume and not output_exists,
+            write_threads=write_threads,
             log=log,
         )
 
@@ -753,10 +3373,162 @@ def generate_rasters_cli(
         ):
             pass
 
+    except TideModellingError:
+        log.exception(f"Study area {study_area}: Unable to access tide modelling files")
+        sys.exit(2)
+
     except Exception as e:
         log.exception(f"Study area {study_area}: Failed to run process with error {e}")
         sys.exit(1)
 
 
+@click.command()
+@click.option(
+    "--study_areas",
+    type=str,
+    default=None,
+    help="A comma-separated list of study area IDs to process, each "
+    'matching a row in the "id" column of the provided analysis '
+    "gridcell vector file.",
+)
+@click.option(
+    "--study_areas_path",
+    type=str,
+    default=None,
+    help="Path to a text file containing study area IDs to process, "
+    "one per line. Can be used instead of or in addition to "
+    "`--study_areas`.",
+)
+@generate_rasters_options
+def generate_rasters_batch_cli(
+    config_path,
+    study_areas,
+    study_areas_path,
+    raster_version,
+    start_year,
+    end_year,
+    tide_centre,
+    buffer,
+    water_index,
+    block_size,
+    tide_cache_dir,
+    mask_terrain_shadow,
+    dem_cache_dir,
+    catalogue_cache_dir,
+    output_format,
+    quantise,
+    resume,
+    write_threads,
+    aws_unsigned,
+    overwrite,
+):
+    log = configure_logging("Coastlines raster generation for multiple study areas")
+
+    # Combine study areas supplied directly and via file
+    study_area_list = [] if study_areas is None else study_areas.split(",")
+    if study_areas_path is not None:
+        with open(study_areas_path) as f:
+            study_area_list += f.read().split()
+    study_area_list = [i.strip() for i in study_area_list if i.strip()]
+
+    # Skip study areas with existing outputs if overwrite is False
+    def run_status_file(study_area):
+        return f"data/interim/raster/{raster_version}/{study_area}_{raster_version}/run_completed"
+
+    if not overwrite:
+        study_area_list = [
+            i for i in study_area_list if not os.path.exists(run_status_file(i))
+        ]
+    log.info(f"Processing {len(study_area_list)} study areas")
+
+    # Connect to datacube, load analysis params from config file and
+    # grid cells, and do an opinionated configuration of S3 once, and
+    # re-use these for all study areas
+    dc = datacube.Datacube(app="Coastlines")
+    config = load_config(config_path=config_path)
+    gridcell_gdf = load_gridcells(config)
+    configure_s3_access(cloud_defaults=True, aws_unsigned=aws_unsigned)
+
+    # Create a single local dask client for parallelisation
+    client = create_local_dask_cluster(return_client=True)
+
+    # Find datasets for the next study area in a background thread
+    # while the current study area is processed
+    find_datasets_kwargs = dict(
+        dc=dc,
+        config=config,
+        start_year=start_year,
+        end_year=end_year,
+        buffer=buffer,
+        water_index=list(water_index),
+        gridcell_gdf=gridcell_gdf,
+        catalogue_cache_dir=catalogue_cache_dir,
+        log=log,
+    )
+    failed = []
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = None
+        if study_area_list:
+            future = executor.submit(
+                find_study_area_datasets,
+                study_area=study_area_list[0],
+                **find_datasets_kwargs,
+            )
+
+        for i, study_area in enumerate(study_area_list):
+            # Start finding datasets for the next study area
+            current_future = future
+            if i + 1 < len(study_area_list):
+                future = executor.submit(
+                    find_study_area_datasets,
+                    study_area=study_area_list[i + 1],
+                    **find_datasets_kwargs,
+                )
+
+            try:
+                generate_rasters(
+                    dc,
+                    config,
+                    study_area,
+                    raster_version,
+                    start_year,
+                    end_year,
+                    tide_centre,
+                    buffer,
+                    water_index=list(water_index),
+                    block_size=block_size,
+                    tide_cache_dir=tide_cache_dir,
+                    mask_terrain_shadow=mask_terrain_shadow,
+                    dem_cache_dir=dem_cache_dir,
+                    output_format=output_format,
+                    quantise=quantise,
+                    resume=resume and not os.path.exists(run_status_file(study_area)),
+                    write_threads=write_threads,
+                    client=client,
+                    datasets=current_future.result(),
+                    log=log,
+                )
+
+                # Create blank run status file to indicate run completion
+                with open(
+                    run_status_file(study_area),
+                    mode="w",
+                ):
+                    pass
+
+            except Exception as e:
+                log.exception(
+                    f"Study area {study_area}: Failed to run process with error {e}"
+                )
+                failed.append(study_area)
+
+    client.close()
+
+    # Exit with an error if any study area failed
+    if failed:
+        log.error(f"Failed to process study areas: {', '.join(failed)}")
+        sys.exit(1)
+
+
 if __name__ == "__main__":
     generate_rasters_cli()
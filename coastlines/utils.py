@@ -32,3 +32,14 @@ def load_config(config_path: str) -> dict:
     with fsspec.open(config_path, mode="r") as f:
         config = yaml.safe_load(f)
     return config
+
+
+def datum_suffix(tide_centre: float) -> str:
+    """
+    Return the suffix used to label outputs generated for a tide
+    centre (e.g. "_datum_1.50" for 1.5 m). Outputs for the default
+    tide centre of 0.0 m are not labelled.
+    """
+    if tide_centre is None or tide_centre == 0:
+        return ""
+    return f"_datum_{tide_centre:.2f}"
@@ -15,21 +15,27 @@ import glob
 import os
 import sys
 import warnings
+from functools import lru_cache
 
 import click
+import dask
 import pyproj
+import rasterio
 import odc.algo
 import odc.geo.xr
 import numpy as np
 import pandas as pd
 import xarray as xr
+import shapely
 import geohash as gh
 import geopandas as gpd
 from affine import Affine
+from odc.geo.geobox import GeoBox
 from rasterio.features import sieve
+from rasterio.windows import Window
+from scipy.special import stdtr
 from scipy.stats import circstd, circmean, linregress
 from shapely.geometry import box
-from shapely.ops import nearest_points
 from skimage.measure import label, regionprops
 from skimage.morphology import (
     black_tophat,
@@ -43,7 +49,7 @@ from skimage.morphology import (
 import datacube
 from datacube.utils.aws import configure_s3_access
 
-from coastlines.utils import configure_logging, load_config
+from coastlines.utils import configure_logging, datum_suffix, load_config
 from dea_tools.spatial import subpixel_contours, xr_vectorize, xr_rasterize
 
 # Hide specific warnings
@@ -53,6 +59,110 @@ warnings.simplefilter(action="ignore", category=RuntimeWarning)
 pd.options.mode.chained_assignment = None
 
 
+def _decode_quantised(da):
+    """
+    Decode integer rasters quantised by `coastlines.raster.quantise_composite`
+    back to float32 values, using scale, offset and nodata metadata from
+    either GeoTIFF band metadata or Zarr attributes. Arrays without scale
+    metadata are returned unchanged.
+    """
+
+    if "scale_factor" in da.attrs:
+        scale, offset = da.attrs["scale_factor"], da.attrs["add_offset"]
+        nodata = da.attrs.get("_FillValue", da.attrs.get("nodata"))
+    elif da.attrs.get("scales", (1.0,))[0] != 1.0:
+        scale, offset = da.attrs["scales"][0], da.attrs["offsets"][0]
+        nodata = da.attrs["nodatavals"][0]
+    else:
+        return da
+
+    # Decode values, and set nodata to NaN
+    decoded = (da.where(da != nodata) * scale + offset).astype("float32")
+    decoded.attrs = {
+        k: v
+        for k, v in da.attrs.items()
+        if k not in ["scale_factor", "add_offset", "scales", "offsets", "_FillValue"]
+    }
+    decoded.attrs["nodata"] = np.nan
+    if "nodatavals" in decoded.attrs:
+        decoded.attrs["nodatavals"] = (np.nan,)
+
+    return decoded
+
+
+def _bbox_slices(affine, shape, bbox=None):
+    """
+    Identify the row and column slices of a north-up raster grid that
+    cover a bounding box, expanded outwards to whole pixels and clipped
+    to the extent of the grid. If `bbox` is None, slices covering the
+    entire grid are returned.
+    """
+
+    if bbox is None:
+        return slice(0, shape[0]), slice(0, shape[1])
+
+    left, bottom, right, top = bbox
+    col_start, row_start = ~affine * (left, top)
+    col_stop, row_stop = ~affine * (right, bottom)
+    rows = slice(
+        max(int(np.floor(row_start)), 0), min(int(np.ceil(row_stop)), shape[0])
+    )
+    cols = slice(
+        max(int(np.floor(col_start)), 0), min(int(np.ceil(col_stop)), shape[1])
+    )
+
+    return rows, cols
+
+
+def _read_raster(path, window):
+    """
+    Read a window from the first band of a raster file.
+    """
+
+    with rasterio.open(path) as src:
+        return src.read(1, window=window)
+
+
+def _lazy_rasters(paths, years, name, bbox=None):
+    """
+    Lazily load a single-band raster file for each year into a
+    Dask-backed `xarray.DataArray` with "year", "y" and "x" dimensions.
+    All files are assumed to share the same pixel grid, so only the
+    first file is opened to read metadata; each file is then only
+    opened when its data is computed.
+    """
+
+    with rasterio.open(paths[0]) as src:
+        rows, cols = _bbox_slices(src.transform, src.shape, bbox)
+        window = Window.from_slices(rows, cols)
+        geobox = GeoBox(
+            (window.height, window.width), src.window_transform(window), str(src.crs)
+        )
+        dtype = src.dtypes[0]
+        attrs = {
+            "nodatavals": src.nodatavals,
+            "scales": src.scales,
+            "offsets": src.offsets,
+        }
+
+    data = dask.array.stack(
+        [
+            dask.array.from_delayed(
+                dask.delayed(_read_raster)(path, window), geobox.shape, dtype
+            )
+            for path in paths
+        ]
+    )
+
+    return xr.DataArray(
+        data,
+        dims=("year", "y", "x"),
+        coords={"year": years, **odc.geo.xr.xr_coords(geobox)},
+        attrs=attrs,
+        name=name,
+    )
+
+
 def load_rasters(
     path,
     raster_version,
@@ -60,12 +170,28 @@ def load_rasters(
     water_index="mndwi",
     start_year=1988,
     end_year=2021,
+    tide_centre=0.0,
+    bbox=None,
 ):
     """
     Loads DEA Coastlines water index (e.g. 'MNDWI'), 'count',
     and 'stdev' rasters for both annual and three-year gapfill data
     into a consistent `xarray.Dataset` format for further analysis.
 
+    Data is loaded lazily into Dask-backed datasets. Only rasters for
+    years between `start_year` and `end_year` are included (identified
+    using their file names, before any files are opened), and each
+    file is only read when its data is computed, allowing all files
+    to be read concurrently (e.g. using `dask.compute`).
+
+    If the study area's rasters were written to a single Zarr store
+    (i.e. using `--output_format zarr`), data is read lazily from the
+    store; otherwise individual GeoTIFFs are loaded. Quantised rasters
+    (i.e. written using `--quantise`) are decoded to float32 values.
+
+    If rasters were generated for multiple water indices, the 'count'
+    and 'stdev' rasters generated for `water_index` are loaded.
+
     Parameters:
     -----------
     path : string
@@ -86,6 +212,15 @@ def load_rasters(
     end_year : integer, optional
         The final annual layer to include in the analysis. Defaults to
         2021.
+    tide_centre : float, optional
+        The tide centre (datum) of the rasters to load, as supplied to
+        `--tide_centre` when generating rasters. Defaults to 0.0.
+    bbox : tuple, optional
+        An optional `(left, bottom, right, top)` bounding box in the
+        CRS of the rasters (e.g. the extent of the study area's coastal
+        zone). If provided, only the window of each raster covering
+        this bounding box is read. Defaults to None, which reads the
+        full extent of each raster.
 
     Returns:
     --------
@@ -101,23 +236,54 @@ def load_rasters(
 
     """
 
+    # Rasters for tide datums other than 0.0 m are labelled with a suffix
+    suffix = datum_suffix(tide_centre)
+    output_dir = f"{path}/{raster_version}/{study_area}_{raster_version}"
+
+    # Read lazily from Zarr store if it exists
+    store = f"{output_dir}/composites{suffix}.zarr"
+    if os.path.exists(store):
+        ds = xr.open_zarr(store, mask_and_scale=False)
+        stats = {
+            stat: f"{stat}_{water_index}" if f"{stat}_{water_index}" in ds else stat
+            for stat in ["count", "stdev"]
+        }
+        ds = ds[[water_index, *stats.values()]].rename(
+            {v: k for k, v in stats.items() if v != k}
+        )
+        ds = ds.sel(year=slice(start_year, end_year))
+        rows, cols = _bbox_slices(ds.odc.geobox.affine, ds.odc.geobox.shape, bbox)
+        ds = ds.isel(y=rows, x=cols)
+        ds = ds.assign({k: _decode_quantised(v) for k, v in ds.data_vars.items()})
+        return [ds.sel(composite=i, drop=True) for i in ["annual", "gapfill"]]
+
     # List to hold output Datasets
     ds_list = []
 
-    for layer_type in [".tif", "_gapfill.tif"]:
+    for layer_type in [f"{suffix}.tif", f"_gapfill{suffix}.tif"]:
         # List to hold output DataArrays
         da_list = []
 
         for layer_name in [f"{water_index}", "count", "stdev"]:
-            # Get paths of files that match pattern
-            paths = glob.glob(
-                f"{path}/{raster_version}/"
-                f"{study_area}_{raster_version}/"
-                f"*_{layer_name}{layer_type}"
+            # Get paths of files that match pattern, using 'count' and
+            # 'stdev' rasters specific to our water index if they exist
+            for file_name in [f"{layer_name}_{water_index}", layer_name]:
+                paths = glob.glob(
+                    f"{output_dir}/[0-9][0-9][0-9][0-9]_{file_name}{layer_type}"
+                )
+                if paths:
+                    break
+
+            # Identify the year of each file, and keep only files within
+            # our start and end year so that other years are never opened
+            years = sorted(
+                (int(os.path.basename(i)[0:4]), i)
+                for i in paths
+                if start_year <= int(os.path.basename(i)[0:4]) <= end_year
             )
 
             # Test if data was returned
-            if len(paths) == 0:
+            if len(years) == 0:
                 raise Exception(
                     f"No rasters found for grid cell {study_area} "
                     f"(raster version '{raster_version}'). Verify that "
@@ -125,19 +291,20 @@ def load_rasters(
                     "for this grid cell."
                 )
 
-            # Create variable used for time axis
-            time_var = xr.Variable("year", [int(i.split("/")[-1][0:4]) for i in paths])
-
             # Import data
-            layer_da = xr.concat([xr.open_rasterio(i) for i in paths], dim=time_var)
-            layer_da.name = f"{layer_name}"
+            layer_da = _lazy_rasters(
+                paths=[i for _, i in years],
+                years=[year for year, _ in years],
+                name=layer_name,
+                bbox=bbox,
+            )
+            layer_da = _decode_quantised(layer_da)
 
             # Append to file
             da_list.append(layer_da)
 
-        # Combine into a single dataset and restrict to start and end year
-        layer_ds = xr.merge(da_list).squeeze("band", drop=True)
-        layer_ds = layer_ds.sel(year=slice(str(start_year), str(end_year)))
+        # Combine into a single dataset
+        layer_ds = xr.merge(da_list)
 
         # Append to list
         ds_list.append(layer_ds)
@@ -741,6 +908,163 @@ def points_on_line(gdf, index, distance=30):
     return points_gdf
 
 
+def nearest_coords(points, line, max_distance=None):
+    """
+    Find the nearest point on a line to each of an array of points,
+    using vectorised Shapely operations rather than calling
+    `shapely.ops.nearest_points` for every point.
+
+    If `max_distance` is provided, the line is split into individual
+    segments indexed by an STRtree, and each point is only compared
+    against the segments within `max_distance` of it. Points with no
+    segments within `max_distance` are compared against the entire
+    line, so results are identical to `nearest_points`. If the line
+    is empty (e.g. no coastline was extracted for a year), `NaN`
+    coordinates are returned for every point.
+
+    Parameters:
+    -----------
+    points : array of shapely.geometry.Point
+        An array (or `geopandas.GeoSeries`) of points.
+    line : shapely.geometry.LineString or MultiLineString
+        The line to find nearest points on.
+    max_distance : int or float, optional
+        The search distance used to prune line segments. Defaults to
+        None, which compares each point against the entire line.
+
+    Returns:
+    --------
+    coords : numpy.ndarray
+        An array of shape (n, 2) giving the x and y coordinates of the
+        nearest point on `line` to each point.
+    """
+
+    points = np.asarray(points)
+    coords = np.full((len(points), 2), np.nan)
+    remaining = np.arange(len(points))
+
+    # There is no nearest point on an empty line
+    if shapely.is_empty(line):
+        return coords
+
+    if max_distance is not None:
+        # Split line into individual segments, using consecutive
+        # coordinates within each part of the line
+        parts = shapely.get_parts(line)
+        vertices, part_index = shapely.get_coordinates(parts, return_index=True)
+        same_part = part_index[:-1] == part_index[1:]
+        segments = shapely.linestrings(
+            np.stack([vertices[:-1][same_part], vertices[1:][same_part]], axis=1)
+        )
+
+        # Identify the nearest segment within `max_distance` of each
+        # point; if multiple segments are equally near, the first
+        # segment along the line is used
+        tree = shapely.STRtree(segments)
+        point_index, segment_index = tree.query_nearest(
+            points, max_distance=max_distance
+        )
+        order = np.lexsort((segment_index, point_index))
+        point_index, segment_index = point_index[order], segment_index[order]
+        point_index, first = np.unique(point_index, return_index=True)
+        segment_index = segment_index[first]
+
+        nearest = shapely.shortest_line(points[point_index], segments[segment_index])
+        coords[point_index] = shapely.get_coordinates(nearest)[1::2]
+        remaining = np.setdiff1d(remaining, point_index)
+
+    # Compare any remaining points against the entire line
+    if len(remaining) > 0:
+        nearest = shapely.shortest_line(points[remaining], line)
+        coords[remaining] = shapely.get_coordinates(nearest)[1::2]
+
+    return coords
+
+
+def sample_bilinear(da, index, x, y):
+    """
+    Bilinearly interpolate values from a 3D array at batches of points,
+    each given by a position along the array's first dimension (e.g.
+    year) and x and y coordinates. All points are sampled in a single
+    vectorised operation on the in-memory array, rather than calling
+    `xarray.DataArray.interp` separately for each position.
+
+    Results match `xarray.DataArray.interp(x=..., y=...)` with linear
+    interpolation: points outside the extent of the array, or with
+    any `NaN` pixels among the four surrounding pixels, return `NaN`.
+
+    Parameters:
+    -----------
+    da : xarray.DataArray
+        A 3D array with "x" and "y" dimensions, and one additional
+        dimension (e.g. "year").
+    index : numpy.ndarray
+        The integer position of each point along the additional
+        dimension of `da`.
+    x, y : numpy.ndarray
+        The x and y coordinates of each point.
+
+    Returns:
+    --------
+    sampled : numpy.ndarray
+        A float64 array of interpolated values for each point.
+    """
+
+    values = da.transpose(..., "x", "y").values
+    grid_x, grid_y = da.x.values, da.y.values
+
+    # Flip descending coordinates so both are ascending
+    if grid_x[0] > grid_x[-1]:
+        grid_x, values = grid_x[::-1], values[:, ::-1]
+    if grid_y[0] > grid_y[-1]:
+        grid_y, values = grid_y[::-1], values[:, :, ::-1]
+
+    def _locate(grid, coords):
+        # Identify the pixel before each coordinate, and the normalised
+        # distance from that pixel to the next pixel
+        i = np.clip(np.searchsorted(grid, coords, side="right") - 1, 0, len(grid) - 2)
+        return i, (coords - grid[i]) / (grid[i + 1] - grid[i])
+
+    i_x, w_x = _locate(grid_x, x)
+    i_y, w_y = _locate(grid_y, y)
+
+    # Weighted sum of the four surrounding pixels
+    sampled = (
+        values[index, i_x, i_y] * ((1 - w_x) * (1 - w_y))
+        + values[index, i_x, i_y + 1] * ((1 - w_x) * w_y)
+        + values[index, i_x + 1, i_y] * (w_x * (1 - w_y))
+        + values[index, i_x + 1, i_y + 1] * (w_x * w_y)
+    )
+
+    # Set points outside the extent of the array to NaN
+    outside = (x < grid_x[0]) | (x > grid_x[-1]) | (y < grid_y[0]) | (y > grid_y[-1])
+    sampled[outside] = np.nan
+
+    return sampled
+
+
+@lru_cache(maxsize=None)
+def lonlat_transformer(crs):
+    """
+    Returns a `pyproj.Transformer` for reprojecting x and y coordinates
+    from `crs` to lon-lat (EPSG:4326). Transformers are cached so they
+    are only created once for each CRS.
+
+    Parameters:
+    -----------
+    crs : pyproj.CRS or string
+        The CRS of the input coordinates.
+
+    Returns:
+    --------
+    transformer : pyproj.Transformer
+        A transformer that accepts and returns coordinates in x, y
+        (i.e. lon, lat) order.
+    """
+
+    return pyproj.Transformer.from_crs(crs, "EPSG:4326", always_xy=True)
+
+
 def annual_movements(
     points_gdf, contours_gdf, yearly_ds, baseline_year, water_index, max_valid_dist=1000
 ):
@@ -786,98 +1110,85 @@ def annual_movements(
         towards the ocean.
     """
 
-    def _point_interp(points, array, **kwargs):
-        points_gs = gpd.GeoSeries(points)
-        x_vals = xr.DataArray(points_gs.x, dims="z")
-        y_vals = xr.DataArray(points_gs.y, dims="z")
-
-        return array.interp(x=x_vals, y=y_vals, **kwargs)
-
-    # Get array of water index values for baseline time period
-    baseline_array = yearly_ds[water_index].sel(year=int(baseline_year))
-
-    # Copy baseline point geometry to new column in points dataset
-    points_gdf["p_baseline"] = points_gdf.geometry
+    # Coordinates of baseline points in the CRS of our data
+    baseline_points = np.asarray(points_gdf.geometry)
+    baseline_x, baseline_y = shapely.get_coordinates(baseline_points).T
 
     # Years to analyse
     years = contours_gdf.index.unique().values
 
-    # Iterate through all comparison years in contour gdf
-    for comp_year in years:
-        # Set comparison contour
-        comp_contour = contours_gdf.loc[[comp_year]].geometry.iloc[0]
-
-        # Find nearest point on comparison contour, and add these to points dataset
-        points_gdf[f"p_{comp_year}"] = points_gdf.apply(
-            lambda x: nearest_points(x.p_baseline, comp_contour)[1], axis=1
-        )
-
-        # Compute distance between baseline and comparison year points and add
-        # this distance as a new field named by the current year being analysed
-        distances = points_gdf.apply(
-            lambda x: x.geometry.distance(x[f"p_{comp_year}"]), axis=1
-        )
-
-        # Set any value over X m to NaN
-        points_gdf[f"dist_{comp_year}"] = distances.where(distances < max_valid_dist)
-
-        # Extract comparison array containing water index values for the
-        # current year being analysed
-        comp_array = yearly_ds[water_index].sel(year=int(comp_year))
-
-        # Sample water index values for baseline and comparison points
-        points_gdf["index_comp_p1"] = _point_interp(points_gdf.geometry, comp_array)
-        points_gdf["index_baseline_p2"] = _point_interp(
-            points_gdf[f"p_{comp_year}"], baseline_array
-        )
-
-        # Compute change directionality (positive = located towards the
-        # ocean; negative = located inland)
-        points_gdf["loss_gain"] = np.where(
-            points_gdf.index_baseline_p2 > points_gdf.index_comp_p1, 1, -1
-        )
-
-        # Ensure NaNs are correctly propagated (otherwise, X > NaN
-        # will return False, resulting in an incorrect land-ward direction)
-        is_nan = points_gdf[["index_comp_p1", "index_baseline_p2"]].isna().any(axis=1)
-        points_gdf["loss_gain"] = points_gdf["loss_gain"].where(~is_nan)
-
-        # Multiply distance to set change to negative, positive or NaN
-        points_gdf[f"dist_{comp_year}"] = (
-            points_gdf[f"dist_{comp_year}"] * points_gdf.loss_gain
-        )
-
-        # Calculate compass bearing from baseline to comparison point;
-        # first we need our points in lat-lon
-        lat_lon = points_gdf[["p_baseline", f"p_{comp_year}"]].apply(
-            lambda x: gpd.GeoSeries(x, crs=points_gdf.crs).to_crs("EPSG:4326")
-        )
-
-        geodesic = pyproj.Geod(ellps="WGS84")
-        bearings = geodesic.inv(
-            lons1=lat_lon.iloc[:, 0].values.x,
-            lats1=lat_lon.iloc[:, 0].values.y,
-            lons2=lat_lon.iloc[:, 1].values.x,
-            lats2=lat_lon.iloc[:, 1].values.y,
-        )[0]
-
-        # Add bearing as a new column after first restricting
-        # angles between 0 and 180 as we are only interested in
-        # the overall axis of our points e.g. north-south
-        points_gdf[f"bearings_{comp_year}"] = bearings % 180
-
-    # Calculate mean and standard deviation of angles
+    # Find coordinates of the nearest point on each comparison contour
+    # to each baseline point, as arrays with a row for each year
+    comp_coords = np.stack(
+        [
+            nearest_coords(
+                baseline_points,
+                contours_gdf.loc[[comp_year]].geometry.iloc[0],
+                max_distance=max_valid_dist,
+            )
+            for comp_year in years
+        ]
+    )
+    comp_x, comp_y = comp_coords[..., 0], comp_coords[..., 1]
+
+    # Compute distance between baseline and comparison year points, and
+    # set any value over X m to NaN
+    distances = np.sqrt((comp_x - baseline_x) ** 2 + (comp_y - baseline_y) ** 2)
+    distances = np.where(distances < max_valid_dist, distances, np.nan)
+
+    # Sample water index values for baseline points in each comparison
+    # year, and for comparison points in the baseline year, in a single
+    # batched call
+    year_index = yearly_ds.indexes["year"]
+    comp_index = [year_index.get_loc(int(comp_year)) for comp_year in years]
+    baseline_index = year_index.get_loc(int(baseline_year))
+    index_comp_p1, index_baseline_p2 = sample_bilinear(
+        yearly_ds[water_index],
+        index=np.concatenate(
+            [
+                np.repeat(comp_index, len(baseline_x)),
+                np.full(comp_x.size, baseline_index),
+            ]
+        ),
+        x=np.concatenate([np.tile(baseline_x, len(years)), comp_x.ravel()]),
+        y=np.concatenate([np.tile(baseline_y, len(years)), comp_y.ravel()]),
+    ).reshape(2, *comp_x.shape)
+
+    # Compute change directionality (positive = located towards the
+    # ocean; negative = located inland), ensuring NaNs are correctly
+    # propagated (otherwise, X > NaN will return False, resulting in an
+    # incorrect land-ward direction)
+    loss_gain = np.where(index_baseline_p2 > index_comp_p1, 1.0, -1.0)
+    loss_gain[np.isnan(index_comp_p1) | np.isnan(index_baseline_p2)] = np.nan
+
+    # Multiply distance to set change to negative, positive or NaN, and
+    # add as new fields named by each year being analysed
+    for i, comp_year in enumerate(years):
+        points_gdf[f"dist_{comp_year}"] = distances[i] * loss_gain[i]
+
+    # Calculate compass bearings from baseline to comparison points for
+    # all years at once; first we need our points in lat-lon
+    transformer = lonlat_transformer(points_gdf.crs)
+    baseline_lon, baseline_lat = transformer.transform(baseline_x, baseline_y)
+    comp_lon, comp_lat = transformer.transform(comp_x.ravel(), comp_y.ravel())
+    geodesic = pyproj.Geod(ellps="WGS84")
+    bearings = geodesic.inv(
+        lons1=np.tile(baseline_lon, len(years)),
+        lats1=np.tile(baseline_lat, len(years)),
+        lons2=comp_lon,
+        lats2=comp_lat,
+    )[0].reshape(comp_x.shape)
+
+    # Restrict angles between 0 and 180 as we are only interested in
+    # the overall axis of our points e.g. north-south, then calculate
+    # mean and standard deviation of angles across all years (ignoring
+    # years with empty coastlines, which have NaN bearings)
+    bearings = bearings % 180
     points_gdf["angle_mean"] = (
-        points_gdf.loc[:, points_gdf.columns.str.contains("bearings_")]
-        .apply(lambda x: circmean(x, high=180), axis=1)
-        .round(0)
-        .astype(int)
+        circmean(bearings, high=180, axis=0, nan_policy="omit").round(0).astype(int)
     )
     points_gdf["angle_std"] = (
-        points_gdf.loc[:, points_gdf.columns.str.contains("bearings_")]
-        .apply(lambda x: circstd(x, high=180), axis=1)
-        .round(0)
-        .astype(int)
+        circstd(bearings, high=180, axis=0, nan_policy="omit").round(0).astype(int)
     )
 
     # Keep only required columns
@@ -1055,6 +1366,133 @@ def change_regress(
     return pd.Series(results_dict)
 
 
+def batch_change_regress(
+    y_vals,
+    x_vals,
+    x_labels,
+    threshold=3.5,
+    slope_var="slope",
+    interc_var="intercept",
+    pvalue_var="pvalue",
+    stderr_var="stderr",
+    outliers_var="outliers",
+):
+    """
+    Vectorised version of `change_regress` that applies linear
+    regression to many rows of data values (as y-values) at once,
+    returning 'slope', 'intercept', 'pvalue', and 'stderr' regression
+    parameters for each row.
+
+    Outliers are identified and excluded using the same robust Median
+    Absolute Deviation (MAD) outlier detection algorithm as
+    `outlier_mad`, and regression parameters are calculated using the
+    same approach as `scipy.stats.linregress`, but for all rows
+    simultaneously using NumPy array operations rather than row-by-row.
+
+    Parameters:
+    -----------
+    y_vals : nd.array
+        A 2D array of values to use as the y variable, with a row for
+        each regression (e.g. each rates of change point) and a column
+        for each value in `x_vals`. NaN values are excluded from the
+        regression.
+    x_vals : list of numeric values, or nd.array
+        A sequence of values to use as the x variable.
+    x_labels : list
+        A sequence of strings corresponding to each value in `x_vals`.
+        This is used to label any observations that are flagged as
+        outliers (often, this can simply be set to the same list
+        provided to `x_vals`).
+    threshold : float, optional
+        The modified z-score to use as a threshold for detecting
+        outliers using the MAD algorithm. Observations with a modified
+        z-score (based on the median absolute deviation) greater
+        than this value will be classified as outliers.
+    slope, interc_var, pvalue_var, stderr_var : strings, optional
+        Strings giving the names to use for each of the output
+        regression variables.
+    outliers_var : string, optional
+        String giving the name to use for the output outlier variable.
+
+    Returns:
+    --------
+    regression_df :
+        A `pandas.DataFrame` containing regression parameters and lists
+        of outliers for each row in `y_vals`.
+    """
+
+    y_vals = np.asarray(y_vals, dtype=float)
+    x_vals = np.broadcast_to(np.asarray(x_vals, dtype=float), y_vals.shape)
+    x_labels = np.asarray(x_labels)
+
+    # Mask out invalid NaN values
+    valid = ~np.isnan(y_vals)
+    x_masked = np.where(valid, x_vals, np.nan)
+
+    # Remove outliers using MAD, based on the distance of each
+    # observation from the median x and y values in its row
+    diff = np.sqrt(
+        (x_masked - np.nanmedian(x_masked, axis=1, keepdims=True)) ** 2
+        + (y_vals - np.nanmedian(y_vals, axis=1, keepdims=True)) ** 2
+    )
+    med_abs_deviation = np.nanmedian(diff, axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        modified_z_score = 0.6745 * diff / med_abs_deviation
+    valid &= ~(modified_z_score > threshold)
+
+    # Create string of all outliers and invalid NaN rows, building
+    # each unique combination of excluded observations only once
+    excluded, inverse = np.unique(~valid, axis=0, return_inverse=True)
+    outlier_strs = np.array(
+        [" ".join(map(str, sorted(set(x_labels[i])))) for i in excluded],
+        dtype=object,
+    )[inverse.ravel()]
+
+    # Rows with fewer than three valid observations or zero variance
+    # divide by zero below; these are handled or left as NaN
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Compute means, variances and covariance of valid observations
+        n = valid.sum(axis=1)
+        x_mean = np.where(valid, x_vals, 0).sum(axis=1) / n
+        y_mean = np.where(valid, y_vals, 0).sum(axis=1) / n
+        x_diff = np.where(valid, x_vals - x_mean[:, None], 0)
+        y_diff = np.where(valid, y_vals - y_mean[:, None], 0)
+        ssxm = (x_diff * x_diff).sum(axis=1) / n
+        ssxym = (x_diff * y_diff).sum(axis=1) / n
+        ssym = (y_diff * y_diff).sum(axis=1) / n
+
+        # Compute linear regression. R-values are set to 0 if the
+        # denominator is 0, and clipped to account for numerical error
+        r = np.clip(ssxym / np.sqrt(ssxm * ssym), -1.0, 1.0)
+        r = np.where((ssxm == 0) | (ssym == 0), 0.0, r)
+        slope = ssxym / ssxm
+        intercept = y_mean - slope * x_mean
+
+        # Compute two-sided p-values and standard errors using n - 2
+        # degrees of freedom
+        df = n - 2
+        tiny = 1.0e-20
+        t = r * np.sqrt(df / ((1.0 - r + tiny) * (1.0 + r + tiny)))
+        pvalue = 2 * stdtr(df, -np.abs(t))
+        stderr = np.sqrt((1 - r**2) * ssym / ssxm / df)
+
+    # Handle regressions with only two valid observations
+    two_obs = n == 2
+    pvalue = np.where(two_obs, (ssym == 0).astype(float), pvalue)
+    stderr = np.where(two_obs, 0.0, stderr)
+
+    # Return slope, p-values and list of outlier years excluded from regression
+    return pd.DataFrame(
+        {
+            slope_var: np.round(slope, 3),
+            interc_var: np.round(intercept, 3),
+            pvalue_var: np.round(pvalue, 3),
+            stderr_var: np.round(stderr, 3),
+            outliers_var: outlier_strs,
+        }
+    )
+
+
 def calculate_regressions(points_gdf):
     """
     For each rate of change point along the baseline annual coastline,
@@ -1090,12 +1528,10 @@ def calculate_regressions(points_gdf):
 
     # Compute coastal change rates by linearly regressing annual
     # movements vs. time
-    rate_out = points_subset.apply(
-        lambda row: change_regress(
-            y_vals=row.values.astype(float), x_vals=x_years, x_labels=x_years
-        ),
-        axis=1,
+    rate_out = batch_change_regress(
+        y_vals=points_subset.values.astype(float), x_vals=x_years, x_labels=x_years
     )
+    rate_out.index = points_subset.index
     points_gdf[
         ["rate_time", "incpt_time", "sig_time", "se_time", "outl_time"]
     ] = rate_out
@@ -1376,6 +1812,8 @@ def generate_vectors(
     start_year,
     end_year,
     baseline_year,
+    tide_centre=0.0,
+    raster_bbox=None,
     log=None,
 ):
     ###############################
@@ -1394,7 +1832,12 @@ def generate_vectors(
         water_index=water_index,
         start_year=start_year,
         end_year=end_year,
+        tide_centre=tide_centre,
+        bbox=raster_bbox,
     )
+
+    # Read all rasters into memory, reading files concurrently
+    yearly_ds, gapfill_ds = dask.compute(yearly_ds, gapfill_ds, scheduler="threads")
     log.info(f"Study area {study_area}: Loaded rasters")
 
     # Create output vector folder using supplied vector version string;
@@ -1607,6 +2050,7 @@ def generate_vectors(
         stats_path = (
             f"{output_dir}/ratesofchange_{study_area}_"
             f"{vector_version}_{water_index}_{index_threshold:.2f}"
+            f"{datum_suffix(tide_centre)}"
         )
 
         try:
@@ -1640,8 +2084,8 @@ def generate_vectors(
     # Assign certainty to shorelines based on underlying masks
     contours_gdf = contour_certainty(contours_gdf, certainty_masks)
 
-    # Add tide datum details (this supports future addition of extra tide datums)
-    contours_gdf["tide_datum"] = "0.0 m AMSL"
+    # Add tide datum details
+    contours_gdf["tide_datum"] = f"{float(tide_centre)} m AMSL"
 
     # Add region attributes
     contours_gdf = region_atttributes(
@@ -1651,7 +2095,7 @@ def generate_vectors(
     # Set output path
     contour_path = (
         f"{output_dir}/annualshorelines_{study_area}_{vector_version}_"
-        f"{water_index}_{index_threshold:.2f}"
+        f"{water_index}_{index_threshold:.2f}{datum_suffix(tide_centre)}"
     )
 
     # Clip annual shoreline contours to study area extent
@@ -1735,6 +2179,15 @@ def generate_vectors(
     help="The water index threshold used to extract "
     "subpixel precision shorelines. Defaults to 0.00.",
 )
+@click.option(
+    "--tide_centre",
+    type=float,
+    default=0.0,
+    help="The tide centre (datum) of the input raster data to extract "
+    "shorelines from, matching a value supplied to `--tide_centre` when "
+    "generating rasters. Outputs for datums other than 0.0 are labelled "
+    "with a suffix (e.g. '_datum_1.50'). Defaults to 0.0.",
+)
 @click.option(
     "--start_year",
     type=int,
@@ -1756,6 +2209,16 @@ def generate_vectors(
     "This is typically the most recent annual shoreline in "
     "the dataset (i.e. the same as `--end_year`).",
 )
+@click.option(
+    "--raster_bbox",
+    type=(float, float, float, float),
+    default=None,
+    help="An optional bounding box (left, bottom, right, top) in "
+    "the CRS of the input rasters. If provided, only the window of "
+    "each raster covering this bounding box is read and used to "
+    "extract shorelines, e.g. to quickly reprocess part of a study "
+    "area. Defaults to reading the full extent of each raster.",
+)
 @click.option(
     "--aws_unsigned/--no-aws_unsigned",
     type=bool,
@@ -1776,9 +2239,11 @@ def generate_vectors_cli(
     vector_version,
     water_index,
     index_threshold,
+    tide_centre,
     start_year,
     end_year,
     baseline_year,
+    raster_bbox,
     aws_unsigned,
     overwrite,
 ):
@@ -1788,8 +2253,13 @@ def generate_vectors_cli(
     if vector_version is None:
         vector_version = raster_version
 
-    # Test if study area has already been run by checking if run status file exists
-    run_status_file = f"data/interim/vector/{vector_version}/{study_area}_{vector_version}/run_completed"
+    # Test if study area has already been run by checking if run status
+    # file exists, labelled like our outputs using the water index,
+    # threshold and tide datum
+    run_status_file = (
+        f"data/interim/vector/{vector_version}/{study_area}_{vector_version}/"
+        f"run_completed_{water_index}_{index_threshold:.2f}{datum_suffix(tide_centre)}"
+    )
     output_exists = os.path.exists(run_status_file)
 
     # Skip if outputs exist but overwrite is False
@@ -1817,6 +2287,8 @@ def generate_vectors_cli(
             start_year,
             end_year,
             baseline_year,
+            tide_centre=tide_centre,
+            raster_bbox=raster_bbox,
             log=log,
         )
 
@@ -47,6 +47,7 @@ REQUIRED = [
     "Shapely",
     "tqdm",
     "xarray",
+    "zarr",
 ]
 
 # Package metadata
@@ -76,8 +77,10 @@ setup_kwargs = {
     "entry_points": {
         "console_scripts": [
             "deacoastlines-raster = coastlines.raster:generate_rasters_cli",
+            "deacoastlines-raster-batch = coastlines.raster:generate_rasters_batch_cli",
             "deacoastlines-vector = coastlines.vector:generate_vectors_cli",
             "deacoastlines-continental = coastlines.continental:continental_cli",
+            "deacoastlines-benchmark = coastlines.benchmark:benchmark_cli",
         ]
     },
 }
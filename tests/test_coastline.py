@@ -1,10 +1,63 @@
+import os
+import json
+import uuid
+from types import SimpleNamespace
+
 import pytest
+import dask.array
+import numpy as np
+import pandas as pd
+import rasterio
+import xarray as xr
+import odc.geo.xr
+import geopandas as gpd
+from odc.geo.geobox import GeoBox
+from shapely.geometry import box, LineString, MultiLineString, Point
+from datacube.model import Dataset
+from datacube.testutils import mk_sample_product
+from datacube.utils import geometry
+from datacube.virtual.impl import VirtualDatasetBox
+from shapely.ops import nearest_points
 from click.testing import CliRunner
-from coastlines.raster import generate_rasters_cli
-from coastlines.vector import generate_vectors_cli
+from coastlines.raster import (
+    apply_cloud_mask,
+    coastal_zone_chunks,
+    drop_chunks,
+    export_annual_gapfill,
+    export_annual_gapfill_blocked,
+    export_composite,
+    generate_rasters,
+    generate_rasters_cli,
+    generate_rasters_batch_cli,
+    fused_composite,
+    init_composite_store,
+    load_manifest,
+    plan_chunks,
+    quantise_composite,
+    tidal_composite,
+    tide_cutoffs,
+    tide_mask,
+    tide_prefilter,
+    update_manifest,
+    _buffer_ds,
+    _CatalogueCache,
+    _insert_year,
+)
+from coastlines.benchmark import benchmark_cli, synthetic_dataset
+from coastlines.vector import (
+    annual_movements,
+    batch_change_regress,
+    change_regress,
+    generate_vectors_cli,
+    load_rasters,
+    nearest_coords,
+    sample_bilinear,
+    _decode_quantised,
+)
 from coastlines.continental import continental_cli
 from coastlines.validation import validation_cli
 
+
 @pytest.mark.dependency()
 def test_generate_rasters_cli():
     runner = CliRunner()
@@ -28,6 +81,74 @@ def test_generate_rasters_cli():
     assert result.exit_code == 0
 
 
+@pytest.fixture
+def missing_tide_files(monkeypatch):
+    # Simulate study areas with missing tide modelling files, replacing
+    # datacube, Dask and dataset searches so that no database is needed
+    attempted, closed = [], []
+
+    def find_datasets(dc, config, study_area, *args, **kwargs):
+        attempted.append(study_area)
+        return {}, (None, None)
+
+    def model_box_tides(*args, **kwargs):
+        raise FileNotFoundError("No such file or directory: 'tide_models'")
+
+    monkeypatch.setattr("coastlines.raster.datacube.Datacube", lambda app: None)
+    monkeypatch.setattr("coastlines.raster.load_config", lambda config_path: {})
+    monkeypatch.setattr("coastlines.raster.load_gridcells", lambda config: None)
+    monkeypatch.setattr("coastlines.raster.configure_s3_access", lambda **kw: None)
+    monkeypatch.setattr(
+        "coastlines.raster.create_local_dask_cluster",
+        lambda return_client: SimpleNamespace(close=lambda: closed.append(True)),
+    )
+    monkeypatch.setattr("coastlines.raster.find_study_area_datasets", find_datasets)
+    monkeypatch.setattr("coastlines.raster.model_box_tides", model_box_tides)
+
+    return attempted, closed
+
+
+def test_generate_rasters_cli_missing_tides(missing_tide_files):
+    runner = CliRunner()
+    result = runner.invoke(
+        generate_rasters_cli,
+        [
+            "--config_path",
+            "configs/dea_coastlines_config_tests.yaml",
+            "--study_area",
+            "1",
+            "--raster_version",
+            "tests_missing_tides",
+        ],
+    )
+    assert result.exit_code == 2
+
+
+def test_generate_rasters_batch_cli_missing_tides(missing_tide_files):
+    runner = CliRunner()
+    result = runner.invoke(
+        generate_rasters_batch_cli,
+        [
+            "--config_path",
+            "configs/dea_coastlines_config_tests.yaml",
+            "--study_areas",
+            "1,2",
+            "--raster_version",
+            "tests_missing_tides",
+        ],
+    )
+
+    # Every study area should be attempted and recorded as failed,
+    # before the shared client is closed and the batch exits
+    attempted, closed = missing_tide_files
+    assert result.exit_code == 1
+    assert attempted == ["1", "2"]
+    assert closed == [True]
+    assert not os.path.exists(
+        "data/interim/raster/tests_missing_tides/1_tests_missing_tides/run_completed"
+    )
+
+
 @pytest.mark.dependency(depends=["test_generate_rasters_cli"])
 def test_generate_vector_cli():
     runner = CliRunner()
@@ -51,6 +172,62 @@ def test_generate_vector_cli():
     assert result.exit_code == 0
 
 
+@pytest.mark.dependency(depends=["test_generate_vector_cli"])
+def test_quantised_rasters():
+    runner = CliRunner()
+    result = runner.invoke(
+        generate_rasters_cli,
+        [
+            "--config_path",
+            "configs/dea_coastlines_config_tests.yaml",
+            "--study_area",
+            "1",
+            "--raster_version",
+            "tests_quantised",
+            "--start_year",
+            "1988",
+            "--end_year",
+            "2021",
+            "--buffer",
+            "0.0",
+            "--quantise",
+        ],
+    )
+    assert result.exit_code == 0
+
+    result = runner.invoke(
+        generate_vectors_cli,
+        [
+            "--config_path",
+            "configs/dea_coastlines_config_tests.yaml",
+            "--study_area",
+            "1",
+            "--raster_version",
+            "tests_quantised",
+            "--start_year",
+            "1988",
+            "--end_year",
+            "2021",
+            "--baseline_year",
+            "2021",
+        ],
+    )
+    assert result.exit_code == 0
+
+    # Shorelines extracted from quantised rasters should be within a
+    # tenth of a pixel (3 m) of those extracted from float rasters
+    shorelines = [
+        gpd.read_file(
+            f"data/interim/vector/{version}/1_{version}/"
+            f"annualshorelines_1_{version}_mndwi_0.00.shp"
+        ).set_index("year")
+        for version in ["tests", "tests_quantised"]
+    ]
+    assert (shorelines[0].index == shorelines[1].index).all()
+    distances = shorelines[0].geometry.hausdorff_distance(shorelines[1].geometry)
+    assert distances.max() < 3.0
+
+
 @pytest.mark.dependency(depends=["test_generate_vector_cli"])
 def test_generate_continental_cli():
     runner = CliRunner()
@@ -72,6 +249,7 @@ def test_generate_continental_cli():
     # assert result.output == '' # for debugging
     assert result.exit_code == 0
 
+
 @pytest.mark.dependency(depends=["test_generate_continental_cli"])
 def test_validation_cli():
     runner = CliRunner()
@@ -91,4 +269,891 @@ def test_validation_cli():
         ],
     )
     # assert result.output == '' # for debugging
-    assert result.exit_code == 0  
+    assert result.exit_code == 0
+
+
+def test_benchmark_cli(tmp_path):
+    output_path = str(tmp_path / "benchmarks.csv")
+    runner = CliRunner()
+    result = runner.invoke(
+        benchmark_cli,
+        [
+            "--shape",
+            "256",
+            "256",
+            "--n_years",
+            "3",
+            "--scenes_per_year",
+            "4",
+            "--chunk_size",
+            "128",
+            "--output_path",
+            output_path,
+        ],
+    )
+    assert result.exit_code == 0
+
+    # Every stage should be benchmarked, with valid times and memory use
+    results = pd.read_csv(output_path, index_col="benchmark")
+    assert results.index.tolist() == [
+        "apply_cloud_mask",
+        "tide_cutoffs",
+        "tide_mask",
+        "load_tidal_subset",
+        "tidal_composite",
+        "export_annual_gapfill",
+        "export_annual_gapfill_blocked",
+    ]
+    assert (results[["seconds", "peak_memory_mb"]] >= 0).all().all()
+
+
+def _random_year(rng, n_times, shape=(20, 30), nan_frac=0.3):
+    # Random float32 water index observations, with a fraction of
+    # pixels masked as NaN to mimic cloud and tide masking
+    values = rng.uniform(-1, 1, (n_times, *shape)).astype("float32")
+    values[rng.random(values.shape) < nan_frac] = np.nan
+    return xr.Dataset(
+        {"mndwi": (("time", "y", "x"), values)},
+        coords={"y": np.arange(shape[0]) * -30.0, "x": np.arange(shape[1]) * 30.0},
+    )
+
+
+def test_gapfill_stdev_matches_xarray():
+    # Gapfill composites are computed from a view across the three
+    # slots of a ring buffer, which are not always in chronological
+    # order. Standard deviations can therefore differ from those of
+    # the concatenated years by float32 rounding only, well within a
+    # relative tolerance of 1e-5
+    rng = np.random.default_rng(0)
+    years = [_random_year(rng, n) for n in (5, 9, 7)]
+    template = years[0].isel(time=0, drop=True)
+    buffers = {"mndwi": np.empty((3, 0, 20, 30), dtype="float32")}
+    for slot, year_ds in zip([2, 0, 1], years):
+        _insert_year(buffers, slot, year_ds)
+
+    gapfill_ds = tidal_composite(
+        _buffer_ds(buffers, None, template),
+        label=2000,
+        label_dim="year",
+        output_dir=None,
+    ).squeeze("year", drop=True)
+    expected = xr.concat(years, dim="time").mndwi
+
+    xr.testing.assert_allclose(
+        gapfill_ds.stdev, expected.std(dim="time"), rtol=1e-5, atol=1e-6
+    )
+    assert (gapfill_ds["count"] == expected.count(dim="time")).all()
+
+
+def test_fused_composite_matches_xarray():
+    # Include pixels and entire blocks of rows with no valid data, and
+    # use a small block size so rows are split across many blocks
+    rng = np.random.default_rng(0)
+    da = _random_year(rng, 12, shape=(40, 25)).mndwi
+    da[:, 5, 7] = np.nan
+    da[:, 30:, :] = np.nan
+
+    median, stdev, count = fused_composite(da.values, block_size=2**12)
+
+    np.testing.assert_array_equal(median, da.median(dim="time").values)
+    np.testing.assert_array_equal(stdev, da.std(dim="time").values)
+    np.testing.assert_array_equal(count, da.count(dim="time").values)
+
+
+def test_plan_chunks(caplog):
+    shape = (3000, 2000)
+
+    # With ample memory and a single thread, each spatial chunk covers
+    # the entire study area
+    chunks = plan_chunks(shape, n_times=100, memory_limit="64GB")
+    assert chunks == {"time": 4, "y": 3000, "x": 2000}
+
+    # With limited memory, chunks should fit within each thread's share
+    # of memory, keep all threads busy, and be evenly sized
+    chunks = plan_chunks(
+        shape,
+        n_times=100,
+        n_composite_times=60,
+        memory_limit="2GB",
+        threads_per_worker=4,
+        n_workers=2,
+    )
+    t, y, x = chunks["time"], chunks["y"], chunks["x"]
+    budget = 2e9 * 0.5 / 4
+    assert 60 * y * x * 4 * 3 <= budget
+    assert t * (y + 20) * (x + 20) * 4 * 8 <= budget
+    assert -(-3000 // y) * -(-2000 // x) * -(-100 // t) >= 8
+    for size, chunk in zip(shape, (y, x)):
+        n_chunks = -(-size // chunk)
+        assert size - chunk * (n_chunks - 1) > chunk - n_chunks
+
+    # If no chunks fit in memory, the smallest chunks are used
+    chunks = plan_chunks(shape, n_times=100, memory_limit="1MB")
+    assert chunks == {"time": 1, "y": 250, "x": 250}
+    assert "Unable to plan Dask chunks" in caplog.text
+
+
+def test_quantise_round_trip():
+    # Quantised water index and standard deviation values should be
+    # decoded to within one quantisation step of the original values,
+    # for both Zarr (CF-style) and GeoTIFF (rasterio-style) metadata
+    rng = np.random.default_rng(0)
+    median_ds = _random_year(rng, 1).isel(time=0)
+    median_ds["stdev"] = np.abs(median_ds.mndwi) / 2
+    median_ds["count"] = median_ds.mndwi.notnull().astype("int16")
+
+    quantised_ds = quantise_composite(median_ds, scale=1e-4)
+    assert quantised_ds.mndwi.dtype == "int16"
+    xr.testing.assert_identical(quantised_ds["count"], median_ds["count"])
+
+    for var_name in ["mndwi", "stdev"]:
+        quantised = quantised_ds[var_name]
+        geotiff_style = quantised.copy()
+        geotiff_style.attrs = {
+            "scales": (quantised.scale_factor,),
+            "offsets": (quantised.add_offset,),
+            "nodatavals": (quantised.nodata,),
+        }
+        for encoded in [quantised, geotiff_style]:
+            decoded = _decode_quantised(encoded)
+            assert decoded.dtype == "float32"
+            np.testing.assert_array_equal(
+                decoded.isnull(), median_ds[var_name].isnull()
+            )
+            assert float(np.abs(decoded - median_ds[var_name]).max()) <= 1e-4
+
+
+def test_load_manifest(tmp_path):
+    settings = {"start_year": 2000, "quantise": False}
+    manifest_path = str(tmp_path / "manifest.json")
+    (tmp_path / "2000_mndwi.tif").touch()
+    empty = {"settings": settings, "completed": {}}
+
+    # Only composites with all outputs on disk are treated as complete
+    manifest = load_manifest(manifest_path, settings)
+    assert manifest == empty
+    update_manifest(manifest_path, manifest, 2000, "annual", ["2000_mndwi.tif"])
+    update_manifest(manifest_path, manifest, 2001, "annual", ["2001_mndwi.tif"])
+    manifest = load_manifest(manifest_path, settings)
+    assert manifest["completed"] == {"annual": {"2000": ["2000_mndwi.tif"]}}
+
+    # Manifests created with different settings are discarded
+    assert (
+        load_manifest(manifest_path, dict(settings, quantise=True))["completed"] == {}
+    )
+
+    # Truncated or corrupt manifests are treated as empty
+    with open(manifest_path) as f:
+        text = f.read()
+    for contents in [
+        text[: len(text) // 2],
+        b"\xff\xfe\x00\x01",
+        "[]",
+        json.dumps({"settings": settings}),
+        json.dumps({"settings": settings, "completed": ["annual"]}),
+    ]:
+        with open(manifest_path, "wb" if isinstance(contents, bytes) else "w") as f:
+            f.write(contents)
+        assert load_manifest(manifest_path, settings) == empty
+
+    # Corrupt entries are ignored
+    with open(manifest_path, "w") as f:
+        json.dump(
+            {
+                "settings": settings,
+                "completed": {"annual": {"2000": "2000_mndwi.tif"}, "gapfill": None},
+            },
+            f,
+        )
+    assert load_manifest(manifest_path, settings)["completed"] == {"annual": {}}
+
+
+def test_coastal_zone_chunks():
+    # A 40 x 60 pixel study area, split into 4 x 3 chunks of 10 x 20
+    # pixels, with a small coastal zone inside the second chunk in
+    # both dimensions
+    geobox = GeoBox.from_bbox((0, 0, 1800, 1200), crs="EPSG:3577", resolution=30)
+    ds = odc.geo.xr.xr_zeros(geobox, dtype="float32", chunks=(10, 20)).to_dataset(
+        name="mndwi"
+    )
+    coastal_zone_gdf = gpd.GeoDataFrame(
+        geometry=[box(700, 650, 800, 750)], crs="EPSG:3577"
+    )
+
+    keep = coastal_zone_chunks(ds, coastal_zone_gdf, buffer_pixels=0)
+    expected = np.zeros((4, 3), dtype=bool)
+    expected[1, 1] = True
+    np.testing.assert_array_equal(keep, expected)
+
+    # Buffering the zone by 4 pixels (120 m) extends it into
+    # neighbouring chunks to the west and south
+    keep = coastal_zone_chunks(ds, coastal_zone_gdf, buffer_pixels=4)
+    expected[1:3, 0:2] = True
+    np.testing.assert_array_equal(keep, expected)
+
+
+def test_drop_chunks():
+    # Count the chunks that are computed from the original data
+    loaded = []
+
+    def _load(block):
+        loaded.append(block.shape)
+        return block
+
+    rng = np.random.default_rng(0)
+    values = rng.random((4, 40, 60))
+    data = dask.array.from_array(values, chunks=(2, 10, 20))
+    ds = xr.Dataset(
+        {
+            "mndwi": (
+                ("time", "y", "x"),
+                data.map_blocks(_load, meta=np.array((), dtype=data.dtype)),
+            ),
+            "count": (("y", "x", "time"), (data > 0.5).transpose(1, 2, 0)),
+            "nodata": (("time", "y", "x"), (data * 100).astype("int16")),
+        }
+    )
+    ds["nodata"].attrs["nodata"] = -999
+
+    keep = np.zeros((4, 3), dtype=bool)
+    keep[1, 1] = keep[3, 0] = True
+    dropped = drop_chunks(ds, keep)
+    with dask.config.set(scheduler="sync"):
+        dropped = dropped.compute()
+
+    # Only kept chunks should be computed, and outputs should preserve
+    # the dimension order and values of kept chunks
+    assert len(loaded) == 2 * keep.sum()
+    for var_name in ds.data_vars:
+        assert dropped[var_name].dims == ds[var_name].dims
+    kept = np.kron(keep, np.ones((10, 20), dtype=bool))
+    mndwi = dropped.mndwi.values
+    np.testing.assert_array_equal(mndwi[:, kept], values[:, kept])
+    assert np.isnan(mndwi[:, ~kept]).all()
+    assert not dropped["count"].values[~kept].any()
+    assert (dropped["nodata"].values[:, ~kept] == -999).all()
+
+
+def test_load_rasters_bbox(tmp_path):
+    # Write a small tile of annual and gapfill GeoTIFFs on a 30 m grid
+    rng = np.random.default_rng(0)
+    output_dir = tmp_path / "v1" / "1_v1"
+    output_dir.mkdir(parents=True)
+    transform = rasterio.transform.from_origin(1000, 2000, 30, 30)
+    for year in [2000, 2001, 2002]:
+        for layer_type in ["", "_gapfill"]:
+            for layer_name in ["mndwi", "count", "stdev"]:
+                with rasterio.open(
+                    output_dir / f"{year}_{layer_name}{layer_type}.tif",
+                    mode="w",
+                    driver="GTiff",
+                    width=25,
+                    height=15,
+                    count=1,
+                    dtype="float32",
+                    crs="EPSG:3577",
+                    transform=transform,
+                ) as dst:
+                    dst.write(rng.random((1, 15, 25), dtype="float32"))
+
+    # Bounding box partially covering pixels, which should be expanded
+    # to whole pixels (rows 3 to 12, columns 5 to 20)
+    bbox = (
+        1000 + 30 * 5 + 10,
+        2000 - 30 * 12 + 5,
+        1000 + 30 * 20 - 10,
+        2000 - 30 * 3 - 5,
+    )
+    window = dict(y=slice(3, 12), x=slice(5, 20))
+
+    full = dask.compute(*load_rasters(str(tmp_path), "v1", 1))
+    windowed = dask.compute(*load_rasters(str(tmp_path), "v1", 1, bbox=bbox))
+    for full_ds, windowed_ds in zip(full, windowed):
+        assert windowed_ds.sizes == {"year": 3, "y": 9, "x": 15}
+        assert windowed_ds.odc.geobox == full_ds.isel(window).odc.geobox
+        xr.testing.assert_allclose(windowed_ds, full_ds.isel(window), rtol=0, atol=0)
+
+    # Bounding boxes extending beyond the grid are clipped to its extent
+    windowed = dask.compute(
+        *load_rasters(str(tmp_path), "v1", 1, bbox=(0, 0, 9e9, 9e9))
+    )
+    for full_ds, windowed_ds in zip(full, windowed):
+        xr.testing.assert_allclose(windowed_ds, full_ds, rtol=0, atol=0)
+
+    # Reads from a Zarr store give identical results
+    composites = xr.concat(full, dim=pd.Index(["annual", "gapfill"], name="composite"))
+    for tif in output_dir.glob("*.tif"):
+        tif.unlink()
+    composites.to_zarr(output_dir / "composites.zarr")
+    windowed = dask.compute(*load_rasters(str(tmp_path), "v1", 1, bbox=bbox))
+    for full_ds, windowed_ds in zip(full, windowed):
+        xr.testing.assert_allclose(windowed_ds, full_ds.isel(window), rtol=0, atol=0)
+
+
+def test_nearest_coords():
+    # Multi-part line with many short segments, and points both near
+    # and far from the line
+    rng = np.random.default_rng(0)
+    line = MultiLineString(
+        [
+            np.column_stack([np.linspace(0, 1000, 200), rng.normal(0, 20, 200)]),
+            np.column_stack([rng.normal(1500, 20, 100), np.linspace(0, 800, 100)]),
+        ]
+    )
+    points = gpd.GeoSeries.from_xy(
+        rng.uniform(-500, 2500, 300), rng.uniform(-500, 1500, 300)
+    )
+    expected = np.array([nearest_points(p, line)[1].coords[0] for p in points])
+
+    for max_distance in [None, 100]:
+        coords = nearest_coords(points, line, max_distance=max_distance)
+        np.testing.assert_allclose(coords, expected, rtol=0, atol=1e-9)
+
+    # Empty lines have no nearest point
+    for max_distance in [None, 100]:
+        coords = nearest_coords(points, MultiLineString(), max_distance=max_distance)
+        assert coords.shape == (300, 2)
+        assert np.isnan(coords).all()
+
+
+def test_annual_movements_empty_year():
+    # Water index increasing towards the ocean in the east, with a
+    # north-south coastline 100 m inland of the baseline coastline, and
+    # a year with no extracted coastline
+    x = np.arange(15, 3000, 30.0)
+    y = np.arange(2985, 0, -30.0)
+    yearly_ds = xr.Dataset(
+        {
+            "mndwi": (
+                ("year", "y", "x"),
+                np.broadcast_to((x - 1500) / 1500, (3, len(y), len(x))),
+            )
+        },
+        coords={"year": [2000, 2001, 2002], "x": x, "y": y},
+    )
+    contours_gdf = gpd.GeoDataFrame(
+        geometry=[
+            MultiLineString([LineString([(1400, 0), (1400, 3000)])]),
+            MultiLineString(),
+            MultiLineString([LineString([(1500, 0), (1500, 3000)])]),
+        ],
+        index=pd.Index(["2000", "2001", "2002"], name="year"),
+        crs="EPSG:3577",
+    )
+    points_gdf = gpd.GeoDataFrame(
+        geometry=[Point(1500, y) for y in [500, 1500, 2500]], crs="EPSG:3577"
+    )
+
+    result = annual_movements(points_gdf, contours_gdf, yearly_ds, "2002", "mndwi")
+
+    assert result["dist_2001"].isna().all()
+    np.testing.assert_allclose(result["dist_2000"], -100.0)
+    np.testing.assert_allclose(result["dist_2002"], 0.0)
+    assert (result["angle_mean"] >= 0).all() and (result["angle_mean"] <= 180).all()
+
+
+def test_sample_bilinear():
+    # Three years of float64 data on a 30 m grid with descending y
+    # coordinates, and points both inside and outside its extent
+    rng = np.random.default_rng(0)
+    x = np.arange(15, 600, 30.0)
+    y = np.arange(585, 0, -30.0)
+    da = xr.DataArray(
+        rng.random((3, len(y), len(x))),
+        dims=("year", "y", "x"),
+        coords={"year": [2000, 2001, 2002], "x": x, "y": y},
+    )
+    index = rng.integers(0, 3, 1000)
+    px = rng.uniform(-50, 650, 1000)
+    py = rng.uniform(-50, 650, 1000)
+
+    # Compare against `xarray.DataArray.interp` for each point's year
+    expected = da.interp(x=xr.DataArray(px, dims="z"), y=xr.DataArray(py, dims="z"))
+    expected = expected.values[index, np.arange(len(index))]
+    sampled = sample_bilinear(da, index, px, py)
+    np.testing.assert_allclose(sampled, expected, rtol=0, atol=1e-12)
+    outside = (px < x[0]) | (px > x[-1]) | (py < y[-1]) | (py > y[0])
+    assert outside.any() and np.isnan(sampled[outside]).all()
+
+    # Points with any NaN pixels among their four surrounding pixels
+    # return NaN, while other points are unaffected
+    nan_da = da.where(rng.random(da.shape) > 0.05)
+    col = np.floor((px - x[0]) / 30).astype(int)
+    row = np.floor((y[0] - py) / 30).astype(int)
+    nan_neighbour = np.zeros(len(index), dtype=bool)
+    for i, j in [(0, 0), (0, 1), (1, 0), (1, 1)]:
+        r = np.clip(row + i, 0, len(y) - 1)
+        c = np.clip(col + j, 0, len(x) - 1)
+        nan_neighbour |= np.isnan(nan_da.values[index, r, c])
+    sampled = sample_bilinear(nan_da, index, px, py)
+    assert nan_neighbour[~outside].any()
+    assert np.isnan(sampled[nan_neighbour | outside]).all()
+    np.testing.assert_allclose(
+        sampled[~(nan_neighbour | outside)],
+        expected[~(nan_neighbour | outside)],
+        rtol=0,
+        atol=1e-12,
+    )
+
+
+@pytest.mark.filterwarnings("error::RuntimeWarning")
+def test_batch_change_regress():
+    # Annual distances with random trends, noise, missing values and
+    # outliers, including rows with only two valid observations (rows
+    # with constant values are avoided, as `scipy.stats.linregress`
+    # returns different r-values for these across SciPy versions).
+    # Divisions by zero in these rows must not emit warnings
+    rng = np.random.default_rng(0)
+    x_years = np.arange(1988, 2022)
+    y_vals = rng.normal(0, 1, (300, 1)) * (x_years - 2021) + rng.normal(
+        0, 5, (300, len(x_years))
+    )
+    y_vals[rng.random(y_vals.shape) < 0.2] = np.nan
+    outliers = rng.random(y_vals.shape) < 0.05
+    y_vals[outliers] += rng.choice([-200, 200], outliers.sum())
+    y_vals[:20, 2:] = np.nan
+    y_vals[:20, :2] = rng.normal(0, 5, (20, 2))
+
+    result = batch_change_regress(y_vals, x_years, x_years)
+    expected = pd.DataFrame([change_regress(row, x_years, x_years) for row in y_vals])
+
+    # Outliers must match exactly, while regression parameters (rounded
+    # to 3 decimal places) may differ by one unit in the last decimal
+    # place due to floating point rounding ties
+    n_excluded = result.outliers.str.split().str.len().sum()
+    assert n_excluded > np.isnan(y_vals).sum()
+    assert result.stderr.iloc[:20].eq(0).all()
+    pd.testing.assert_series_equal(result.outliers, expected.outliers)
+    for col in ["slope", "intercept", "pvalue", "stderr"]:
+        np.testing.assert_allclose(result[col], expected[col], rtol=0, atol=1.001e-3)
+
+
+def test_tide_prefilter():
+    # Low resolution tides on a 4 x 4 grid of 1000 m pixels, ranging
+    # from -2 to 2 m at every pixel so that cutoffs are -1 to 1 m for a
+    # tide centre of 0.0, and 0.5 to 2.5 m for a tide centre of 1.5
+    geobox = GeoBox.from_bbox((0, 0, 4000, 4000), "EPSG:3577", resolution=1000)
+    times = pd.date_range("2000-01-01", periods=4).values
+    tides = np.stack(
+        [
+            np.full((4, 4), -2.0),
+            np.full((4, 4), 2.0),
+            np.where(np.arange(4) == 0, 0.0, -1.8)[None].repeat(4, axis=0),
+            np.full((4, 4), 1.8),
+        ]
+    )
+    tides_lowres = xr.DataArray(
+        tides,
+        dims=("time", "y", "x"),
+        coords={"time": times, **odc.geo.xr.xr_coords(geobox)},
+    )
+
+    # Datasets named by their footprint and acquisition time
+    def _dataset(name, left, right):
+        return SimpleNamespace(
+            name=name,
+            extent=geometry.box(left, 0, right, 4000, geometry.CRS("EPSG:3577")),
+        )
+
+    entries = [
+        (_dataset("low", 0, 4000),),
+        (_dataset("high", 0, 4000),),
+        (
+            # Buffered by 2000 m, this footprint reaches the centre of
+            # the first column of pixels, which is inside the cutoffs
+            _dataset("near", 2400, 4000),
+            # Buffered by 2000 m, this footprint only covers pixels
+            # outside the cutoffs of every tide centre
+            _dataset("far", 3600, 4000),
+        ),
+        (_dataset("datum", 0, 4000),),
+    ]
+    box_da = xr.DataArray(
+        np.empty(4, dtype=object), dims="time", coords={"time": times}
+    )
+    for i, entry in enumerate(entries):
+        box_da.values[i] = entry
+    datasets_box = VirtualDatasetBox(box_da, None, True, {})
+
+    def _names(filtered_box):
+        return sorted(d.name for entry in filtered_box.box.values for d in entry)
+
+    # Datasets entirely outside the cutoffs are dropped, along with
+    # timesteps left without any datasets
+    filtered = tide_prefilter(datasets_box, tides_lowres, tide_centre=0.0)
+    assert _names(filtered) == ["near"]
+    assert list(filtered.box.time.values) == [times[2]]
+
+    # Without buffering, no footprint reaches the cutoffs; the first
+    # timestep is then retained so that data can still be loaded
+    filtered = tide_prefilter(
+        datasets_box, tides_lowres, tide_centre=0.0, buffer_pixels=0
+    )
+    assert _names(filtered) == ["low"]
+
+    # Datasets inside the cutoffs of any tide centre are retained
+    filtered = tide_prefilter(datasets_box, tides_lowres, tide_centre=[0.0, 1.5])
+    assert _names(filtered) == ["datum", "high", "near"]
+    filtered = tide_prefilter(datasets_box, tides_lowres, tide_centre=[1.5])
+    assert _names(filtered) == ["datum", "high"]
+
+
+class _FakeIndex:
+    # A minimal datacube index containing a list of active datasets
+    def __init__(self, product, datasets):
+        self.active = datasets
+        self.products = SimpleNamespace(
+            get_by_name=lambda name: product,
+            search=lambda **kwargs: [product],
+            get_all=lambda: [product],
+        )
+        self.datasets = SimpleNamespace(
+            get_field_names=lambda product_name=None: ["time", "lat", "lon"],
+            search_returning=lambda fields, **query: [
+                SimpleNamespace(id=d.id) for d in self.active
+            ],
+        )
+
+
+def test_catalogue_cache(tmp_path):
+    # Fake datacube that records each full search of its index
+    product = mk_sample_product("ls8_sr")
+
+    def _dataset(name):
+        doc = {"id": str(uuid.uuid4()), "product": {"name": "ls8_sr"}}
+        return Dataset(product, doc, uris=[f"file:///{name}.yaml"])
+
+    searches = []
+    dc = SimpleNamespace(
+        index=_FakeIndex(product, [_dataset("a"), _dataset("b")]),
+        find_datasets=lambda **kwargs: searches.append(kwargs) or dc.index.active,
+    )
+    cache = _CatalogueCache(dc, str(tmp_path / "catalogue.sqlite"))
+    terms = dict(product="ls8_sr", time=("2000-01-01", "2000-12-31"))
+
+    def _find():
+        return [(str(d.id), d.uris) for d in cache.find_datasets(**terms)]
+
+    def _expected():
+        return [(str(d.id), d.uris) for d in dc.index.active]
+
+    # Cache miss, followed by a cache hit that is reconstructed
+    # without searching the index
+    assert _find() == _expected() and len(searches) == 1
+    assert _find() == _expected() and len(searches) == 1
+
+    # Datasets added to the index invalidate the cache
+    dc.index.active = dc.index.active + [_dataset("c")]
+    assert _find() == _expected() and len(searches) == 2
+    assert _find() == _expected() and len(searches) == 2
+
+    # Archiving a dataset and indexing its replacement leaves the count
+    # of datasets unchanged, but still invalidates the cache
+    dc.index.active = dc.index.active[:2] + [_dataset("c_reprocessed")]
+    assert _find() == _expected() and len(searches) == 3
+    uris = [uri for _, dataset_uris in _find() for uri in dataset_uris]
+    assert "file:///c.yaml" not in uris and "file:///c_reprocessed.yaml" in uris
+
+
+def _synthetic_ds():
+    # Small synthetic study area with four years of data, and a second
+    # water index derived non-linearly from MNDWI
+    ds, tides_lowres = synthetic_dataset(
+        shape=(32, 48), n_years=4, scenes_per_year=4, chunk_size=32
+    )
+    return ds.assign(ndwi=np.sin(3 * ds.mndwi)), tides_lowres
+
+
+def _synthetic_index_ds(water_index=("mndwi",)):
+    # Cloud-masked water indices, as returned by `load_water_index`
+    ds, tides_lowres = _synthetic_ds()
+    return apply_cloud_mask(ds[list(water_index)], ds.cloud_mask), tides_lowres
+
+
+def _export_synthetic(
+    output_dir, index_ds, tides_lowres, tide_centres, block_size=None, **kwargs
+):
+    # Export annual and gapfill composites for 2001 and 2002 as in
+    # `generate_rasters`, recording completed composites in a manifest
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = f"{output_dir}/manifest.json"
+    manifest = load_manifest(manifest_path, settings={})
+    if block_size is None:
+        tide_cutoff_min, tide_cutoff_max = tide_cutoffs(
+            index_ds, tides_lowres, tide_centre=tide_centres
+        )
+        export_annual_gapfill(
+            index_ds.assign(
+                tide_mask=tide_mask(
+                    index_ds, tides_lowres, tide_cutoff_min, tide_cutoff_max
+                )
+            ),
+            output_dir,
+            tide_cutoff_min,
+            tide_cutoff_max,
+            2001,
+            2002,
+            manifest=manifest,
+            manifest_path=manifest_path,
+            **kwargs,
+        )
+    else:
+        export_annual_gapfill_blocked(
+            index_ds,
+            tides_lowres,
+            output_dir,
+            tide_centres,
+            2001,
+            2002,
+            block_size=block_size,
+            manifest=manifest,
+            manifest_path=manifest_path,
+            **kwargs,
+        )
+
+    return manifest
+
+
+def _read_outputs(output_dir):
+    # Read pixels of all output GeoTIFFs, keyed by file name
+    outputs = {}
+    for fname in sorted(os.listdir(output_dir)):
+        if fname.endswith(".tif"):
+            with rasterio.open(os.path.join(output_dir, fname)) as src:
+                outputs[fname] = src.read(1)
+    return outputs
+
+
+@pytest.mark.parametrize("block_size", [None, 32])
+def test_export_multiple_tide_centres(tmp_path, block_size):
+    index_ds, tides_lowres = _synthetic_index_ds()
+
+    # Export composites for two tide datums in a single run, and for
+    # each tide datum separately
+    combined = _export_synthetic(
+        tmp_path / "combined", index_ds, tides_lowres, [0.0, 0.5], block_size
+    )
+    separate = {"completed": {}}
+    separate_outputs = {}
+    for tide_centre in [0.0, 0.5]:
+        output_dir = tmp_path / str(tide_centre)
+        manifest = _export_synthetic(
+            output_dir, index_ds, tides_lowres, [tide_centre], block_size
+        )
+        separate["completed"].update(manifest["completed"])
+        separate_outputs.update(_read_outputs(output_dir))
+
+    # Both produce identical files, pixels and manifest entries
+    combined_outputs = _read_outputs(tmp_path / "combined")
+    assert "2001_mndwi_gapfill_datum_0.50.tif" in combined_outputs
+    assert combined_outputs.keys() == separate_outputs.keys()
+    for fname, array in combined_outputs.items():
+        np.testing.assert_array_equal(array, separate_outputs[fname])
+    assert combined["completed"] == separate["completed"]
+    assert sorted(combined["completed"]) == [
+        "annual",
+        "annual_datum_0.50",
+        "gapfill",
+        "gapfill_datum_0.50",
+    ]
+
+
+def test_generate_rasters_duplicate_tide_centres():
+    # Tide centres with identical output labels are rejected before any
+    # data is found or loaded
+    for tide_centre in [[1.5, 1.5], [1.499, 1.501], [0.0, -0.0]]:
+        with pytest.raises(ValueError, match="must be unique"):
+            generate_rasters(None, {}, "1", "v1", 2001, 2002, tide_centre, 0.05)
+
+
+@pytest.mark.parametrize("block_size", [None, 32])
+@pytest.mark.parametrize("write_threads", [0, 2])
+def test_export_write_errors(tmp_path, monkeypatch, block_size, write_threads):
+    # Patch composite writes to fail for the 2002 annual composite,
+    # recording all other writes that succeeded. Calls that write no
+    # outputs (e.g. from `tidal_composite`) are passed through
+    succeeded = set()
+
+    def _export_composite(median_ds, label, output_dir, output_suffix="", **kwargs):
+        writes = kwargs["export_geotiff"] or kwargs["output_store"] is not None
+        if writes and (label, output_suffix) == (2002, ""):
+            raise RuntimeError("Failed write")
+        export_composite(median_ds, label, output_dir, output_suffix, **kwargs)
+        if writes:
+            succeeded.add((str(label), output_suffix))
+
+    monkeypatch.setattr("coastlines.raster.export_composite", _export_composite)
+
+    # Write errors are raised from both serial and background writes
+    index_ds, tides_lowres = _synthetic_index_ds()
+    with pytest.raises(RuntimeError, match="Failed write"):
+        _export_synthetic(
+            tmp_path,
+            index_ds,
+            tides_lowres,
+            [0.0],
+            block_size,
+            write_threads=write_threads,
+        )
+
+    # Only composites that were written successfully are recorded as
+    # complete; composites written block by block are only recorded
+    # once all blocks are complete. The manifest is read directly, as
+    # `load_manifest` would discard entries with missing outputs
+    completed = {}
+    if os.path.exists(tmp_path / "manifest.json"):
+        with open(tmp_path / "manifest.json") as f:
+            completed = json.load(f)["completed"]
+    recorded = {
+        (year, "" if composite == "annual" else "_gapfill")
+        for composite, years in completed.items()
+        for year in years
+    }
+    assert ("2002", "") not in recorded
+    assert recorded <= succeeded
+    if block_size is None:
+        assert {("2001", ""), ("2001", "_gapfill")} <= recorded
+    else:
+        assert not recorded
+
+
+@pytest.mark.parametrize("block_size", [None, 32])
+def test_export_write_threads(tmp_path, block_size):
+    # Writing composites in background threads produces outputs and
+    # manifests identical to writing them serially
+    index_ds, tides_lowres = _synthetic_index_ds()
+    manifests, outputs = {}, {}
+    for write_threads in [0, 2]:
+        output_dir = tmp_path / str(write_threads)
+        manifests[write_threads] = _export_synthetic(
+            output_dir,
+            index_ds,
+            tides_lowres,
+            [0.0],
+            block_size,
+            write_threads=write_threads,
+        )
+        outputs[write_threads] = _read_outputs(output_dir)
+
+    assert manifests[0] == manifests[2]
+    assert outputs[0].keys() == outputs[2].keys()
+    for fname, array in outputs[0].items():
+        np.testing.assert_array_equal(array, outputs[2][fname])
+
+
+def test_export_multiple_water_indices(tmp_path):
+    # Cloud masking a dataset of water indices masks each index
+    # identically to masking it individually
+    ds, _ = _synthetic_ds()
+    masked_ds = apply_cloud_mask(ds[["mndwi", "ndwi"]], ds.cloud_mask)
+    for water_index in ["mndwi", "ndwi"]:
+        xr.testing.assert_identical(
+            masked_ds[water_index], apply_cloud_mask(ds[water_index], ds.cloud_mask)
+        )
+
+    # Export composites for two water indices in a single run, into the
+    # directory structure read by `load_rasters`, and for each water
+    # index separately
+    output_dir = tmp_path / "raster" / "v1" / "1_v1"
+    _export_synthetic(output_dir, *_synthetic_index_ds(["mndwi", "ndwi"]), [0.0])
+    combined = _read_outputs(output_dir)
+    for water_index in ["mndwi", "ndwi"]:
+        _export_synthetic(
+            tmp_path / water_index, *_synthetic_index_ds([water_index]), [0.0]
+        )
+
+    # Statistics for the first index are unsuffixed, while those for
+    # additional indices are suffixed with the index name
+    assert {fname.split("_", 1)[1] for fname in combined} == {
+        f"{var}{suffix}.tif"
+        for var in ["mndwi", "stdev", "count", "ndwi", "stdev_ndwi", "count_ndwi"]
+        for suffix in ["", "_gapfill"]
+    }
+
+    # Outputs are identical to separate single-index runs
+    expected = _read_outputs(tmp_path / "mndwi")
+    for fname, array in _read_outputs(tmp_path / "ndwi").items():
+        fname = fname.replace("_stdev", "_stdev_ndwi").replace("_count", "_count_ndwi")
+        expected[fname] = array
+    assert combined.keys() == expected.keys()
+    for fname, array in combined.items():
+        np.testing.assert_array_equal(array, expected[fname])
+
+    # Export the same composites into a Zarr store
+    index_ds, tides_lowres = _synthetic_index_ds(["mndwi", "ndwi"])
+    zarr_dir = tmp_path / "zarr" / "v1" / "1_v1"
+    zarr_dir.mkdir(parents=True)
+    init_composite_store(str(zarr_dir / "composites.zarr"), index_ds, range(2000, 2003))
+    _export_synthetic(
+        zarr_dir,
+        index_ds,
+        tides_lowres,
+        [0.0],
+        output_store=str(zarr_dir / "composites.zarr"),
+    )
+
+    # Loading rasters for each index selects its own statistics
+    for water_index, suffix in [("mndwi", ""), ("ndwi", "_ndwi")]:
+        yearly_ds, gapfill_ds = load_rasters(
+            str(tmp_path / "raster"), "v1", 1, water_index, 2000, 2002
+        )
+        for layer_ds, layer_type in [(yearly_ds, ""), (gapfill_ds, "_gapfill")]:
+            for var, fname in [
+                (water_index, water_index),
+                ("stdev", f"stdev{suffix}"),
+                ("count", f"count{suffix}"),
+            ]:
+                np.testing.assert_array_equal(
+                    layer_ds[var].sel(year=2001),
+                    combined[f"2001_{fname}{layer_type}.tif"],
+                )
+
+        # Reads from a Zarr store select the same statistics
+        zarr_yearly_ds, zarr_gapfill_ds = load_rasters(
+            str(tmp_path / "zarr"), "v1", 1, water_index, 2000, 2002
+        )
+        assert set(zarr_yearly_ds.data_vars) == {water_index, "stdev", "count"}
+        for var in [water_index, "stdev", "count"]:
+            np.testing.assert_array_equal(
+                zarr_yearly_ds[var].sel(year=2001), yearly_ds[var].sel(year=2001)
+            )
+            np.testing.assert_array_equal(
+                zarr_gapfill_ds[var].sel(year=2001), gapfill_ds[var].sel(year=2001)
+            )
+
+
+def test_generate_vectors_cli_run_status(tmp_path, monkeypatch):
+    # Study areas are only skipped if outputs exist for the same water
+    # index, threshold and tide datum; otherwise processing is attempted
+    # (failing here at loading the config)
+    monkeypatch.chdir(tmp_path)
+    output_dir = tmp_path / "data" / "interim" / "vector" / "v1" / "1_v1"
+    output_dir.mkdir(parents=True)
+    (output_dir / "run_completed_mndwi_0.00").touch()
+
+    def _load_config(config_path):
+        raise RuntimeError("Attempted processing")
+
+    monkeypatch.setattr("coastlines.vector.load_config", _load_config)
+
+    runner = CliRunner()
+    for args, exit_code in [
+        ([], 0),
+        (["--water_index", "ndwi"], 1),
+        (["--index_threshold", "0.1"], 1),
+        (["--tide_centre", "1.5"], 1),
+    ]:
+        result = runner.invoke(
+            generate_vectors_cli,
+            [
+                "--config_path",
+                "config.yaml",
+                "--study_area",
+                "1",
+                "--raster_version",
+                "v1",
+                "--no-overwrite",
+                *args,
+            ],
+        )
+        assert result.exit_code == exit_code